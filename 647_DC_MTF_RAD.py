@@ -8,9 +8,11 @@ Created on Mon Jan 27 15:43:00 2025
 from PyQt5.QtWidgets import QApplication
 from UI_Classes.MainWindow import Ui
 
+import multiprocessing
 import sys
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = Ui()
     app.exec_()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 29 14:20:00 2026
+
+@author: mgoddard
+"""
+
+from CLI.Command_Line import main
+
+import multiprocessing
+import sys
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
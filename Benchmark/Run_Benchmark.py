@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 27 11:05:00 2026
+
+@author: mgoddard
+
+Benchmark of the MTF pipeline on synthetic slanted edges with a known MTF.
+
+Run from the application root directory:
+
+    python -m Benchmark.Run_Benchmark                   # run, and compare against Benchmark/baseline.json
+    python -m Benchmark.Run_Benchmark --save-baseline   # run, and store the results as the new baseline
+    python -m Benchmark.Run_Benchmark --quick           # fewer AOI sizes, stack depths and repeats
+
+Timings depend on the machine, so the baseline should be re-saved when the benchmark machine changes. Every run also
+analyses each edge with the original code paths (see REFERENCE), and reports a regression if the optimised pipeline is
+less accurate than them, whatever the baseline.
+"""
+
+from dataclasses import replace
+
+import numpy as np
+import argparse
+import platform
+import tempfile
+import json
+import time
+import sys
+import os
+import cv2
+
+import MTF.MTF_Engine as MTF_Engine
+import MTF.MTF_Batch as MTF_Batch
+from Benchmark.Synthetic_Edge import SyntheticEdge
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Edge images covering the angle, MTF model, orientation, noise, bad pixel and bit depth cases
+EDGES = {'gaussian_h_16bit': SyntheticEdge(angle=5.0, model='gaussian', sigma=0.6, noise=0.002),
+         'diffraction_h_16bit': SyntheticEdge(angle=8.0, model='diffraction', noise=0.002),
+         'gaussian_v_14bit_noisy': SyntheticEdge(angle=4.0, orientation='vertical', sigma=0.9, noise=0.005, badPixels=0.0005, bitDepth=14)}
+
+AOI_SIZES = (61, 81, 121)
+STACK_DEPTHS = (10, 50)
+
+# Original, unoptimised code paths, which the reference cases run so that the optimised pipeline is checked against them
+REFERENCE = {'badPixelRasterOrder': True, 'edgeMethod': 'curve_fit'}
+
+
+def bestTime(function, repeats):
+    '''
+    Function to call 'function()' 'repeats' times, and return the best time in seconds and the last result.
+    '''
+
+    best = np.inf
+    for i in range(max(int(repeats), 1)):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def mtfError(result, edge):
+    '''
+    Function to return the largest absolute error of an MTFResult from the analytic system MTF, up to the Nyquist frequency.
+    '''
+
+    nyquist = (1000 / edge.pixelSize) / 2
+    keep = result.frequency <= nyquist
+    return float(np.max(np.abs(result.mtf[keep] - edge.systemMtf(result.frequency[keep]))))
+
+
+def stageCases(params, aoiSizes, repeats):
+    '''
+    Function to time each stage of the single image analysis, and the full analysis, for every edge and AOI size.
+    '''
+
+    cases = {}
+    for name, edge in EDGES.items():
+        frame = MTF_Engine.convertTo16Bits(edge.frame(seed=0))
+        # Warm up, so the first case is not charged for first-call overheads
+        MTF_Engine.MTFEngine(params).analyse(frame, edge.centre)
+        for aoiSize in aoiSizes:
+            p = replace(params, aoiSize=aoiSize)
+            aoiCentre, aoi, edgeLine, angle = MTF_Engine.locateEdge(frame, edge.centre, p)
+            raw = MTF_Engine.extractAoi(frame, aoiCentre, aoiSize)
+
+            clean_time, cleaned = bestTime(lambda: MTF_Engine.cleanEdge(raw, p.badPixelFactor, p.badPixelRasterOrder, p.badPixelSignedDifference), repeats)
+            line_time, line = bestTime(lambda: MTF_Engine.detectLine(cleaned, p.edgeMethod, p.edgeOrientation), repeats)
+            samples_time, samples = bestTime(lambda: MTF_Engine.esfSamples(aoi, edgeLine, p), repeats)
+            fit_time, fit = bestTime(lambda: MTF_Engine.fitEsf(samples[0], samples[1], p), repeats)
+            mtf_time, result = bestTime(lambda: MTF_Engine.MTFEngine(p).analyseEsf(fit[0], fit[1], fit[2]), repeats)
+            analyse_time, result = bestTime(lambda: MTF_Engine.MTFEngine(p).analyse(frame, edge.centre), repeats)
+
+            cases['stage/{}/aoi{}'.format(name, aoiSize)] = {'cleanEdge_ms': 1000 * clean_time,
+                                                             'detectLine_ms': 1000 * line_time,
+                                                             'esfSamples_ms': 1000 * samples_time,
+                                                             'fitEsf_ms': 1000 * fit_time,
+                                                             'lsfMtf_ms': 1000 * mtf_time,
+                                                             'analyse_ms': 1000 * analyse_time,
+                                                             'images_per_s': 1 / analyse_time,
+                                                             'mtf_error': mtfError(result, edge),
+                                                             'angle_error': abs(abs(angle) - abs(90 - edge.angle if edge.orientation == 'vertical' else edge.angle))}
+    return cases
+
+
+def referenceCases(params, aoiSizes):
+    '''
+    Function to time the full analysis with the original code paths (REFERENCE) for every edge and AOI size, and record
+    its accuracy and how far the MTF of the optimised pipeline ('params') is from it.
+    '''
+
+    cases = {}
+    reference = replace(params, **REFERENCE)
+    for name, edge in EDGES.items():
+        frame = MTF_Engine.convertTo16Bits(edge.frame(seed=0))
+        for aoiSize in aoiSizes:
+            analyse_time, result = bestTime(lambda: MTF_Engine.MTFEngine(replace(reference, aoiSize=aoiSize)).analyse(frame, edge.centre), 1)
+            optimised = MTF_Engine.MTFEngine(replace(params, aoiSize=aoiSize)).analyse(frame, edge.centre)
+            frequency = optimised.frequency[optimised.frequency <= (1000 / edge.pixelSize) / 2]
+
+            cases['reference/{}/aoi{}'.format(name, aoiSize)] = {'analyse_ms': 1000 * analyse_time,
+                                                                 'mtf_error': mtfError(result, edge),
+                                                                 'optimised_mtf_diff': float(np.max(np.abs(np.interp(frequency, optimised.frequency, optimised.mtf) -
+                                                                                                           np.interp(frequency, result.frequency, result.mtf))))}
+    return cases
+
+
+def batchCases(params, depths, workers):
+    '''
+    Function to time full bulk (one analysis per image) and stack (one analysis of all ESF samples) runs from image files,
+    for each stack depth, on the first edge with a different noise pattern per image.
+    '''
+
+    cases = {}
+    name, edge = next(iter(EDGES.items()))
+    with tempfile.TemporaryDirectory() as directory:
+        fnames = []
+        for i in range(max(depths)):
+            fnames.append(os.path.join(directory, 'edge_{:03d}.tif'.format(i)))
+            cv2.imwrite(fnames[-1], edge.frame(seed=i))
+
+        for depth in depths:
+            bulk_time, results = bestTime(lambda: MTF_Batch.analyseFiles(fnames[:depth], edge.centre, params, workers), 1)
+            errors = [mtfError(result, edge) for result in results if isinstance(result, MTF_Engine.MTFResult)]
+
+            def stack():
+                esfStack = MTF_Engine.EsfStack(params, depth)
+                MTF_Batch.runJobs(MTF_Batch.esfSamplesJob, [(params, fname, edge.centre) for fname in fnames[:depth]], workers,
+                                  onResult = lambda index, result: esfStack.add(result[1], result[2]))
+                return esfStack.result()
+
+            stack_time, result = bestTime(stack, 1)
+
+            cases['bulk/{}/depth{}'.format(name, depth)] = {'run_ms': 1000 * bulk_time,
+                                                            'images_per_s': depth / bulk_time,
+                                                            'mtf_error': float(np.mean(errors)) if errors else np.inf}
+            cases['stack/{}/depth{}'.format(name, depth)] = {'run_ms': 1000 * stack_time,
+                                                             'images_per_s': depth / stack_time,
+                                                             'mtf_error': mtfError(result, edge)}
+    return cases
+
+
+def markerJob(delay, fname, aoiCentre):
+    '''
+    Batch job which waits 'delay' seconds and then creates the file 'fname', so that the jobs which ran can be counted.
+    '''
+
+    time.sleep(delay)
+    open(fname, 'w').close()
+    return fname
+
+
+def cancelRegressions(workers, jobTime=0.2):
+    '''
+    Function to cancel a parallel run as soon as its first job has finished, and check that the queued jobs were cancelled:
+    only the jobs already running or handed to the worker processes may still complete.
+
+    Returns
+    ----------
+    List of (case, metric, allowed value, new value) regressions.
+    '''
+
+    workers = max(MTF_Batch.defaultWorkers(workers), 2)
+    count = 10 * workers
+    with tempfile.TemporaryDirectory() as directory:
+        jobs = [(jobTime, os.path.join(directory, 'job_{:03d}'.format(i)), None) for i in range(count)]
+        done = []
+        MTF_Batch.runJobs(markerJob, jobs, workers, progress = lambda finished, total: done.append(finished),
+                          cancelled = lambda: done[-1] > 0)
+        # Wait as long as the whole run would have taken, so that jobs left running in the background are counted
+        time.sleep(count * jobTime / workers + 1)
+        completed = len(os.listdir(directory))
+
+    print('\nCancelled run: {} of {} jobs completed with {} workers'.format(completed, count, workers))
+    allowed = 4 * workers
+    return [('cancel/jobs{}'.format(count), 'completed_jobs', allowed, completed)] if completed > allowed else []
+
+
+def compareBaseline(cases, baseline, tolerance=0.25, errorTolerance=0.01):
+    '''
+    Function to compare benchmark results with a baseline.
+
+    A time ('_ms') is a regression if it is more than 'tolerance' (fractionally) slower, a throughput ('images_per_s') if
+    it is more than 'tolerance' lower, and an error ('_error') if it is more than 'errorTolerance' (absolute) larger.
+
+    Returns
+    ----------
+    List of (case, metric, baseline value, new value) regressions.
+    '''
+
+    regressions = []
+    for case, metrics in cases.items():
+        for metric, value in metrics.items():
+            old = baseline.get(case, {}).get(metric)
+            if old is None:
+                continue
+            if metric.endswith('_ms'):
+                worse = value > old * (1 + tolerance)
+            elif metric == 'images_per_s':
+                worse = value < old / (1 + tolerance)
+            else:
+                worse = value > old + errorTolerance
+            if worse:
+                regressions.append((case, metric, old, value))
+    return regressions
+
+
+def referenceRegressions(cases, errorTolerance=0.01):
+    '''
+    Function to check the optimised pipeline against the original code paths of the same run: a stage case is a regression
+    if its MTF error is more than 'errorTolerance' (absolute) larger than that of its reference case.
+
+    Returns
+    ----------
+    List of (case, metric, reference value, new value) regressions.
+    '''
+
+    regressions = []
+    for case, metrics in cases.items():
+        if not case.startswith('stage/'):
+            continue
+        reference = cases.get('reference/' + case[len('stage/'):], {}).get('mtf_error')
+        if reference is not None and metrics['mtf_error'] > reference + errorTolerance:
+            regressions.append((case, 'mtf_error (vs reference)', reference, metrics['mtf_error']))
+    return regressions
+
+
+def printTable(cases, baseline):
+    '''
+    Function to print the results, with the change from the baseline where there is one.
+    '''
+
+    for case, metrics in cases.items():
+        print(case)
+        for metric, value in metrics.items():
+            old = baseline.get(case, {}).get(metric)
+            change = '' if old in (None, 0) else '  ({:+.1f}%)'.format(100 * (value - old) / old)
+            print('    {:<16}{:>12.4f}{}'.format(metric, value, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Synthetic slanted-edge benchmark of the MTF pipeline.')
+    parser.add_argument('--quick', action = 'store_true', help = 'fewer AOI sizes, stack depths and repeats')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store the results as the new baseline')
+    parser.add_argument('--baseline', default = BASELINE, help = 'baseline file (default: Benchmark/baseline.json)')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'allowed fractional slow-down (default: 0.25)')
+    parser.add_argument('--error-tolerance', type = float, default = 0.01, help = 'allowed MTF error increase (default: 0.01)')
+    parser.add_argument('--workers', type = int, default = 0, help = 'worker processes for the bulk and stack runs, 0 for one per core')
+    args = parser.parse_args(argv)
+
+    params = MTF_Engine.AnalysisParameters()
+    aoiSizes = AOI_SIZES[1:2] if args.quick else AOI_SIZES
+    depths = STACK_DEPTHS[:1] if args.quick else STACK_DEPTHS
+    repeats = 3 if args.quick else 10
+
+    cases = stageCases(params, aoiSizes, repeats)
+    cases.update(referenceCases(params, aoiSizes))
+    cases.update(batchCases(params, depths, args.workers))
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('cases', {})
+
+    printTable(cases, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+                       'cases': cases}, f, indent = 2, sort_keys = True)
+        print('\nBaseline saved to ' + args.baseline)
+        return 0
+
+    regressions = compareBaseline(cases, baseline, args.tolerance, args.error_tolerance)
+    regressions += referenceRegressions(cases, args.error_tolerance)
+    regressions += cancelRegressions(args.workers)
+    if regressions:
+        print('\nRegressions against the baseline:')
+        for case, metric, old, value in regressions:
+            print('    {} {}: {:.4f} -> {:.4f}'.format(case, metric, old, value))
+        return 1
+    print('\nNo regressions against the baseline.' if baseline else '\nNo baseline to compare against, use --save-baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.platform.startswith('win'):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 27 09:30:00 2026
+
+@author: mgoddard
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import math
+
+import MTF.MTF_Engine as MTF_Engine
+
+MTF_MODELS = ('gaussian', 'diffraction')
+BIT_DEPTHS = (14, 16)
+
+
+@dataclass(frozen=True)
+class SyntheticEdge:
+    '''
+    Description of a synthetic slanted-edge image with a known MTF, for benchmarking the MTF pipeline against ground truth.
+
+    The optics MTF is either a Gaussian blur of 'sigma' pixels, or the diffraction MTF of a circular aperture at 'wavelength'
+    [um] and 'fNumber'. The edge image is the optics ESF integrated over the square pixel aperture, so the system MTF the
+    analysis should recover is the optics MTF times the pixel sinc (see systemMtf).
+
+    Parameters
+    ----------
+    angle: float = 5.0
+        Angle of the edge in degrees, from the x axis for a 'horizontal' edge or from the y axis for a 'vertical' edge.
+    orientation: String = 'horizontal'
+        'horizontal' or 'vertical' edge.
+    model: String = 'gaussian'
+        Optics MTF model, one of MTF_MODELS.
+    sigma: float = 0.6
+        Gaussian blur in pixels.
+    wavelength, fNumber: float = 10.0, 1.2
+        Wavelength [um] and F-number of the diffraction model.
+    pixelSize: float = 8.0
+        Pixel pitch in um.
+    low, high: float = 0.55, 0.85
+        Levels either side of the edge, as fractions of the full scale.
+    noise: float = 0.0
+        Standard deviation of the additive Gaussian noise, as a fraction of the full scale.
+    badPixels: float = 0.0
+        Fraction of pixels set to zero or full scale.
+    bitDepth: int = 16
+        Bit depth of the image, one of BIT_DEPTHS (14-bit images are stored in 16-bit words).
+    centre: Tuple = (640, 512)
+        (x, y) point the edge passes through.
+    '''
+
+    angle: float = 5.0
+    orientation: str = 'horizontal'
+    model: str = 'gaussian'
+    sigma: float = 0.6
+    wavelength: float = 10.0
+    fNumber: float = 1.2
+    pixelSize: float = 8.0
+    low: float = 0.55
+    high: float = 0.85
+    noise: float = 0.0
+    badPixels: float = 0.0
+    bitDepth: int = 16
+    centre: tuple = (640, 512)
+
+    def opticsMtf(self, frequency):
+        '''
+        Function to return the optics MTF at spatial frequencies given in cycles per pixel.
+        '''
+
+        frequency = np.abs(np.asarray(frequency, dtype=np.float64))
+        if self.model == 'gaussian':
+            return np.exp(-2 * (math.pi * self.sigma * frequency) ** 2)
+        if self.model == 'diffraction':
+            cutoff = self.pixelSize / (self.wavelength * self.fNumber)
+            nu = np.minimum(frequency / cutoff, 1)
+            return (2 / math.pi) * (np.arccos(nu) - nu * np.sqrt(1 - nu * nu))
+        raise ValueError('Unknown MTF model: ' + str(self.model))
+
+    def systemMtf(self, frequency):
+        '''
+        Function to return the analytic system MTF (optics and pixel aperture) at spatial frequencies given in lp/mm, which
+        is what MTFResult.mtf should recover.
+        '''
+
+        frequency = np.asarray(frequency, dtype=np.float64) * (self.pixelSize / 1000)
+        return self.opticsMtf(frequency) * np.abs(np.sinc(frequency))
+
+    def _normal(self):
+        theta = math.radians(self.angle)
+        if self.orientation == 'vertical':
+            return math.cos(theta), -math.sin(theta)
+        return -math.sin(theta), math.cos(theta)
+
+    def edgeProfile(self, extent=64, oversampling=64, subpixels=16):
+        '''
+        Function to return the pixel-integrated ESF as a fine look-up table, against the signed distance from the edge in pixels.
+
+        The optics LSF is the inverse Fourier transform of the optics MTF, and its running sum is averaged over a grid of
+        'subpixels' x 'subpixels' points across the pixel aperture.
+        '''
+
+        n = 2 * extent * oversampling
+        frequency = np.fft.rfftfreq(n, d=1 / oversampling)
+        lsf = np.fft.fftshift(np.fft.irfft(self.opticsMtf(frequency), n))
+        position = (np.arange(n) - n // 2) / oversampling
+        esf = np.cumsum(lsf)
+        esf = (esf - esf[0]) / (esf[-1] - esf[0])
+
+        nx, ny = self._normal()
+        offsets = (np.arange(subpixels) + 0.5) / subpixels - 0.5
+        shifts = (nx * offsets[:, np.newaxis] + ny * offsets[np.newaxis, :]).ravel()
+        profile = np.mean([np.interp(position + shift, position, esf) for shift in shifts], axis=0)
+        return position, profile
+
+    def frame(self, shape=(MTF_Engine.SENSOR_HEIGHT, MTF_Engine.SENSOR_WIDTH), seed=None):
+        '''
+        Function to render the edge as a full frame, with noise, bad pixels and quantisation to the bit depth.
+
+        Returns
+        ----------
+        Numpy Array (uint16) of the image, as it would be read from file.
+        '''
+
+        if self.bitDepth not in BIT_DEPTHS:
+            raise ValueError('Unsupported bit depth: ' + str(self.bitDepth))
+        rng = np.random.default_rng(seed)
+        full_scale = 2 ** self.bitDepth - 1
+
+        nx, ny = self._normal()
+        y, x = np.mgrid[0:shape[0], 0:shape[1]]
+        distance = (x - self.centre[0]) * nx + (y - self.centre[1]) * ny
+
+        position, profile = self.edgeProfile()
+        image = full_scale * (self.low + (self.high - self.low) * np.interp(distance, position, profile))
+
+        if self.noise > 0:
+            image += rng.normal(0, self.noise * full_scale, shape)
+        if self.badPixels > 0:
+            bad = rng.random(shape) < self.badPixels
+            image[bad] = np.where(rng.random(np.count_nonzero(bad)) < 0.5, 0, full_scale)
+
+        return np.clip(np.round(image), 0, full_scale).astype(np.uint16)
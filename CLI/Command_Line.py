@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 29 14:20:00 2026
+
+@author: mgoddard
+
+Headless batch runner for the bulk and stacked MTF, through-focus and radiometry processing, for servers and schedulers
+without a display. It never imports PyQt5, and writes the same CSV and PNG outputs as the main window.
+
+Run from the application root directory:
+
+    python 647_DC_MTF_RAD_CLI.py bulk <directory>         # averaged_<folder>.png per field folder
+    python 647_DC_MTF_RAD_CLI.py stack <directory>        # stacked_datasheet<folder>.png per field folder (--pdf for one PDF)
+    python 647_DC_MTF_RAD_CLI.py tf-csv <directory>       # datalog_<timestamp>.csv of a through-focus sweep
+    python 647_DC_MTF_RAD_CLI.py tf-fit <datalog.csv>     # parabolic fits and best focus of a sweep CSV
+    python 647_DC_MTF_RAD_CLI.py radiometry <directory>   # data_<timestamp>.csv and histograms
+    python 647_DC_MTF_RAD_CLI.py --clear-cache            # delete the cached MTF results
+
+Parameters are read from 'settings.ini' (or --settings), and any setting can be overridden with
+--set <section>.<option>=<value>, e.g. --set analysis.esf_method=iso12233.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+from dataclasses import replace
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+import argparse
+import sys
+import os
+
+from Tools.Settings import Settings
+import MTF.Report as Report
+import MTF.MTF_Engine as MTF_Engine
+import MTF.MTF_Batch as MTF_Batch
+import MTF.MTF_Bootstrap as MTF_Bootstrap
+import MTF.MTF_Cache as MTF_Cache
+import ThroughFocus.Focus_Sweep as Focus_Sweep
+import Radiometry.Radiometry_Analysis as Radiometry_Analysis
+from MISC.Stage_Timer import TIMER, TIMING_MODES
+
+
+def log(text):
+    '''
+    Function to print a progress or warning message to stderr, leaving stdout for the results.
+    '''
+
+    print(text, file = sys.stderr, flush = True)
+
+
+def progressPrinter(label, steps=10):
+    '''
+    Function to return a progress(done, total) function (see MTF_Batch.runJobs) which logs every 1/'steps' of the run.
+    '''
+
+    last = [-1]
+
+    def progress(done, total):
+        step = done * steps // max(total, 1)
+        if step != last[0]:
+            last[0] = step
+            log('{}: {} of {}'.format(label, done, total))
+    return progress
+
+
+def loadSettings(args):
+    '''
+    Function to read the settings file, and apply the --set overrides.
+    '''
+
+    if not os.path.isfile(args.settings):
+        raise SystemExit('Settings file not found: ' + args.settings)
+    settings = Settings(args.settings)
+    for override in args.set:
+        option, sep, value = override.partition('=')
+        section, dot, option = option.partition('.')
+        if not sep or not dot:
+            raise SystemExit('Invalid --set ' + override + ', expected <section>.<option>=<value>')
+        settings.add_section_safely(section)
+        settings.set(section, option, value)
+    return settings
+
+
+def analysisParameters(settings):
+    '''
+    Function to build the MTF analysis parameters from the settings, exiting with an error on an invalid setting (such as
+    an unknown ESF method, edge method or edge orientation) rather than running with a different one.
+    '''
+
+    try:
+        return MTF_Engine.AnalysisParameters.fromSettings(settings)
+    except ValueError as e:
+        raise SystemExit('Invalid settings: ' + str(e))
+
+
+def resultCache(args, settings):
+    '''
+    Function to open the result cache of the 'cache' settings, or return None if it is disabled.
+    '''
+
+    if args.no_cache or not settings.getboolean('cache', 'enabled', fallback = True):
+        return None
+    return MTF_Cache.ResultCache(settings.get('cache', 'directory', fallback = '_cache'),
+                                 settings.getint('cache', 'max_size_mb', fallback = 512) * 1024 * 1024,
+                                 settings.getboolean('cache', 'hash_content', fallback = False))
+
+
+def clearCache(settings):
+    '''
+    Function to delete every entry of the MTF result cache of the 'cache' settings, whether or not the cache is enabled.
+    '''
+
+    directory = settings.get('cache', 'directory', fallback = '_cache')
+    removed = MTF_Cache.ResultCache(directory).invalidate() if os.path.isdir(directory) else 0
+    log('{} cached results deleted from {}'.format(removed, directory))
+
+
+def batchWorkers(args, settings):
+    '''
+    Function to return the number of worker processes of an MTF run, where 0 means one per CPU core.
+    '''
+
+    if args.workers is not None:
+        return args.workers
+    return settings.getint('analysis', 'batch_workers', fallback = 0)
+
+
+def writeTiming(directory, name=None):
+    '''
+    Function to write the stage timing summary of a run next to its outputs, if stage timing is enabled.
+    '''
+
+    if TIMER.enabled:
+        fname = TIMER.writeSummary(directory, name)
+        if fname is not None:
+            log(TIMER.formatSummary())
+            log('Stage timings written to ' + fname)
+
+
+def fieldJobs(directory, params):
+    '''
+    Function to list the field position folders of a bulk or stack directory, and one (params, fname, aoiCentre) job per image.
+    '''
+
+    folders, invalid = MTF_Batch.fieldFolders(directory)
+    for folderName in invalid:
+        log('Warning: skipped invalid folder ' + folderName)
+    jobs = [(MTF_Engine.fieldParams(params, folderName), os.path.join(directory, folderName, tif_file), aoiCentre) for folderName, aoiCentre, tif_files in folders for tif_file in tif_files]
+    return folders, jobs
+
+
+def runBulk(args, settings):
+    params = analysisParameters(settings)
+    replicas = settings.getint('analysis', 'bootstrap_replicas', fallback = 500)
+    confidence = settings.getfloat('analysis', 'bootstrap_confidence', fallback = 95.0)
+    folders, jobs = fieldJobs(args.directory, params)
+
+    with TIMER.stage('batch'):
+        results = MTF_Batch.runJobs(MTF_Batch.analyseFileJob, jobs, batchWorkers(args, settings),
+                                    progress = progressPrinter('Processing files'), cache = resultCache(args, settings))
+
+    status = 0
+    start = 0
+    for folderName, aoiCentre, tif_files in folders:
+        folder_results = list(zip(tif_files, results[start:start + len(tif_files)]))
+        start += len(tif_files)
+        list_of_results = [result for tif_file, result in folder_results if isinstance(result, MTF_Engine.MTFResult)]
+        failed_files = [tif_file for tif_file, result in folder_results if not isinstance(result, MTF_Engine.MTFResult)]
+        if failed_files != []:
+            log('Warning: failed to analyse, and skipped: ' + ', '.join(failed_files))
+        if list_of_results == []:
+            log('Error: no image of ' + folderName + ' could be analysed')
+            status = 1
+            continue
+
+        frequency, mean_mtf, max_mtf = MTF_Batch.averageMtf(list_of_results)
+        bands = None
+        if replicas > 0 and len(list_of_results) > 1:
+            with TIMER.stage('bootstrap'):
+                bands = MTF_Bootstrap.bootstrapMean([result.mtf for result in list_of_results], frequency, replicas, confidence)
+        with TIMER.stage('averagePlot'):
+            Report.writeAveragePlot(args.directory, folderName, frequency, mean_mtf, max_mtf, bands)
+        print('{}\t{} images\tmean half-Nyquist MTF {:.3f}'.format(folderName, len(list_of_results), np.interp(32.5, frequency, mean_mtf)))
+
+    writeTiming(args.directory)
+    return status
+
+
+def runStack(args, settings):
+    params = analysisParameters(settings)
+    fold = args.fold or settings.getboolean('analysis', 'stack_fold_bins', fallback = False)
+    replicas = settings.getint('analysis', 'bootstrap_replicas', fallback = 500)
+    confidence = settings.getfloat('analysis', 'bootstrap_confidence', fallback = 95.0)
+    field_folders, jobs = fieldJobs(args.directory, params)
+
+    folders = [{'name': folderName, 'files': tif_files, 'stack': MTF_Engine.EsfStack(params, len(tif_files), fold = fold),
+                'bootstrap': MTF_Bootstrap.EsfBootstrap(params) if replicas > 0 else None, 'failed': [], 'aoi': None}
+               for folderName, aoiCentre, tif_files in field_folders]
+    owners = [(folder, tif_file) for folder in folders for tif_file in folder['files']]
+
+    def addToStack(index, result):
+        folder, tif_file = owners[index]
+        if isinstance(result, Exception):
+            folder['failed'].append(tif_file)
+        else:
+            folder['aoi'], positions, data = result
+            folder['stack'].add(positions, data)
+            if folder['bootstrap'] is not None:
+                folder['bootstrap'].add(positions, data)
+
+    with TIMER.stage('batch'):
+        MTF_Batch.runJobs(MTF_Batch.esfSamplesJob, jobs, batchWorkers(args, settings),
+                          progress = progressPrinter('Processing files'), onResult = addToStack, cache = resultCache(args, settings))
+
+    status = 0
+    pdf = args.pdf or settings.getboolean('analysis', 'stack_report_pdf', fallback = False)
+    reports = []
+    for folder in folders:
+        if folder['failed'] != []:
+            log('Warning: failed to analyse, and skipped: ' + ', '.join(folder['failed']))
+        if folder['stack'].frames == 0:
+            log('Error: no image of ' + folder['name'] + ' could be analysed')
+            status = 1
+            continue
+
+        try:
+            result = folder['stack'].result()
+            bands = None
+            if folder['bootstrap'] is not None and folder['bootstrap'].frames > 1:
+                with TIMER.stage('bootstrap'):
+                    bands = folder['bootstrap'].bands(replicas, confidence, reference = (result.frequency, result.mtf))
+            reports.append((args.directory, folder['name'], result, folder['aoi'], params, folder['stack'].frames, bands, pdf))
+        except Exception as e:
+            log('Error: ' + folder['name'] + ' was not processed correctly: ' + repr(e))
+            status = 1
+            continue
+        print('{}\t{} images\tstacked half-Nyquist MTF {:.3f}'.format(folder['name'], folder['stack'].frames, np.interp(32.5, result.frequency, result.mtf)))
+
+    results = MTF_Batch.runJobs(Report.writeReportJob, reports, batchWorkers(args, settings), progress = progressPrinter('Generating reports'))
+    for report, result in zip(reports, results):
+        if isinstance(result, Exception):
+            log('Error: failed to generate the report of ' + report[1] + ': ' + repr(result))
+            status = 1
+
+    if pdf and reports != []:
+        fname = args.directory + "/stacked_datasheets.pdf"
+        Report.writeReportPdf(fname, [result for result in results if not isinstance(result, Exception)])
+        print(fname)
+
+    writeTiming(args.directory)
+    return status
+
+
+def runFocusCsv(args, settings):
+    params = analysisParameters(settings)
+    with TIMER.stage('batch'):
+        fname, rows = Focus_Sweep.generateSweepCsv(args.directory, params, batchWorkers(args, settings),
+                                                   progress = progressPrinter('Processing files'), cache = resultCache(args, settings))
+
+    writeTiming(args.directory, os.path.splitext(os.path.basename(fname))[0] + '_timing')
+
+    missing = [' '.join(row[:3]) for row in rows if row[3] == '']
+    if missing != []:
+        log('Warning: no result for: ' + ', '.join(missing))
+    print(fname)
+    return 0
+
+
+def runFocusFit(args, settings):
+    fits = Focus_Sweep.fitSweep(pd.read_csv(args.csv))
+    Focus_Sweep.writeFitResults(args.csv, fits, Focus_Sweep.focusSummaries(fits))
+    for (field, orientation), (points, coeffs) in fits.items():
+        print('{}\t{}\tbest focus {:.1f}'.format(field, orientation, Focus_Sweep.bestFocus(coeffs)))
+    return 0
+
+
+def radiometryWorkers(workers, imagesToProcess):
+    '''
+    Function to return the number of radiometry worker processes. Each holds a whole folder's image stack (about 10 MB per
+    image, plus as much again for the statistics), so unless 'workers' is given one worker is used per core that the free
+    memory can feed.
+    '''
+
+    if workers is not None:
+        return workers
+    try:
+        available = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 1
+    perWorker = 2 * imagesToProcess * Radiometry_Analysis.IMAGE_HEIGHT * Radiometry_Analysis.IMAGE_WIDTH * 8
+    return int(max(1, min(MTF_Batch.defaultWorkers(0), available // perWorker)))
+
+
+def runRadiometry(args, settings):
+    params = replace(Radiometry_Analysis.RadiometryParameters.fromSettings(settings), displayPlots = False)
+    if args.bad_pixel_map is not None:
+        params = replace(params, badPixelMask = args.bad_pixel_map)
+    if args.images is not None:
+        params = replace(params, imagesToProcess = args.images)
+    if params.ignoreBadPixels and not os.path.isfile(params.badPixelMask):
+        raise SystemExit('Bad pixel map not found: ' + params.badPixelMask)
+
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    folders = Radiometry_Analysis.radiometryFolders(args.directory, params.imagesToProcess)
+    jobs = [(params, args.directory, folderNameK, folderNameMs, files) for folderNameK, folderNameMs, files in folders]
+    results = MTF_Batch.runJobs(Radiometry_Analysis.analyseFolderJob, jobs, radiometryWorkers(args.workers, params.imagesToProcess),
+                                progress = progressPrinter('Processing folders', steps = max(len(jobs), 1)))
+
+    status = 0
+    rows = []
+    for (folderNameK, folderNameMs, files), row in zip(folders, results):
+        if isinstance(row, Exception):
+            log('Error: ' + folderNameK + '/' + folderNameMs + ' was not processed correctly: ' + repr(row))
+            status = 1
+        else:
+            rows.append(row)
+
+    if params.saveCsvFile:
+        print(Radiometry_Analysis.writeResults(args.directory, rows, timestamp))
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Headless batch processing of MTF, through-focus and radiometry datasets.')
+    parser.add_argument('--settings', default = 'settings.ini', help = 'settings file (default: settings.ini)')
+    parser.add_argument('--set', action = 'append', default = [], metavar = 'SECTION.OPTION=VALUE',
+                        help = 'override a setting, may be repeated')
+    parser.add_argument('--workers', type = int, default = None,
+                        help = 'worker processes, 0 for one per core (default: analysis.batch_workers, or for radiometry as many as the free memory allows)')
+    parser.add_argument('--timing', choices = TIMING_MODES, default = None, help = 'stage timing mode (default: analysis.stage_timing)')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'do not read or write the MTF result cache')
+    parser.add_argument('--clear-cache', action = 'store_true',
+                        help = 'delete every entry of the MTF result cache before running the command (or on its own)')
+    commands = parser.add_subparsers(dest = 'command')
+
+    command = commands.add_parser('bulk', help = 'analyse every image of each field folder and plot the averaged MTFs')
+    command.add_argument('directory', help = 'directory of field position folders, all at a single focus position')
+    command.set_defaults(run = runBulk)
+
+    command = commands.add_parser('stack', help = 'stack the ESFs of each field folder and generate the datasheets')
+    command.add_argument('directory', help = 'directory of field position folders, all at a single focus position')
+    command.add_argument('--fold', action = 'store_true', help = 'fold every image into the ESF bins as it is analysed')
+    command.add_argument('--pdf', action = 'store_true', help = 'also save all datasheets as the pages of stacked_datasheets.pdf')
+    command.set_defaults(run = runStack)
+
+    command = commands.add_parser('tf-csv', help = 'analyse a through-focus sweep into a datalog CSV')
+    command.add_argument('directory', help = 'directory of <field>_field_focussing_<orientation>edge folders')
+    command.set_defaults(run = runFocusCsv)
+
+    command = commands.add_parser('tf-fit', help = 'fit the best focus of every field of a through-focus datalog CSV')
+    command.add_argument('csv', help = 'datalog CSV from tf-csv or the main window')
+    command.set_defaults(run = runFocusFit)
+
+    command = commands.add_parser('radiometry', help = 'signal and temporal noise statistics of a radiometry dataset')
+    command.add_argument('directory', help = 'directory of <temperature>K/<integration time>ms folders')
+    command.add_argument('--bad-pixel-map', default = None, help = 'bad pixel map (default: image_processing.bad_pixel_mask_path)')
+    command.add_argument('--images', type = int, default = None, help = 'images to process per folder (default: radiometry.images_to_process)')
+    command.set_defaults(run = runRadiometry)
+
+    args = parser.parse_args(argv)
+    if args.command is None and not args.clear_cache:
+        parser.error('a command is required')
+    settings = loadSettings(args)
+
+    if args.clear_cache:
+        clearCache(settings)
+        if args.command is None:
+            return 0
+
+    if getattr(args, 'directory', None) is not None and not os.path.isdir(args.directory):
+        raise SystemExit('Directory not found: ' + args.directory)
+    if getattr(args, 'csv', None) is not None and not os.path.isfile(args.csv):
+        raise SystemExit('CSV file not found: ' + args.csv)
+
+    TIMER.setMode(args.timing or settings.get('analysis', 'stage_timing', fallback = 'off'))
+    return args.run(args, settings)
@@ -46,6 +46,81 @@ def PolyCoefficients(x, coeffs):
     return y
 
 
+class SavitzkyGolayFilter():
+    '''
+    Savitzky Golay filter with the coefficients cached per (window_size, order, deriv).
+
+    The signal is padded at the extremes in the same way as 'savitzky_golay', and a batch of signals is filtered along
+    an axis with a single convolution, so the result for each signal matches 'savitzky_golay' exactly.
+
+    Parameters
+    ----------
+    window_size: int
+        Length of the filter window, must be a positive odd number.
+    order: int
+        Order of polynomial fit.
+    deriv: int = 0
+        Order of the derivative to compute.
+    rate: Float = 1
+        Sample rate, used to scale the derivative.
+    '''
+
+    _coefficients = {}
+
+    def __init__(self, window_size, order, deriv=0, rate=1):
+        from math import factorial
+
+        try:
+            window_size = np.abs(int(window_size))
+            order = np.abs(int(order))
+        except ValueError:
+            raise ValueError("window_size and order have to be of type int")
+        if window_size % 2 != 1 or window_size < 1:
+            raise TypeError("window_size size must be a positive odd number")
+        if window_size < order + 2:
+            raise TypeError("window_size is too small for the polynomials order")
+
+        self.half_window = (window_size - 1) // 2
+        self.kernel = self.coefficients(window_size, order, deriv) * rate**deriv * factorial(deriv)
+
+    @classmethod
+    def coefficients(cls, window_size, order, deriv=0):
+        '''
+        Function to return the (cached) least-squares coefficients of the filter.
+        '''
+
+        key = (int(window_size), int(order), int(deriv))
+        if key not in cls._coefficients:
+            half_window = (key[0] - 1) // 2
+            b = np.array([[k**i for i in range(key[1] + 1)] for k in range(-half_window, half_window + 1)])
+            cls._coefficients[key] = np.linalg.pinv(b)[key[2]]
+        return cls._coefficients[key]
+
+    def __call__(self, y, axis=-1):
+        '''
+        Function to filter a signal, or a batch of signals along 'axis'.
+
+        Returns
+        ----------
+        Numpy Array of new filtered values, with the same shape as 'y'.
+        '''
+
+        y = np.moveaxis(np.asarray(y), axis, -1)
+        shape = y.shape
+        y = y.reshape(-1, shape[-1])
+        half_window = self.half_window
+
+        # pad the signal at the extremes with
+        # values taken from the signal itself
+        firstvals = y[:, :1] - np.abs(y[:, 1:half_window+1][:, ::-1] - y[:, :1])
+        lastvals = y[:, -1:] + np.abs(y[:, -half_window-1:-1][:, ::-1] - y[:, -1:])
+        padded = np.concatenate((firstvals, y, lastvals), axis=1)
+
+        filtered = np.convolve(self.kernel[::-1], padded.ravel(), mode='valid')
+        index = np.arange(y.shape[0])[:, np.newaxis] * padded.shape[1] + np.arange(shape[-1])
+        return np.moveaxis(filtered[index].reshape(shape), -1, axis)
+
+
 def savitzky_golay(y, window_size, order, deriv=0, rate=1):
     '''
     Custom implementation of the Savitzky Golay filter
@@ -68,28 +143,7 @@ def savitzky_golay(y, window_size, order, deriv=0, rate=1):
     Numpy Array of new filtered values
     '''
 
-    from math import factorial
-    
-    try:
-        window_size = np.abs(int(window_size))
-        order = np.abs(int(order))
-    except ValueError:
-        raise ValueError("window_size and order have to be of type int")
-    if window_size % 2 != 1 or window_size < 1:
-        raise TypeError("window_size size must be a positive odd number")
-    if window_size < order + 2:
-        raise TypeError("window_size is too small for the polynomials order")
-    order_range = range(order+1)
-    half_window = (window_size -1) // 2
-    # precompute coefficients
-    b = np.asmatrix([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
-    m = np.linalg.pinv(b).A[deriv] * rate**deriv * factorial(deriv)
-    # pad the signal at the extremes with
-    # values taken from the signal itself
-    firstvals = y[0] - np.abs( y[1:half_window+1][::-1] - y[0] )
-    lastvals = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
-    y = np.concatenate((firstvals, y, lastvals))
-    return np.convolve( m[::-1], y, mode='valid')
+    return SavitzkyGolayFilter(window_size, order, deriv, rate)(y)
 
 
 def get_line_from_equation(m, b):
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:05:00 2026
+
+@author: mgoddard
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import os
+
+import MTF.MTF_Engine as MTF_Engine
+from MISC.Stage_Timer import TIMER, timedJob
+
+
+def defaultWorkers(workers=0):
+    '''
+    Function to return the number of worker processes to use, where 0 (or less) means one per CPU core.
+    '''
+
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def fieldFolders(directory):
+    '''
+    Function to list the field position folders of a bulk or stack directory, i.e. its sub-folders whose names start with
+    'top', 'bottom', 'centre', 'left' or 'right' (see MTF_Engine.fieldPosition), and the images in each.
+
+    Parameters
+    ----------
+    directory: String
+        Directory holding one folder of images per field position and orientation.
+
+    Returns
+    ----------
+    Tuple of (folders, invalid), where folders is a list of (folderName, aoiCentre, tifFiles) and invalid is the list of
+    the other sub-folder names.
+    '''
+
+    folders = []
+    invalid = []
+    for folderName in os.listdir(directory):
+        if os.path.isdir(os.path.join(directory, folderName)):
+            aoiCentre = MTF_Engine.fieldPosition(folderName)
+
+            if aoiCentre is not None:
+                tif_files = [tif_file for tif_file in os.listdir(os.path.join(directory, folderName)) if tif_file.endswith('.tif')]
+                folders.append((folderName, aoiCentre, tif_files))
+            else:
+                invalid.append(folderName)
+    return folders, invalid
+
+
+def analyseFileJob(params, fname, aoiCentre):
+    '''
+    Job function to load a single image and analyse one AOI of it, in a worker process.
+
+    Parameters
+    ----------
+    params: AnalysisParameters
+        Analysis parameters.
+    fname: String
+        Path of the image to analyse.
+    aoiCentre: Tuple
+        (x, y) initial centre of the AOI in frame coordinates.
+    '''
+
+    return MTF_Engine.MTFEngine(params).analyseFile(fname, aoiCentre)
+
+
+def esfSamplesJob(params, fname, aoiCentre):
+    '''
+    Job function to load a single image, find the edge in one AOI and return its raw ESF samples, in a worker process.
+
+    Returns
+    ----------
+    Tuple of (aoi, positions, data), where aoi is the cleaned AOI image.
+    '''
+
+    frame = MTF_Engine.loadFrame(fname, params)
+    aoiCentre, aoi, edge, angle = MTF_Engine.locateEdge(frame, aoiCentre, params)
+    positions, data = MTF_Engine.esfSamples(aoi, edge, params)
+    return aoi, positions, data
+
+
+def runJobs(function, jobs, workers=0, progress=None, cancelled=None, onResult=None, cache=None, pollInterval=0.1):
+    '''
+    Function to run 'function(*job)' for every job in a pool of worker processes.
+
+    The pool is polled every 'pollInterval' seconds, so that progress can be reported and cancellation checked while
+    the jobs run, e.g. from a QProgressDialog.
+
+    Parameters
+    ----------
+    function: Callable
+        Module level (picklable) function to run for each job.
+    jobs: List
+        List of argument tuples, one per job.
+    workers: int = 0
+        Number of worker processes, 0 means one per CPU core. With 1 worker the jobs run in the calling process.
+    progress: Callable = None
+        Optional function called as progress(completed, total) as jobs finish.
+    cancelled: Callable = None
+        Optional function returning True if the remaining jobs should be abandoned.
+    onResult: Callable = None
+        Optional function called as onResult(index, result) for each job, in the order of 'jobs' whatever order they finish
+        in. Results passed to it are not kept, so a long run can be consumed as it goes (e.g. into an EsfStack).
+    cache: ResultCache = None
+        Optional result cache for jobs of the form function(params, fname, aoiCentre). Cached results are used without
+        running the job, and new results are stored (by this process, not the workers).
+
+    If stage timing is enabled (MISC.Stage_Timer.TIMER) the stages timed in the worker processes are added to this
+    process's timer.
+
+    Returns
+    ----------
+    List with one entry per job in the order of 'jobs', holding either the job's return value or the Exception it raised
+    (None for results passed to 'onResult'). Returns None if the run was cancelled.
+    '''
+
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    finished = [False] * len(jobs)
+    keys = [None] * len(jobs)
+    delivered = 0
+
+    if cache is not None:
+        for i, job in enumerate(jobs):
+            try:
+                keys[i] = cache.jobKey(function, job)
+            except OSError:
+                continue
+            if keys[i] is not None:
+                results[i] = cache.get(keys[i])
+                finished[i] = results[i] is not None
+
+    def deliver():
+        nonlocal delivered
+        while onResult is not None and delivered < len(jobs) and finished[delivered]:
+            onResult(delivered, results[delivered])
+            results[delivered] = None
+            delivered += 1
+
+    def complete(i, result):
+        results[i] = result
+        finished[i] = True
+        if cache is not None and keys[i] is not None and not isinstance(result, Exception):
+            # A failure to write the cache (e.g. a full disk) must not turn a successful result into a failed one
+            try:
+                cache.put(keys[i], result)
+            except OSError:
+                pass
+
+    remaining = [i for i in range(len(jobs)) if not finished[i]]
+    workers = min(defaultWorkers(workers), max(len(remaining), 1))
+    deliver()
+    if progress is not None:
+        progress(len(jobs) - len(remaining), len(jobs))
+
+    if workers == 1:
+        for n, i in enumerate(remaining):
+            if cancelled is not None and cancelled():
+                return None
+            try:
+                complete(i, function(*jobs[i]))
+            except Exception as e:
+                complete(i, e)
+            deliver()
+            if progress is not None:
+                progress(len(jobs) - len(remaining) + n + 1, len(jobs))
+        return results
+
+    # The pool is not used as a context manager: leaving a 'with' block waits for the pool, and undoes cancel_futures
+    # before the queued jobs have been cancelled, so a cancelled run would carry on in the background
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        if TIMER.enabled:
+            futures = {pool.submit(timedJob, TIMER.mode, function, *jobs[i]): i for i in remaining}
+        else:
+            futures = {pool.submit(function, *jobs[i]): i for i in remaining}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=pollInterval, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                    if TIMER.enabled:
+                        result, state = result
+                        TIMER.merge(state)
+                    complete(futures[future], result)
+                except Exception as e:
+                    complete(futures[future], e)
+            deliver()
+            if progress is not None:
+                progress(len(jobs) - len(pending), len(jobs))
+            if cancelled is not None and cancelled():
+                for future in pending:
+                    future.cancel()
+                pool.shutdown(wait=False, cancel_futures=True)
+                return None
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+    pool.shutdown()
+    return results
+
+
+def analyseFiles(fnames, aoiCentre, params, workers=0, progress=None, cancelled=None, cache=None):
+    '''
+    Function to analyse the same AOI in a list of images in parallel (see runJobs).
+
+    Returns
+    ----------
+    List with one MTFResult (or the Exception raised) per image, in the order of 'fnames', or None if cancelled.
+    '''
+
+    jobs = [(params, fname, aoiCentre) for fname in fnames]
+    return runJobs(analyseFileJob, jobs, workers, progress, cancelled, cache = cache)
+
+
+def averageMtf(results):
+    '''
+    Function to calculate the mean and peak-hold MTF curves of a list of MTFResults.
+
+    Returns
+    ----------
+    Tuple of Numpy Arrays (frequency, meanMtf, peakMtf).
+    '''
+
+    mtfs = np.stack([result.mtf for result in results])
+    return results[0].frequency, np.mean(mtfs, axis = 0), np.amax(mtfs, axis = 0)
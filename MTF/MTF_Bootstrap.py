@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 11:20:00 2026
+
+@author: mgoddard
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+import MTF.MTF_Engine as MTF_Engine
+
+NYQUIST_FRACTIONS = (0.25, 0.5, 0.75, 1.0)
+
+
+@dataclass(frozen=True)
+class MtfBands:
+    '''
+    Bootstrap confidence band of an MTF curve.
+
+    'lower' and 'upper' are the (100 - confidence) / 2 and (100 + confidence) / 2 percentiles of the bootstrap replicas at
+    every frequency, from 'replicas' resamples of the images with replacement.
+    '''
+
+    frequency: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    confidence: float
+    replicas: int
+
+    def at(self, frequency):
+        '''
+        Function to return the (lower, upper) band limits interpolated at the given frequencies [lp/mm].
+        '''
+
+        return np.interp(frequency, self.frequency, self.lower), np.interp(frequency, self.frequency, self.upper)
+
+    def atNyquist(self, pixelSize):
+        '''
+        Function to return a list of (fraction, lower, upper) band limits at the NYQUIST_FRACTIONS of the Nyquist frequency.
+        '''
+
+        nyquist = (1000 / pixelSize) / 2
+        lower, upper = self.at(np.array(NYQUIST_FRACTIONS) * nyquist)
+        return list(zip(NYQUIST_FRACTIONS, lower, upper))
+
+
+def bootstrapWeights(frames, replicas, seed=None):
+    '''
+    Function to draw the bootstrap resamples of 'frames' images as a (replicas x frames) array of how many times each image
+    is drawn in each replica, so a replica of any per-image sum is a single matrix product.
+    '''
+
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(frames, np.full(frames, 1 / frames), size=replicas).astype(np.float64)
+
+
+def _bands(frequency, curves, confidence, estimate=None, reference=None):
+    '''
+    Function to return the MtfBands of a (replicas x frequency) array of replica curves, dropping any replica which could
+    not be evaluated. If a 'reference' curve is given the band is moved by (reference - estimate), i.e. it is the spread of
+    the replicas about their own full-data 'estimate' placed about the reference.
+    '''
+
+    curves = curves[np.all(np.isfinite(curves), axis=-1)]
+    lower, upper = np.percentile(curves, [(100 - confidence) / 2, (100 + confidence) / 2], axis=0)
+    if reference is not None:
+        offset = np.interp(frequency, reference[0], reference[1]) - estimate
+        lower, upper = lower + offset, upper + offset
+    return MtfBands(frequency = frequency, lower = lower, upper = upper, confidence = confidence, replicas = len(curves))
+
+
+def bootstrapMean(curves, frequency, replicas=500, confidence=95, seed=None):
+    '''
+    Function to return the bootstrap confidence band of the mean of several per-image MTF curves, e.g. the averaged MTF of
+    BulkAnalyseAndAverage.
+
+    Parameters
+    ----------
+    curves: Numpy Array
+        (images x frequency) array of MTF curves on a common frequency axis.
+    frequency: Numpy Array
+        Frequency axis [lp/mm] of the curves.
+    replicas: int = 500
+        Number of bootstrap replicas.
+    confidence: float = 95
+        Confidence level of the band, in percent.
+    seed: int = None
+        Optional random seed, for reproducible bands.
+    '''
+
+    curves = np.asarray(curves, dtype=np.float64)
+    weights = bootstrapWeights(len(curves), replicas, seed)
+    return _bands(frequency, weights @ curves / len(curves), confidence)
+
+
+class EsfBootstrap():
+    '''
+    Bootstrap of the stacked MTF of several images of the same edge.
+
+    Each image's raw ESF samples are reduced, as they are added, to the per-image ESF grid sums of the folded stack (see
+    MTF_Engine.esfFoldSums, or MTF_Engine.isoBinSums for the 'iso12233' esfMethod). A replica stack of images drawn with
+    replacement is then just a weighted sum of these rows, so all of the replicas are binned with one matrix product, and
+    smoothed, differentiated and Fourier transformed as 2-D arrays, one replica per row.
+
+    As in the folded stack there is no noise removal, and the tail start and truncation correction of the full stack are
+    used for every replica.
+
+    Parameters
+    ----------
+    params: AnalysisParameters
+        Analysis parameters.
+    '''
+
+    def __init__(self, params):
+        self.params = params
+        self.iso = params.esfMethod == 'iso12233'
+        self.ESFrX = None if self.iso else MTF_Engine.esfGrid(params)
+        self.rows = []
+
+    @property
+    def frames(self):
+        return len(self.rows)
+
+    def add(self, positions, data):
+        '''
+        Function to add the raw ESF samples of one image.
+        '''
+
+        positions = np.asarray(positions, dtype=np.float64)
+        data = np.asarray(data)
+        if self.iso:
+            self.rows.append(MTF_Engine.isoBinSums(positions, data, self.params))
+        else:
+            self.rows.append(MTF_Engine.esfFoldSums(positions, data, self.ESFrX, self.params))
+
+    def _mtf(self, weights):
+        params = self.params
+        sums = [weights @ np.stack(column) for column in zip(*self.rows)]
+
+        if self.iso:
+            sums, counts = sums
+            with np.errstate(divide='ignore', invalid='ignore'):
+                esfData = sums / counts
+            lsf = MTF_Engine.isoLsf(esfData)
+            frequency, mtf, detectorMtf, opticalMtf = MTF_Engine.isoMtf(lsf, params)
+            return frequency, mtf
+
+        # The grid, tail start and edge width of the full stack (the first row of weights) are used for every replica
+        full = [column[0] for column in sums]
+        ESFrX, esfData, tailStart, populated = MTF_Engine.foldedEsf(self.ESFrX, full, params)
+        width10_90, width20_80 = MTF_Engine.edgeSpec(ESFrX, esfData)
+
+        ESFrX, esfData, tailStart, populated = MTF_Engine.foldedEsf(self.ESFrX, sums, params, populated, tailStart)
+        lsf = MTF_Engine.lsfCurve(esfData)
+        frequency, mtf, detectorMtf, opticalMtf = MTF_Engine.mtfCurve(lsf, ESFrX, esfData, width10_90, params)
+        return frequency, mtf
+
+    def bands(self, replicas=500, confidence=95, reference=None, seed=None):
+        '''
+        Function to return the bootstrap confidence band of the stacked MTF.
+
+        Parameters
+        ----------
+        replicas: int = 500
+            Number of bootstrap replicas.
+        confidence: float = 95
+            Confidence level of the band, in percent.
+        reference: Tuple = None
+            Optional (frequency, mtf) of the reported stacked MTF, e.g. with noise removal, to place the band about.
+        seed: int = None
+            Optional random seed, for reproducible bands.
+        '''
+
+        if self.frames < 2:
+            raise ValueError('At least 2 images are needed for a bootstrap')
+
+        # The first row is the full stack itself, the estimate the replicas are compared against
+        weights = np.vstack([np.ones((1, self.frames)), bootstrapWeights(self.frames, replicas, seed)])
+        frequency, mtf = self._mtf(weights)
+        return _bands(frequency, mtf[1:], confidence, mtf[0], reference)
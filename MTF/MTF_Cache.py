@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 11:20:00 2026
+
+@author: mgoddard
+"""
+
+from dataclasses import asdict, is_dataclass
+from functools import lru_cache
+
+import hashlib
+import os
+import sys
+import pickle
+
+# Increase when a change to the engine alters its results, so that older cache entries are no longer used
+CACHE_VERSION = 3
+
+# Source files of the code which computes the cached results, relative to the application root directory
+ENGINE_SOURCES = ('MTF/MTF_Engine.py', 'MTF/MTF_Discovery.py', 'MTF/MTF_Batch.py', 'MISC/Misc_Functions.py')
+
+
+@lru_cache(maxsize=None)
+def sourceVersion(*paths):
+    '''
+    Function to return a fingerprint of source files, the SHA-256 hash of their content. Files which cannot be read (as in
+    a frozen build) are left out, and CACHE_VERSION then identifies the code on its own.
+    '''
+
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except (OSError, TypeError):
+            pass
+    return digest.hexdigest()[:16]
+
+
+def engineVersion():
+    '''
+    Function to return a fingerprint of the engine code (see ENGINE_SOURCES), so that any change to the engine invalidates
+    the cache without relying on CACHE_VERSION being increased.
+    '''
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return sourceVersion(*(os.path.join(root, source) for source in ENGINE_SOURCES))
+
+
+def fileIdentity(fname, hashContent=False):
+    '''
+    Function to return a string identifying the current content of a file, either its absolute path, size and modification
+    time, or (if 'hashContent' is set) the SHA-256 hash of its bytes.
+    '''
+
+    if hashContent:
+        digest = hashlib.sha256()
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return 'sha256:' + digest.hexdigest()
+    stat = os.stat(fname)
+    return '{}:{}:{}'.format(os.path.abspath(fname), stat.st_size, stat.st_mtime_ns)
+
+
+class ResultCache():
+    '''
+    Persistent on-disk cache of analysis results, keyed on the image content, the AOI, the full set of analysis parameters
+    and the version of the engine code (see engineVersion).
+
+    Each entry is a pickle file named '<path hash>_<key hash>.pkl', so all entries of one image can be invalidated together.
+    Reading an entry updates its modification time, and the least recently used entries are deleted once the cache grows
+    beyond 'maxBytes'.
+
+    Parameters
+    ----------
+    directory: String
+        Directory holding the cache files, created if it does not exist.
+    maxBytes: int = 512 MB
+        Size limit of the cache.
+    hashContent: bool = False
+        Identify images by a hash of their content, rather than by path, size and modification time.
+    '''
+
+    def __init__(self, directory, maxBytes=512 * 1024 * 1024, hashContent=False):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hashContent = hashContent
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, kind, fname, *args):
+        '''
+        Function to return the cache key of a result of type 'kind' for an image, and any other arguments which determine
+        the result (AOI centre, AnalysisParameters, etc.).
+        '''
+
+        parts = [str(CACHE_VERSION), engineVersion(), kind, fileIdentity(fname, self.hashContent)]
+        for arg in args:
+            if is_dataclass(arg):
+                parts.append(repr(sorted(asdict(arg).items())))
+            else:
+                parts.append(repr(arg))
+        keyHash = hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+        return self._pathHash(fname) + '_' + keyHash[:40]
+
+    def jobKey(self, function, job):
+        '''
+        Function to return the cache key of a batch job of the form function(params, fname, aoiCentre), or None if the job
+        has no image. The key includes a fingerprint of the module defining the job function, so that a change to a job
+        outside the engine (e.g. Focus_Sweep.edgeWidthJob) also invalidates its results.
+        '''
+
+        params, fname, aoiCentre = job
+        if fname is None:
+            return None
+        source = getattr(sys.modules.get(function.__module__), '__file__', None)
+        kind = function.__module__ + '.' + function.__name__ + ':' + sourceVersion(source)
+        return self.key(kind, fname, tuple(aoiCentre), params)
+
+    def _pathHash(self, fname):
+        return hashlib.sha1(os.path.abspath(fname).encode('utf-8')).hexdigest()[:16]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        '''
+        Function to return the cached value for a key, or None if it is not in the cache. An entry which cannot be loaded
+        (truncated, or pickled from classes which have since been renamed or moved) is deleted and treated as missing.
+        '''
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            try:
+                os.remove(path)
+                self._size = None
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        '''
+        Function to store a value in the cache, evicting the least recently used entries if the size limit is exceeded.
+        Raises OSError if the entry cannot be written, in which case no partial file is left behind.
+        '''
+
+        path = self._path(key)
+        temporary = path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open(temporary, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+        # An entry which is overwritten no longer counts towards the size
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(temporary, path)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += os.path.getsize(path) - replaced
+        if self._size > self.maxBytes:
+            self.prune()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        return entries
+
+    def size(self):
+        '''
+        Function to return the total size of the cache files in bytes.
+        '''
+
+        return sum(size for mtime, size, name in self._entries())
+
+    def prune(self):
+        '''
+        Function to delete the least recently used entries until the cache is within its size limit.
+        '''
+
+        entries = sorted(self._entries())
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def invalidate(self, fname=None):
+        '''
+        Function to delete the cached results of one image, or every entry if 'fname' is None.
+
+        Returns
+        ----------
+        Number of entries deleted.
+        '''
+
+        prefix = '' if fname is None else self._pathHash(fname) + '_'
+        removed = 0
+        for mtime, size, name in self._entries():
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+        self._size = None
+        return removed
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 10:15:00 2026
+
+@author: mgoddard
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import math
+import cv2
+
+
+@dataclass(frozen=True)
+class EdgeCandidate:
+    '''
+    Slanted edge found by findEdges, suitable for an MTF analysis AOI.
+
+    The angle follows the detectLine convention, i.e. the angle in degrees of the edge line from the image x axis, so
+    near-vertical edges are close to +/-90. The edge class is 'tangential' if the edge line runs tangentially to a circle
+    about the frame centre, and 'sagittal' if it runs radially. Near the frame centre, where this is undefined, horizontal
+    edges are 'sagittal' and vertical edges 'tangential', as for the centre field through-focus folders.
+    '''
+
+    aoiCentre: tuple
+    angle: float
+    contrast: float
+    sharpness: float
+    coherence: float
+    orientation: str
+    edgeClass: str
+    score: float
+
+
+def _fineAoi(frame, centre, halfWidth):
+    '''
+    Function to crop the AOI about 'centre', moved inside the frame if needed, and return its (clipped) centre, image and
+    x and y gradients (per pixel, without the border where the Sobel kernel runs off the AOI).
+    '''
+
+    rows, cols = frame.shape
+    x = min(max(int(centre[0]), halfWidth), cols - 1 - halfWidth)
+    y = min(max(int(centre[1]), halfWidth), rows - 1 - halfWidth)
+    aoi = frame[y-halfWidth:y+halfWidth+1, x-halfWidth:x+halfWidth+1].astype(np.float32)
+    gx = cv2.Sobel(aoi, cv2.CV_32F, 1, 0, ksize=3)[1:-1, 1:-1] / 8
+    gy = cv2.Sobel(aoi, cv2.CV_32F, 0, 1, ksize=3)[1:-1, 1:-1] / 8
+    return (x, y), aoi, gx, gy
+
+
+def _edgeClass(aoiCentre, angle, shape, aoiSize):
+    '''
+    Function to classify an edge as 'sagittal' or 'tangential' from its position in the frame and its angle.
+    '''
+
+    rx = aoiCentre[0] - (shape[1] - 1) / 2
+    ry = aoiCentre[1] - (shape[0] - 1) / 2
+    radius = math.hypot(rx, ry)
+    vertical = abs(angle) > 45
+
+    if radius < aoiSize:
+        return 'tangential' if vertical else 'sagittal'
+
+    theta = math.radians(angle)
+    radial = abs(math.cos(theta) * rx + math.sin(theta) * ry) / radius
+    return 'sagittal' if radial > math.sqrt(0.5) else 'tangential'
+
+
+def findEdges(frame, aoiSize=81, downsample=8, minContrast=0.1, minSharpness=0.05, minCoherence=0.8, maxCandidates=32):
+    '''
+    Function to search the full frame for straight, sharp edges which can be used as slanted-edge AOIs.
+
+    The search is coarse to fine. The frame is first reduced by 'downsample', and the structure tensor of its gradient is
+    averaged over AOI sized windows, so that windows crossed by a single strong straight edge stand out. The best windows
+    (at least one AOI apart) are then checked at full resolution, where the AOI is centred on the edge and its angle,
+    contrast and sharpness are measured.
+
+    Parameters
+    ----------
+    frame: Numpy Array
+        Full frame image data.
+    aoiSize: int = 81
+        Width and height of the AOI in pixels.
+    downsample: int = 8
+        Reduction factor of the coarse search image.
+    minContrast: float = 0.1
+        Minimum Michelson contrast of the edge.
+    minSharpness: float = 0.05
+        Minimum peak gradient, as a fraction of the edge step per pixel, to reject soft shading and vignetting.
+    minCoherence: float = 0.8
+        Minimum coherence of the gradient direction, to reject corners and textures.
+    maxCandidates: int = 32
+        Maximum number of candidates returned.
+
+    Returns
+    ----------
+    List of EdgeCandidate, best (highest contrast x sharpness) first.
+    '''
+
+    frame = np.asarray(frame)
+    rows, cols = frame.shape
+    half_width = int((aoiSize - 1) / 2)
+    if rows < aoiSize or cols < aoiSize:
+        return []
+
+    # Coarse search
+    coarse = cv2.resize(frame.astype(np.float32), (cols // downsample, rows // downsample), interpolation=cv2.INTER_AREA)
+    gx = cv2.Sobel(coarse, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(coarse, cv2.CV_32F, 0, 1, ksize=3)
+
+    window = max(3, (aoiSize // downsample) | 1)
+    jxx = cv2.blur(gx * gx, (window, window))
+    jyy = cv2.blur(gy * gy, (window, window))
+    jxy = cv2.blur(gx * gy, (window, window))
+    energy = jxx + jyy
+    coherence = np.sqrt((jxx - jyy) ** 2 + 4 * jxy ** 2) / np.maximum(energy, 1e-12)
+    score = np.sqrt(energy) * coherence
+
+    margin = int(math.ceil(half_width / downsample))
+    score[:margin, :] = 0
+    score[-margin:, :] = 0
+    score[:, :margin] = 0
+    score[:, -margin:] = 0
+    score[coherence < minCoherence] = 0
+
+    peak = score.max()
+    if peak <= 0:
+        return []
+    # Only the local maxima within an AOI sized neighbourhood are kept as seeds
+    local_max = score >= cv2.dilate(score, np.ones((window, window), np.uint8))
+    ys, xs = np.nonzero(local_max & (score >= 0.1 * peak))
+    order = np.argsort(score[ys, xs])[::-1]
+
+    separation = aoiSize / downsample
+    peaks = []
+    for i in order:
+        if all((xs[i] - x) ** 2 + (ys[i] - y) ** 2 >= separation ** 2 for x, y in peaks):
+            peaks.append((xs[i], ys[i]))
+            if len(peaks) >= 4 * maxCandidates:
+                break
+
+    # Fine check of each coarse peak at full resolution
+    candidates = []
+    offsets = np.arange(1, aoiSize - 1) - half_width
+    for x, y in peaks:
+        centre, aoi, fx, fy = _fineAoi(frame, ((x + 0.5) * downsample, (y + 0.5) * downsample), half_width)
+
+        # Move the AOI centre onto the edge, at the gradient weighted centroid
+        weights = fx * fx + fy * fy
+        total = weights.sum()
+        if total <= 0:
+            continue
+        centre = (centre[0] + int(round((weights.sum(axis=0) * offsets).sum() / total)),
+                  centre[1] + int(round((weights.sum(axis=1) * offsets).sum() / total)))
+        centre, aoi, fx, fy = _fineAoi(frame, centre, half_width)
+
+        sxx, syy, sxy = (fx * fx).sum(), (fy * fy).sum(), (fx * fy).sum()
+        if sxx + syy <= 0:
+            continue
+        fine_coherence = math.sqrt((sxx - syy) ** 2 + 4 * sxy ** 2) / (sxx + syy)
+
+        low, high = np.percentile(aoi, (5, 95))
+        step = high - low
+        contrast = step / (high + low) if high + low > 0 else 0.0
+        sharpness = np.percentile(np.hypot(fx, fy), 99.5) / step if step > 0 else 0.0
+
+        if fine_coherence < minCoherence or contrast < minContrast or sharpness < minSharpness:
+            continue
+
+        # The edge line is perpendicular to the mean gradient direction
+        normal = 0.5 * math.atan2(2 * sxy, sxx - syy)
+        angle = math.degrees(math.atan(math.tan(normal + math.pi / 2)))
+
+        candidates.append(EdgeCandidate(aoiCentre = centre,
+                                        angle = angle,
+                                        contrast = float(contrast),
+                                        sharpness = float(sharpness),
+                                        coherence = float(fine_coherence),
+                                        orientation = 'vertical' if abs(angle) > 45 else 'horizontal',
+                                        edgeClass = _edgeClass(centre, angle, frame.shape, aoiSize),
+                                        score = float(contrast * sharpness)))
+
+    # Refined centres of peaks on the same edge can end up close together, keep the best of them
+    candidates.sort(key=lambda c: c.score, reverse=True)
+    kept = []
+    for c in candidates:
+        if all(math.hypot(c.aoiCentre[0] - k.aoiCentre[0], c.aoiCentre[1] - k.aoiCentre[1]) >= aoiSize / 2 for k in kept):
+            kept.append(c)
+    return kept[:maxCandidates]
+
+
+def nearestCandidate(candidates, point, maxDistance=None, orientation=None, edgeClass=None):
+    '''
+    Function to return the candidate closest to a point, e.g. to snap a nominal field position onto the edge actually in
+    the frame. Returns None if there is no candidate (of the given orientation and class) within 'maxDistance' pixels.
+    '''
+
+    best, bestDistance = None, math.inf
+    for c in candidates:
+        if orientation is not None and c.orientation != orientation:
+            continue
+        if edgeClass is not None and c.edgeClass != edgeClass:
+            continue
+        distance = math.hypot(c.aoiCentre[0] - point[0], c.aoiCentre[1] - point[1])
+        if distance < bestDistance:
+            best, bestDistance = c, distance
+    if maxDistance is not None and bestDistance > maxDistance:
+        return None
+    return best
@@ -5,20 +5,27 @@ Created on Mon Dec 09 10:33:00 2024
 @author: mgoddard
 """
 
-from PyQt5.QtWidgets import QFileDialog
+from PyQt5.QtWidgets import QFileDialog, QProgressDialog
 from PyQt5.QtCore import Qt, QPoint, QLine, QPointF
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen
-from scipy.optimize import curve_fit
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QIcon
 
 import MTF.Report as Report
+import MTF.MTF_Engine as MTF_Engine
+import MTF.MTF_Batch as MTF_Batch
+import MTF.MTF_Pipeline as MTF_Pipeline
+import MTF.MTF_Bootstrap as MTF_Bootstrap
+import MTF.MTF_Cache as MTF_Cache
 
 import numpy as np
 import MISC.Misc_Functions as misc
 import MISC.dialog_boxes as dialog
+from MISC.Stage_Timer import TIMER
 import math
+import time
 import cv2
 import os
-import matplotlib.pyplot as plt
+
+BATCH_RENDERING_MODES = ('live', 'throttled', 'quiet')
 
 
 def loadImage(ui, fname=None):
@@ -60,14 +67,7 @@ def loadImage(ui, fname=None):
         else:
             if ui.convertTo16BitsCheckBox.isChecked():
                 try:
-                    if ui.singleMat.dtype == 'uint16':
-                        if np.amax(ui.singleMat) <= pow(2, 14):
-                            ui.singleMat = ui.singleMat * pow(2, 2)
-                    elif ui.singleMat.dtype == 'uint8':
-                        ui.singleMat = ui.singleMat * pow(2, 8)
-                    elif ui.singleMat.dtype == 'float32':
-                        scale_factor = pow(2, 16) / np.amax(ui.singleMat)
-                        ui.singleMat = (ui.singleMat * scale_factor).astype('uint16')
+                    ui.singleMat = MTF_Engine.convertTo16Bits(ui.singleMat)
                 except:
                     dialog.messageCritical(ui, 'Error!', "Image failed to convert to 16-bit!")
     
@@ -81,6 +81,69 @@ def loadImage(ui, fname=None):
             except:
                 dialog.messageCritical(ui, 'Error!', "Failed to load the image into the GUI!")
 
+def writeTiming(ui, directory, name=None):
+    '''
+    Function to write the stage timing summary of a run next to its outputs, if stage timing is enabled (see MISC.Stage_Timer).
+    '''
+
+    if TIMER.enabled:
+        try:
+            fname = TIMER.writeSummary(directory, name)
+            if fname is not None:
+                ui.statusbar.showMessage('Stage timings written to ' + fname, 5000)
+        except OSError:
+            dialog.messageWarning(ui, 'Warning!', 'Failed to write the stage timing summary!')
+
+class BatchDisplay():
+    '''
+    Rendering policy for the results shown in the main window while a batch runs, so that redrawing the image, AOI and
+    ESF, LSF and MTF plots (see showResult) is kept off the batch's critical path.
+
+    The policy is the main window's 'batchRendering' mode, one of BATCH_RENDERING_MODES:
+
+        'live'       every result is shown as it is passed to show().
+        'throttled'  the first result is shown, then at most one every 'batchRenderInterval' seconds, the latest one.
+        'quiet'      nothing is shown until finish().
+
+    Whatever the mode, finish() shows the last result passed to show() if it has not been shown yet, so the main window
+    ends the batch in the same state.
+
+    Parameters
+    ----------
+    params: AnalysisParameters
+        Analysis parameters of the batch, used to load the frames to show.
+    '''
+
+    def __init__(self, ui, params):
+        self.ui = ui
+        self.params = params
+        self.mode = getattr(ui, 'batchRendering', 'throttled')
+        self.interval = getattr(ui, 'batchRenderInterval', 2.0)
+        self.pending = None
+        self.shown = -math.inf
+
+    def show(self, result, fname=None):
+        '''
+        Function to pass the latest result of the batch, and the image it was taken from (loaded only if it is shown).
+        '''
+
+        self.pending = (result, fname)
+        if self.mode == 'live' or (self.mode == 'throttled' and time.perf_counter() - self.shown >= self.interval):
+            self.finish()
+
+    def finish(self):
+        '''
+        Function to show the latest result, if it has not been shown yet.
+        '''
+
+        if self.pending is None:
+            return
+        result, fname = self.pending
+        self.pending = None
+        showResult(self.ui, result, MTF_Engine.loadFrame(fname, self.params) if fname is not None else None)
+        self.shown = time.perf_counter()
+
+
 def BulkAnalyseAndAverage(ui):
     '''
     Load Image (Average MTF) and automatically bulk process.
@@ -91,57 +154,59 @@ def BulkAnalyseAndAverage(ui):
     ui.bulk_dir_name = QFileDialog.getExistingDirectory(ui, "Select a Directory")
     
     if ui.bulk_dir_name != '':
-        for folderName in os.listdir(ui.bulk_dir_name):
-            if os.path.isdir(os.path.join(ui.bulk_dir_name, folderName)):
-                valid_folder = True
-                if folderName.startswith('top'):
-                    aoiPoint = QPoint(640, 50)
-                elif folderName.startswith('bottom'):
-                    aoiPoint = QPoint(640, 974)
-                elif folderName.startswith('centre'):
-                    aoiPoint = QPoint(640, 512)
-                elif folderName.startswith('left'):
-                    aoiPoint = QPoint(50, 512)
-                elif folderName.startswith('right'):
-                    aoiPoint = QPoint(1230, 512)
-                else:
-                    valid_folder = False
-
-                if valid_folder:
-                    list_of_mtfs = []
-                    for tif_file in os.listdir(os.path.join(ui.bulk_dir_name, folderName)):
-                        if tif_file.endswith('.tif'):
-                            loadImage(ui, os.path.join(ui.bulk_dir_name, folderName, tif_file))
-                            setAoi(ui, aoiPoint, execute=True)
-                            findEdge(ui)
-                            analyse(ui, bulk = True)
-                            list_of_mtfs.append(ui.FFT)
-
-                    try:
-                        array_of_mtfs = np.array(list_of_mtfs)
-                        mean_mtf = np.mean(array_of_mtfs, axis = 0)
-                        max_mtf = np.amax(array_of_mtfs, axis = 0)
-                        mean_half_nyquist = np.interp(32.5, ui.frequency, mean_mtf)
-                        max_half_nyquist = np.interp(32.5, ui.frequency, max_mtf)
-                        
-                        plt.figure(figsize=(16, 9))
-                        plt.plot(ui.frequency, mean_mtf, '--b', label = 'Mean')
-                        plt.plot(ui.frequency, max_mtf, '--r', label = 'Peak Hold')
-                        plt.plot(32.5, mean_half_nyquist, 'ob', label = 'Mean Half-Nyquist = {:.3f}'.format(mean_half_nyquist))
-                        plt.plot(32.5, max_half_nyquist, 'or', label = 'Max Half-Nyquist = {:.3f}'.format(max_half_nyquist))
-                        plt.xlabel('Spatial Frequency [lp/mm]')
-                        plt.ylabel('MTF')
-                        plt.ylim(0, 1.05)
-                        plt.xlim(0, 65)
-                        plt.title(folderName + '_average')
-                        plt.grid()
-                        plt.legend()
-                        plt.savefig(ui.bulk_dir_name + "/averaged_" + folderName + ".png")
-
-                    except:
-                        dialog.messageWarning(ui, 'Warning!', 'Something went wrong, and a folder was not processed correctly!')
-                else:
-                    dialog.messageCritical(ui, 'Error!', 'An invalid folder is in the selected directory, make sure you only have valid folders in the selected directory.')
+        params = MTF_Engine.AnalysisParameters.fromUi(ui)
+        folders = []
+        jobs = []
+        field_folders, invalid = MTF_Batch.fieldFolders(ui.bulk_dir_name)
+        for folderName in invalid:
+            dialog.messageCritical(ui, 'Error!', 'An invalid folder is in the selected directory, make sure you only have valid folders in the selected directory.')
+        for folderName, aoiCentre, tif_files in field_folders:
+            folders.append((folderName, len(jobs), tif_files))
+            jobs.extend((MTF_Engine.fieldParams(params, folderName), os.path.join(ui.bulk_dir_name, folderName, tif_file), aoiCentre) for tif_file in tif_files)
+
+        progress = QProgressDialog("Processing files...", "Cancel", 0, len(jobs))
+        progress.setWindowTitle('Please Wait')
+        progress.setWindowIcon(QIcon('_icons/MainWindow.png'))
+        progress.setWindowModality(Qt.WindowModal)
+
+        TIMER.reset()
+        with TIMER.stage('batch'):
+            results = MTF_Batch.runJobs(MTF_Batch.analyseFileJob, jobs, ui.batchWorkers,
+                                        progress = lambda done, total: progress.setValue(done),
+                                        cancelled = progress.wasCanceled, cache = ui.resultCache)
+        if results is None:
+            dialog.messageWarning(ui, 'Warning!', 'Bulk processing was cancelled.')
+            return
+
+        display = BatchDisplay(ui, params)
+        for folderName, start, tif_files in folders:
+            folder_results = list(zip(tif_files, results[start:start + len(tif_files)]))
+            analysed_files = [tif_file for tif_file, result in folder_results if isinstance(result, MTF_Engine.MTFResult)]
+            list_of_results = [result for tif_file, result in folder_results if isinstance(result, MTF_Engine.MTFResult)]
+            failed_files = [tif_file for tif_file, result in folder_results if not isinstance(result, MTF_Engine.MTFResult)]
+            if failed_files != []:
+                dialog.messageWarning(ui, 'Warning!', 'Failed to analyse, and skipped:\n\n' + '\n'.join(failed_files))
+
+            try:
+                display.show(list_of_results[-1], os.path.join(ui.bulk_dir_name, folderName, analysed_files[-1]))
+                frequency, mean_mtf, max_mtf = MTF_Batch.averageMtf(list_of_results)
+
+                bands = None
+                if ui.bootstrapReplicas > 0 and len(list_of_results) > 1:
+                    with TIMER.stage('bootstrap'):
+                        bands = MTF_Bootstrap.bootstrapMean([result.mtf for result in list_of_results], frequency, ui.bootstrapReplicas, ui.bootstrapConfidence)
+
+                with TIMER.stage('averagePlot'):
+                    Report.writeAveragePlot(ui.bulk_dir_name, folderName, frequency, mean_mtf, max_mtf, bands)
+
+            except:
+                dialog.messageWarning(ui, 'Warning!', 'Something went wrong, and a folder was not processed correctly!')
+
+        try:
+            display.finish()
+        except:
+            dialog.messageWarning(ui, 'Warning!', 'Failed to show the last result in the main window!')
+        writeTiming(ui, ui.bulk_dir_name)
 
 
 def AnalyseStack(ui):
@@ -154,49 +219,88 @@ def AnalyseStack(ui):
     ui.bulk_dir_name = QFileDialog.getExistingDirectory(ui, "Select a Directory")
     
     if ui.bulk_dir_name != '':
-        for folderName in os.listdir(ui.bulk_dir_name):
-            if os.path.isdir(os.path.join(ui.bulk_dir_name, folderName)):
-
-                valid_folder = True
-                if folderName.startswith('top'):
-                    aoiPoint = QPoint(640, 50)
-                elif folderName.startswith('bottom'):
-                    aoiPoint = QPoint(640, 974)
-                elif folderName.startswith('centre'):
-                    aoiPoint = QPoint(640, 512)
-                elif folderName.startswith('left'):
-                    aoiPoint = QPoint(50, 512)
-                elif folderName.startswith('right'):
-                    aoiPoint = QPoint(1230, 512)
-                else:
-                    valid_folder = False
-            
-                if valid_folder:
-                    list_of_raw_positions = []
-                    list_of_raw_esf = []
-                    ui.number_of_images_processed = 0
-            
-                    for tif_file in os.listdir(os.path.join(ui.bulk_dir_name, folderName)):
-                        if tif_file.endswith('.tif'):
-                            loadImage(ui, os.path.join(ui.bulk_dir_name, folderName, tif_file))
-                            setAoi(ui, aoiPoint, execute=True)
-                            findEdge(ui)
-                            analyse(ui, stack = True)
-                            
-                            list_of_raw_esf.append(ui.EsfRawData)
-                            list_of_raw_positions.append(ui.EsfRawPosition)
-                            
-                            ui.number_of_images_processed += 1
-                
-                    try:
-                        ui.EsfRawData = np.array([item for sublist in list_of_raw_esf for item in sublist])
-                        ui.EsfRawPosition = np.array([item for sublist in list_of_raw_positions for item in sublist])
-                        fitESFCurve(ui, stacked = True)
-                        Report.generateReport(ui, folderName, aoiPoint)
-                    except:
-                        dialog.messageWarning(ui, 'Warning!', 'Something went wrong, and a folder was not processed correctly!')
-                else:
-                    dialog.messageCritical(ui, 'Error!', 'An invalid folder is in the selected directory, make sure you only have valid folders in the selected directory.')
+        params = MTF_Engine.AnalysisParameters.fromUi(ui)
+        folders = []
+        jobs = []
+        field_folders, invalid = MTF_Batch.fieldFolders(ui.bulk_dir_name)
+        for folderName in invalid:
+            dialog.messageCritical(ui, 'Error!', 'An invalid folder is in the selected directory, make sure you only have valid folders in the selected directory.')
+        for folderName, aoiCentre, tif_files in field_folders:
+            folders.append({'name': folderName, 'files': tif_files,
+                            'stack': MTF_Engine.EsfStack(params, len(tif_files), fold = ui.stackFoldBins),
+                            'bootstrap': MTF_Bootstrap.EsfBootstrap(params) if ui.bootstrapReplicas > 0 else None,
+                            'failed': [], 'aoi': None})
+            jobs.extend((MTF_Engine.fieldParams(params, folderName), os.path.join(ui.bulk_dir_name, folderName, tif_file), aoiCentre) for tif_file in tif_files)
+
+        owners = [(folder, tif_file) for folder in folders for tif_file in folder['files']]
+
+        def addToStack(index, result):
+            folder, tif_file = owners[index]
+            if isinstance(result, Exception):
+                folder['failed'].append(tif_file)
+            else:
+                folder['aoi'], positions, data = result
+                folder['stack'].add(positions, data)
+                if folder['bootstrap'] is not None:
+                    folder['bootstrap'].add(positions, data)
+
+        progress = QProgressDialog("Processing files...", "Cancel", 0, len(jobs))
+        progress.setWindowTitle('Please Wait')
+        progress.setWindowIcon(QIcon('_icons/MainWindow.png'))
+        progress.setWindowModality(Qt.WindowModal)
+
+        TIMER.reset()
+        with TIMER.stage('batch'):
+            results = MTF_Batch.runJobs(MTF_Batch.esfSamplesJob, jobs, ui.batchWorkers,
+                                        progress = lambda done, total: progress.setValue(done),
+                                        cancelled = progress.wasCanceled, onResult = addToStack, cache = ui.resultCache)
+        if results is None:
+            dialog.messageWarning(ui, 'Warning!', 'Stack processing was cancelled.')
+            return
+
+        display = BatchDisplay(ui, params)
+        reports = []
+        for folder in folders:
+            if folder['failed'] != []:
+                dialog.messageWarning(ui, 'Warning!', 'Failed to analyse, and skipped:\n\n' + '\n'.join(folder['failed']))
+
+            try:
+                ui.number_of_images_processed = folder['stack'].frames
+                ui.aoiImageMat = folder['aoi']
+                result = folder['stack'].result()
+                display.show(result)
+                ui.mtfBands = None
+                if folder['bootstrap'] is not None and folder['bootstrap'].frames > 1:
+                    with TIMER.stage('bootstrap'):
+                        ui.mtfBands = folder['bootstrap'].bands(ui.bootstrapReplicas, ui.bootstrapConfidence, reference = (result.frequency, result.mtf))
+                reports.append((ui.bulk_dir_name, folder['name'], result, folder['aoi'], params, folder['stack'].frames, ui.mtfBands, ui.stackReportPdf))
+            except:
+                dialog.messageWarning(ui, 'Warning!', 'Something went wrong, and a folder was not processed correctly!')
+
+        try:
+            display.finish()
+        except:
+            dialog.messageWarning(ui, 'Warning!', 'Failed to show the last result in the main window!')
+
+        # Render the reports of all folders (and their PDF pages) concurrently, off-screen
+        progress.setLabelText("Generating reports...")
+        progress.setMaximum(len(reports))
+        results = MTF_Batch.runJobs(Report.writeReportJob, reports, ui.batchWorkers,
+                                    progress = lambda done, total: progress.setValue(done), cancelled = progress.wasCanceled)
+        if results is None:
+            dialog.messageWarning(ui, 'Warning!', 'Report generation was cancelled.')
+        else:
+            failed_reports = [report[1] for report, result in zip(reports, results) if isinstance(result, Exception)]
+            if failed_reports != []:
+                dialog.messageWarning(ui, 'Warning!', 'Failed to generate the report of:\n\n' + '\n'.join(failed_reports))
+
+            if ui.stackReportPdf and reports != []:
+                try:
+                    Report.writeReportPdf(ui.bulk_dir_name + "/stacked_datasheets.pdf", [result for result in results if not isinstance(result, Exception)])
+                except Exception:
+                    dialog.messageWarning(ui, 'Warning!', 'Failed to save the reports as a single PDF file!')
+
+        writeTiming(ui, ui.bulk_dir_name)
 
 def defineAoi(ui):
     '''
@@ -272,13 +376,7 @@ def drawAoi(ui, execute=False):
 
     ui.image.setPixmap(QPixmap.fromImage(ui.singleImage))
 
-    top = max(ui.aoiY.value() - ui.half_width, 0)
-    bottom = min(ui.aoiY.value() + ui.half_width, 1023)
-    left = max(ui.aoiX.value() - ui.half_width, 0)
-    right = min(ui.aoiX.value() + ui.half_width, 1279)
-
-
-    ui.aoiImageMat = np.copy(ui.singleMat[top:bottom+1, left:right+1])
+    ui.aoiImageMat = MTF_Engine.extractAoi(ui.singleMat, (ui.aoiX.value(), ui.aoiY.value()), ui.aoiSize.value())
 
     ui.analyseButton.setEnabled(False)
     updateAoiImage(ui, execute = execute)
@@ -287,39 +385,29 @@ def adjustAoi(ui):
     '''
     Function to move the AOI if the AOI is not centred
     '''
-    p1 = np.array([ui.edge.x1(), ui.edge.y1(), 0])
-    p2 = np.array([ui.edge.x2(), ui.edge.y2(), 0])
-    p3 = np.array([(ui.aoiSize.value() - 1) / 2, (ui.aoiSize.value() - 1) / 2, 0])
-
-    d = np.linalg.norm(np.cross(p2 - p1, p1 - p3)) / np.linalg.norm(p2 - p1)
 
-    m_edge = ui.edge.dy() / ui.edge.dx()
-    
-    theta = math.atan(m_edge)
+    newX, newY = MTF_Engine.adjustAoi(edgeTuple(ui), (ui.aoiX.value(), ui.aoiY.value()), ui.aoiSize.value())
 
-    b_edge = ui.edge.y1() - (m_edge * ui.edge.x1())
-
-    if p3[1] > ((m_edge * p3[0]) + b_edge):
-        d = -d
-    dX = - math.sin(theta) * d
-    dY = math.cos(theta) * d   
-
-    if abs(d) > 2:
+    if (newX, newY) != (ui.aoiX.value(), ui.aoiY.value()):
         try:
             ui.aoiX.valueChanged.disconnect()
             ui.aoiY.valueChanged.disconnect()
         except:
             pass
 
-        newX = round(ui.aoiX.value() + dX)
-        newY = round(ui.aoiY.value() + dY)
-
         ui.aoiX.setValue(newX)
         ui.aoiY.setValue(newY)
 
         ui.aoiX.valueChanged.connect(lambda: drawAoi(ui))
         ui.aoiY.valueChanged.connect(lambda: drawAoi(ui))
 
+def edgeTuple(ui):
+    '''
+    Function to return the current edge QLine as the (x1, y1, x2, y2) tuple used by the MTF engine
+    '''
+
+    return (ui.edge.x1(), ui.edge.y1(), ui.edge.x2(), ui.edge.y2())
+
 def updateAoiImage(ui, includeLine=False, execute=False):
     '''
     Function to update the AOI image in the side-bar
@@ -403,121 +491,82 @@ def findEdge(ui):
         ui.analyseButton.setEnabled(True)
 
 
+def showResult(ui, result, frame=None, plot=True):
+    '''
+    Function to load an MTFResult from the headless engine into the main window, as if the AOI had been selected, the edge found and the analysis run from the GUI.
+
+    The AOI, edge and angle are left as they are for results of stacked samples, which have no AOI details.
+
+    Parameters
+    ----------
+    result: MTFResult
+        Result of a single AOI analysis.
+    frame: Numpy Array = None
+        Optional full frame which the result was taken from, to be shown with the AOI drawn on it.
+    plot: Boolean = True
+        Optional boolean flag to indicate whether the ESF, LSF and MTF plots should be redrawn.
+    '''
+
+    if frame is not None:
+        ui.singleMat = frame
+        with TIMER.stage('qtRepaint'):
+            setAoi(ui, QPoint(result.aoiCentre[0], result.aoiCentre[1]), execute=True)
+
+    if result.aoiImage is not None:
+        ui.aoiImageMat = np.array(result.aoiImage)
+        ui.angle = result.angle
+        ui.horizontalMtfEdgeAngleLabel.setText("{:.2f}".format(ui.angle))
+        if ui.angle < 0:
+            ui.verticalMtfEdgeAngleLabel.setText("{:.2f}".format(ui.angle + 90))
+        else:
+            ui.verticalMtfEdgeAngleLabel.setText("{:.2f}".format(90 - ui.angle))
+
+        ui.aoiScale = 4
+        x1, y1, x2, y2 = result.edge
+        ui.edge = QLine(x1, y1, x2, y2)
+        ui.edgeScaled = QLine(x1*ui.aoiScale, y1*ui.aoiScale, x2*ui.aoiScale, y2*ui.aoiScale)
+        with TIMER.stage('qtRepaint'):
+            updateAoiImage(ui, includeLine=True)
+        ui.analyseButton.setEnabled(True)
+
+    pipeline = updatePipeline(ui)
+    if result.aoiImage is not None:
+        pipeline.setAoi(result.aoiImage, result.edge)
+    elif len(result.esfRawPosition) > 0:
+        pipeline.setSamples(result.esfRawPosition, result.esfRawData)
+    else:
+        pipeline.setEsf(result.esfPosition, result.esfData, result.tailStart)
+
+    ui.EsfRawPosition, ui.EsfRawData = result.esfRawPosition, result.esfRawData
+    ui.EsfRawPosition_new, ui.EsfRawData_new = result.esfRawPositionNew, result.esfRawDataNew
+    ui.EsfRawPosition_removed, ui.EsfRawData_removed = result.esfRawPositionRemoved, result.esfRawDataRemoved
+    ui.EsfPosition, ui.EsfData = result.esfPosition, result.esfData
+    ui.width10_90, ui.width20_80 = result.width10_90, result.width20_80
+    ui.LSF = result.lsf
+    ui.frequency, ui.FFT = result.frequency, result.mtf
+
+    ui.edge10_90.setText(f"{ui.width10_90:.3f}" + " px")
+    ui.edge20_80.setText(f"{ui.width20_80:.3f}" + " px")
+    ui.MtfFrequency.setEnabled(True)
+
+    if plot:
+        with TIMER.stage('plot'):
+            ui.mtfTabWidget.setCurrentIndex(1)
+            if ui.tailSmoothing.isChecked():
+                ui.plotESF.plotf('ESF', ui.EsfRawData_new, ui.EsfRawPosition_new, ui.EsfData, ui.EsfPosition, tail_start = result.tailStart, removed_position = ui.EsfRawPosition_removed, removed_data = ui.EsfRawData_removed)
+            else:
+                ui.plotESF.plotf('ESF', ui.EsfRawData_new, ui.EsfRawPosition_new, ui.EsfData, ui.EsfPosition, removed_position = ui.EsfRawPosition_removed, removed_data = ui.EsfRawData_removed)
+            ui.plotLSF.plotf('LSF', ui.LSF, ui.EsfPosition)
+            ui.plotFFT.plotf('MTF', ui.FFT, ui.frequency, nyquist_range=MTF_Engine.frequencyMax(MTF_Engine.AnalysisParameters.fromUi(ui)), detector_mtf=result.detectorMtf, optical_mtf=result.opticalMtf)
+
 def cleanEdge(ui):
     '''
     Function to clean up the AOI image and remove noise before edge is found   
     '''
 
     if ui.removeDeadPixels.isChecked():
-        aoiImageMat_stddev = np.std(ui.aoiImageMat) * ui.badPixelFactorSpinBox.value()
-        for i in range(2):  # repeat the clean to remove the bad pixels effect on averaging
-            for x in range(ui.aoiImageMat.shape[1]):
-                for y in range(ui.aoiImageMat.shape[0]):
-                    if x == 0:  # left edge
-                        if y == 0:
-                            # top left corner
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x+1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x+1]) > aoiImageMat_stddev):
-                                num_neighbours = 3
-                                average = ui.aoiImageMat[y+1, x]/num_neighbours + ui.aoiImageMat[y+1, x+1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x+1]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                        elif y == ui.aoiImageMat.shape[0] - 1:
-                            # bottom left corner
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x+1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x+1]) > aoiImageMat_stddev):
-                                num_neighbours = 3
-                                average = ui.aoiImageMat[y-1, x]/num_neighbours + ui.aoiImageMat[y-1, x+1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x+1]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                        else:
-                            # rest of left edge
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x+1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x+1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x+1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x]) > aoiImageMat_stddev):
-                                num_neighbours = 5
-                                average = ui.aoiImageMat[y-1, x]/num_neighbours + ui.aoiImageMat[y-1, x+1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x+1]/num_neighbours + ui.aoiImageMat[y+1, x+1]/num_neighbours + \
-                                    ui.aoiImageMat[y+1, x]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                    elif x == ui.aoiImageMat.shape[1] - 1:  # right edge
-                        if y == 0:
-                            # top right corner
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x-1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x]) > aoiImageMat_stddev):
-                                num_neighbours = 3
-                                average = ui.aoiImageMat[y, x-1]/num_neighbours + ui.aoiImageMat[y+1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y+1, x]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                        elif y == ui.aoiImageMat.shape[0] - 1:
-                            # bottom right corner
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x-1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x-1]) > aoiImageMat_stddev):
-                                num_neighbours = 3
-                                average = ui.aoiImageMat[y-1, x]/num_neighbours + ui.aoiImageMat[y-1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x-1]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                        else:
-                            # rest of right edge
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x-1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x]) > aoiImageMat_stddev):
-                                num_neighbours = 5
-                                average = ui.aoiImageMat[y-1, x]/num_neighbours + ui.aoiImageMat[y-1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x-1]/num_neighbours + ui.aoiImageMat[y+1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y+1, x]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                    else:  # middle section
-                        if y == 0:
-                            # top edge
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x+1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x+1]) > aoiImageMat_stddev):
-                                num_neighbours = 5
-                                average = ui.aoiImageMat[y, x-1]/num_neighbours + ui.aoiImageMat[y+1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y+1, x]/num_neighbours + ui.aoiImageMat[y+1, x+1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x+1]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                        elif y == ui.aoiImageMat.shape[0] - 1:
-                            # bottom edge
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x+1]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x+1]) > aoiImageMat_stddev):
-                                num_neighbours = 5
-                                average = ui.aoiImageMat[y, x-1]/num_neighbours + ui.aoiImageMat[y-1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y-1, x]/num_neighbours + ui.aoiImageMat[y-1, x+1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x+1]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
-                        else:
-                            # rest of the image
-                            if (abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y-1, x+1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y, x+1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x-1]) > aoiImageMat_stddev
-                                and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x]) > aoiImageMat_stddev
-                                    and abs(ui.aoiImageMat[y, x] - ui.aoiImageMat[y+1, x+1]) > aoiImageMat_stddev):
-                                num_neighbours = 8
-                                average = ui.aoiImageMat[y-1, x-1]/num_neighbours + ui.aoiImageMat[y-1, x]/num_neighbours + \
-                                    ui.aoiImageMat[y-1, x+1]/num_neighbours + ui.aoiImageMat[y, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y, x+1]/num_neighbours + ui.aoiImageMat[y+1, x-1]/num_neighbours + \
-                                    ui.aoiImageMat[y+1, x]/num_neighbours + \
-                                    ui.aoiImageMat[y+1,
-                                                        x+1]/num_neighbours
-                                ui.aoiImageMat[y, x] = int(average)
+        params = MTF_Engine.AnalysisParameters.fromUi(ui)
+        ui.aoiImageMat = MTF_Engine.cleanEdge(ui.aoiImageMat, params.badPixelFactor, params.badPixelRasterOrder, params.badPixelSignedDifference)
 
 def getLine(ui):
     '''
@@ -544,43 +593,72 @@ def detect_line(ui):
     Function to find the edge in an AOI image
     '''
 
-    edge_x = []
-    edge_y = []
+    try:
+        params = MTF_Engine.AnalysisParameters.fromUi(ui)
+        return MTF_Engine.detectLine(ui.aoiImageMat, params.edgeMethod, params.edgeOrientation)
+    except:
+        dialog.messageCritical(ui, 'Error!', 'Could not find the edge in the AOI!')
+
+def updatePipeline(ui):
+    '''
+    Function to return the main window's MTF pipeline, with its analysis parameters brought up to date from the UI.
+    '''
+
+    ui.pipeline.setParams(MTF_Engine.AnalysisParameters.fromUi(ui))
+    return ui.pipeline
+
+def updateAnalysis(ui):
+    '''
+    Function triggered when an analysis parameter is changed, to bring the ESF, LSF and MTF of the current analysis up to date.
+
+    Only the pipeline stages which depend on the changed parameter (and those after them) are recomputed.
+    '''
+
+    if ui.pipeline.hasInput() and ui.MtfFrequency.isEnabled():
+        fitESFCurve(ui)
 
-    stddev = np.std(ui.aoiImageMat)
+def clearResultCache(ui):
+    '''
+    Function to delete every entry of the result cache, for example to free disk space or to discard results that should not
+    be reused.
+    '''
 
     try:
-        if (np.std(ui.aoiImageMat[0, :]) < stddev/2) or (np.std(ui.aoiImageMat[ui.aoiImageMat.shape[0] - 1, :]) < stddev/2):
-            for i in range(0, ui.aoiImageMat.shape[0]):
-                row = ui.aoiImageMat[i, :]
-                if np.std(row) < stddev/2:
-                    pass
-                else:
-                    x = np.arange(0, ui.aoiImageMat.shape[1])
-                    p0 = [np.amax(row) - np.amin(row), 1,
-                        ui.aoiImageMat.shape[1] / 2, np.amin(row)]
-                    popt, pcov = curve_fit(
-                        misc.f_logistic, x, row, p0=p0, maxfev=10000)
-                    edge_x.append(popt[2])
-                    edge_y.append(i)
+        if ui.resultCache is not None:
+            removed = ui.resultCache.invalidate()
+        elif os.path.isdir(ui.cacheDirectory):
+            removed = MTF_Cache.ResultCache(ui.cacheDirectory).invalidate()
         else:
-            for i in range(0, ui.aoiImageMat.shape[0]):
-                row = ui.aoiImageMat[i, :]
-                x = np.arange(0, ui.aoiImageMat.shape[1])
-                p0 = [np.amax(row) - np.amin(row), 1,
-                    ui.aoiImageMat.shape[1] / 2, np.amin(row)]
-                popt, pcov = curve_fit(
-                    misc.f_logistic, x, row, p0=p0, maxfev=10000)
-                edge_x.append(popt[2])
-                edge_y.append(i)
-
-        if edge_x == []:
-            return 0.1, 0
-        else:
-            p = np.polyfit(edge_x, edge_y, 1)
-            return p
+            removed = 0
+    except OSError:
+        dialog.messageWarning(ui, 'Warning!', 'Could not clear the result cache in \'' + ui.cacheDirectory + '\'.')
+        return
+
+    dialog.messageInformation(ui, 'Result Cache', str(removed) + ' cached results deleted.')
+
+def compareEsfMethods(ui):
+    '''
+    Function to run every ESF method on the raw ESF samples of the current analysis, and report the runtime of each and the
+    difference between their MTFs.
+    '''
+
+    try:
+        params = MTF_Engine.AnalysisParameters.fromUi(ui)
+        positions, data = ui.pipeline.get('samples')
+        comparison = MTF_Engine.compareEsfMethods(positions, data, params)
     except:
-        dialog.messageCritical(ui, 'Error!', 'Could not find the edge in the AOI!')
+        dialog.messageWarning(ui, 'Warning!', 'Analyse an AOI (or a stack without folded bins) before comparing the ESF methods.')
+        return
+
+    halfNyquist = (1000 / params.pixelSize) / 4
+    lines = []
+    for method in MTF_Engine.ESF_METHODS:
+        mtf = np.interp(halfNyquist, comparison.frequency, comparison.mtf[method])
+        lines.append('{}: {:.2f} ms, MTF @ Half-Nyquist = {:.3f}'.format(method, comparison.runtime[method] * 1000, mtf))
+    lines.append('')
+    lines.append('MTF difference (iso12233 - smoothed) up to {:.1f} lp/mm: max {:.3f}, rms {:.3f}'.format(comparison.frequency[-1], comparison.maxDifference, comparison.rmsDifference))
+
+    dialog.messageInformation(ui, 'ESF Method Comparison', '\n'.join(lines))
 
 def analyse(ui, execute = False, bulk = False, stack = False):
     '''
@@ -599,37 +677,9 @@ def analyse(ui, execute = False, bulk = False, stack = False):
     try:
         ui.mtfTabWidget.setCurrentIndex(1)
 
-        xstart = 0
-        ystart = 0
-        xstop = ui.aoiImageMat.shape[1]
-        ystop = ui.aoiImageMat.shape[0]
-
-        a = ui.edge.dy() / ui.edge.dx()
-        b = ui.edge.y1() - (a * ui.edge.x1())
-
-        ui.EsfRawData = []
-        ui.EsfRawPosition = []
-
-        p1 = np.array([ui.edge.x1(), ui.edge.y1(), 0])
-        p2 = np.array([ui.edge.x2(), ui.edge.y2(), 0])
-
-        origin = np.array([(ui.aoiSize.value() - 1) / 2,(ui.aoiSize.value() - 1) / 2, 0])
-        p4 = misc.rotate2d(origin, p1, 90)
-        p5 = misc.rotate2d(origin, p2, 90)
-
-        for x in range(xstart, xstop, 1):
-            for y in range(ystart, ystop, 1):
-                p3 = np.array([x, y, 0])
-
-                d = np.linalg.norm(np.cross(p2 - p1, p1 - p3)) / np.linalg.norm(p2 - p1)
-                if y < ((a * x) + b):
-                    d = -d
-
-                dc = np.linalg.norm(np.cross(p5 - p4, p4 - p3)) / np.linalg.norm(p5 - p4)
-
-                if (abs(d) <= ui.normalDistanceFromEdge.value()) and (dc <= ui.lengthOfEdgeLine.value()/2):
-                    ui.EsfRawData.append(ui.aoiImageMat[y, x])
-                    ui.EsfRawPosition.append(d)
+        pipeline = updatePipeline(ui)
+        pipeline.setAoi(ui.aoiImageMat, edgeTuple(ui))
+        ui.EsfRawPosition, ui.EsfRawData = pipeline.get('samples')
 
         if not stack:
             ui.plotESF.plotf('ESF', ui.EsfRawData, ui.EsfRawPosition)
@@ -654,123 +704,14 @@ def fitESFCurve(ui, execute=False, bulk = False, stacked = False):
     '''
 
     try:
-        oversampling = ui.oversamplingMultiplier.value()
-        maxminD = ui.normalDistanceFromEdge.value()
-        num = 1 + (oversampling * maxminD)
-
-        ESFrX = np.linspace(-maxminD, maxminD, num)
-        ESFrY = np.zeros(num)
-
-        j = 0
-        while j < num:
-            sumsI = 0
-            sumsN = 0
-            for k in range(len(ui.EsfRawPosition)):
-                absX = abs(ui.EsfRawPosition[k] - ESFrX[j])
-                if absX <= (4 / 7):
-                    sumsI += (1 - (7 / 4)*absX)*ui.EsfRawData[k]
-                    sumsN += 1 - (7 / 4)*absX
-            if sumsN == 0:
-                ESFrX = np.delete(ESFrX, j)
-                ESFrY = np.delete(ESFrY, j)
-                num -= 1
-            else:
-                ESFrY[j] = sumsI / sumsN
-                j += 1
-                
-        ESFrY = misc.savitzky_golay(ESFrY, ui.oversamplingMultiplier.value() + 1, 3)
-
-        minimum = min(ESFrY)
-        maximum = max(ESFrY)
-        delta = abs(maximum - minimum)
-
-        d90 = 0
-        d10 = 0
-
-        if ESFrY[0] > (minimum + 0.5*delta):
-            for x in range(len(ESFrX)):
-                if d90 == 0 and ESFrY[x] < minimum + 0.9*delta:
-                    d90 = ESFrX[x]
-                elif d10 == 0 and ESFrY[x] < minimum + 0.1*delta:
-                    d10 = ESFrX[x - 1]
-        else:
-            for x in range(len(ESFrX)):
-                if d10 == 0 and ESFrY[x] > minimum + 0.1*delta:
-                    d10 = ESFrX[x]
-                elif d90 == 0 and ESFrY[x] > minimum + 0.9*delta:
-                    d90 = ESFrX[x - 1]
+        pipeline = updatePipeline(ui)
+        if stacked:
+            pipeline.setSamples(ui.EsfRawPosition, ui.EsfRawData)
 
-        dT = ui.tailStartdT.value() * max(abs(d10), abs(d90))
-        
-        ui.EsfRawData_new = []
-        ui.EsfRawPosition_new = []
-        ui.EsfRawData_removed = []
-        ui.EsfRawPosition_removed = []
-        
-        if ui.removeNoise.isChecked():
-            y_samples = []
-            for i in range(len(ui.EsfRawPosition)):
-                if ui.EsfRawPosition[i] <= - (3.5 + max(abs(d10), abs(d90))):
-                    y_samples.append(ui.EsfRawData[i])
-            stddev = np.std(y_samples).astype('uint16')
-            scaledSigma = stddev * ui.sigmaScalingSpinBox.value()
-            
-            for k in range(len(ui.EsfRawPosition)):
-                delta = 1
-                j_index = 0
-                for j in range(num):
-                    if abs(ui.EsfRawPosition[k] - ESFrX[j]) < delta:
-                        delta = abs(ui.EsfRawPosition[k] - ESFrX[j])
-                        j_index = j
-                if abs(ESFrX[j_index]) < 2.5:
-                    if abs(ESFrY[j_index] - ui.EsfRawData[k]) <= 1.75 * scaledSigma:
-                        ui.EsfRawData_new.append(ui.EsfRawData[k])
-                        ui.EsfRawPosition_new.append(ui.EsfRawPosition[k])
-                    else:
-                        ui.EsfRawData_removed.append(ui.EsfRawData[k])
-                        ui.EsfRawPosition_removed.append(ui.EsfRawPosition[k])
-                else:  
-                    if abs(ESFrY[j_index] - ui.EsfRawData[k]) <= scaledSigma:
-                        ui.EsfRawData_new.append(ui.EsfRawData[k])
-                        ui.EsfRawPosition_new.append(ui.EsfRawPosition[k])
-                    else:
-    
-                        ui.EsfRawData_removed.append(ui.EsfRawData[k])
-                        ui.EsfRawPosition_removed.append(ui.EsfRawPosition[k])
-
-            ui.EsfRawData_new = np.array(ui.EsfRawData_new)
-            ui.EsfRawPosition_new = np.array(ui.EsfRawPosition_new)
-        else:
-            ui.EsfRawData_new = ui.EsfRawData
-            ui.EsfRawPosition_new = ui.EsfRawPosition
-
-        ui.EsfRawData_removed = np.array(ui.EsfRawData_removed)
-        ui.EsfRawPosition_removed = np.array(ui.EsfRawPosition_removed)
-
-        ESFrYnew = np.zeros(num)
-
-        for j in range(num):
-            if (not ui.tailSmoothing.isChecked()) or (abs(ESFrX[j]) < dT):
-                sumsI = 0
-                sumsN = 0
-                for k in range(len(ui.EsfRawPosition_new)):
-                    X = ui.EsfRawPosition_new[k] - ESFrX[j]
-                    if (abs(X) <= 2):
-                        sumsI += math.exp(- ui.smoothingAlpha.value() * pow(X, 2)) * ui.EsfRawData_new[k]
-                        sumsN += math.exp(- ui.smoothingAlpha.value() * pow(X, 2)) #
-                ESFrYnew[j] = sumsI / sumsN
-            elif ui.tailSmoothing.isChecked():
-                values = []
-                for k in range(len(ui.EsfRawPosition_new)):
-                    X = ui.EsfRawPosition_new[k] - ESFrX[j]
-                    if (abs(X) <= ui.tailSmoothSpinBox.value()):
-                        values.append(ui.EsfRawData_new[k])
-                ESFrYnew[j] = float(np.mean(values))
-        
-        ui.EsfPosition = ESFrX
+        ui.EsfPosition, ui.EsfData, dT = pipeline.get('smoothed')
+        (ui.EsfRawPosition_new, ui.EsfRawData_new,
+         ui.EsfRawPosition_removed, ui.EsfRawData_removed) = pipeline.get('noise')
 
-        ui.EsfData = misc.savitzky_golay(ESFrYnew, ui.oversamplingMultiplier.value() + 1, 3)
-        
         if ui.tailSmoothing.isChecked():
             ui.plotESF.plotf('ESF', ui.EsfRawData_new, ui.EsfRawPosition_new, ui.EsfData, ui.EsfPosition, tail_start = dT, removed_position = ui.EsfRawPosition_removed, removed_data = ui.EsfRawData_removed)
         else:
@@ -792,43 +733,7 @@ def EdgeSpec(ui, execute=False):
     '''
 
     try:
-        maximum = max(ui.EsfData)
-        minimum = min(ui.EsfData)
-        delta = maximum - minimum
-
-        percentile10 = 0
-        percentile20 = 0
-        percentile50 = 0
-        percentile80 = 0
-        percentile90 = 0
-
-        if ui.EsfData[0] > (minimum + 0.5*delta):
-            for x in range(len(ui.EsfPosition)):
-                if percentile90 == 0 and ui.EsfData[x] < minimum + 0.9*delta:
-                    percentile90 = ui.EsfPosition[x]
-                elif percentile80 == 0 and ui.EsfData[x] < minimum + 0.8*delta:
-                    percentile80 = ui.EsfPosition[x]
-                elif percentile50 == 0 and ui.EsfData[x] < minimum + 0.5*delta:
-                    percentile50 = ui.EsfPosition[x]
-                elif percentile20 == 0 and ui.EsfData[x] < minimum + 0.2*delta:
-                    percentile20 = ui.EsfPosition[x]
-                elif percentile10 == 0 and ui.EsfData[x] < minimum + 0.1*delta:
-                    percentile10 = ui.EsfPosition[x]
-        else:
-            for x in range(len(ui.EsfPosition)):
-                if percentile10 == 0 and ui.EsfData[x] > minimum + 0.1*delta:
-                    percentile10 = ui.EsfPosition[x]
-                elif percentile20 == 0 and ui.EsfData[x] > minimum + 0.2*delta:
-                    percentile20 = ui.EsfPosition[x]
-                elif percentile50 == 0 and ui.EsfData[x] > minimum + 0.5*delta:
-                    percentile50 = ui.EsfPosition[x]
-                elif percentile80 == 0 and ui.EsfData[x] > minimum + 0.8*delta:
-                    percentile80 = ui.EsfPosition[x]
-                elif percentile90 == 0 and ui.EsfData[x] > minimum + 0.9*delta:
-                    percentile90 = ui.EsfPosition[x]
-
-        ui.width10_90 = abs(percentile90 - percentile10)
-        ui.width20_80 = abs(percentile80 - percentile20)
+        ui.width10_90, ui.width20_80 = updatePipeline(ui).get('spec')
 
         if execute:
             ui.logRow.append(ui.width10_90)
@@ -850,7 +755,7 @@ def LSFCurve(ui, execute=False):
     '''
 
     try:
-        ui.LSF = np.gradient(ui.EsfData.astype(np.float64))
+        ui.LSF = updatePipeline(ui).get('lsf')
 
         ui.plotLSF.plotf('LSF', ui.LSF, ui.EsfPosition)
 
@@ -872,37 +777,12 @@ def MTFCurve(ui, execute=False):
     '''
 
     try:
-        desired_number_of_points = 64
-
-        for i in range(16):
-            if pow(2, i) > len(ui.EsfData):
-                desired_number_of_points = pow(2, i+1)
-                break
-
-        sampling_interval = (ui.pixelSize.value() / 1000) * (max(ui.EsfPosition) - min(ui.EsfPosition)) / len(ui.EsfData)
-
-        ui.FFT = np.split(np.absolute(np.fft.fft(ui.LSF, desired_number_of_points)), 2)[0]
-
-        ui.frequency = np.split(np.fft.fftfreq(desired_number_of_points, d=sampling_interval), 2)[0]
-
-        if ui.MtfFrequency.currentIndex() == 0:
-                frequency_max = (1000 / ui.pixelSize.value()) / 4
-        elif ui.MtfFrequency.currentIndex() == 1:
-            frequency_max = (1000 / ui.pixelSize.value()) / 2
-
-        detector_mtf = []
-        truncation_mtf = []
-        for f in ui.frequency:
-            detector_mtf.append(misc.sinc(ui, f))
-            truncation_mtf.append(misc.sinc(ui, (ui.width10_90 * f) / ui.oversamplingMultiplier.value()))
-
-        ui.FFT = ui.FFT / truncation_mtf
-
-        ui.FFT = ui.FFT / ui.FFT[0]
+        pipeline = updatePipeline(ui)
 
-        optical_mtf = ui.FFT / detector_mtf
+        ui.frequency, ui.FFT, detector_mtf, optical_mtf = pipeline.get('mtf')
+        params = pipeline.params
 
-        ui.plotFFT.plotf('MTF', ui.FFT, ui.frequency, nyquist_range=frequency_max, detector_mtf=detector_mtf, optical_mtf=optical_mtf)
+        ui.plotFFT.plotf('MTF', ui.FFT, ui.frequency, nyquist_range=MTF_Engine.frequencyMax(params), detector_mtf=detector_mtf, optical_mtf=optical_mtf)
 
     except:
-        dialog.messageCritical(ui, 'Error!', 'Something went wrong in MTFCurve')
\ No newline at end of file
+        dialog.messageCritical(ui, 'Error!', 'Something went wrong in MTFCurve')
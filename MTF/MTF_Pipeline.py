@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 14:10:00 2026
+
+@author: mgoddard
+"""
+
+import numpy as np
+
+import MTF.MTF_Engine as MTF_Engine
+import MISC.Misc_Functions as misc
+
+
+class Stage():
+    '''
+    One stage of the MTF pipeline.
+
+    Parameters
+    ----------
+    name: String
+        Name of the stage.
+    inputs: Tuple
+        Names of the stages (or sources) whose outputs are passed to 'function'.
+    parameters: Tuple
+        Names of the AnalysisParameters fields the stage output depends on.
+    function: Callable
+        Called as function(params, *inputs) to compute the stage output.
+    '''
+
+    def __init__(self, name, inputs, parameters, function):
+        self.name = name
+        self.inputs = inputs
+        self.parameters = parameters
+        self.function = function
+
+
+def _samples(params, aoiInput):
+    aoi, edge = aoiInput
+    return MTF_Engine.esfSamples(aoi, edge, params)
+
+
+def _binned(params, samples):
+    positions, data = samples
+    if params.esfMethod == 'iso12233':
+        return MTF_Engine.isoEsf(*MTF_Engine.isoBinSums(positions, data, params), params) + (None,)
+    ESFrX, ESFrY = MTF_Engine.binEsf(positions, data, params)
+    d10, d90 = MTF_Engine.edgeLimits(ESFrX, ESFrY)
+    return ESFrX, ESFrY, max(abs(d10), abs(d90))
+
+
+def _noise(params, samples, binned):
+    positions, data = samples
+    ESFrX, ESFrY, edgeHalfWidth = binned
+    if params.removeNoise and params.esfMethod != 'iso12233':
+        return MTF_Engine.removeEsfNoise(positions, data, ESFrX, ESFrY, edgeHalfWidth, params)
+    return positions, data, np.array([]), np.array([])
+
+
+def _smoothed(params, binned, noise):
+    ESFrX, ESFrY, edgeHalfWidth = binned
+    keptPositions, keptData, removedPositions, removedData = noise
+    if params.esfMethod == 'iso12233':
+        return ESFrX, ESFrY, np.nan
+    tailStart = params.tailScale * edgeHalfWidth
+    ESFrYnew = MTF_Engine.smoothEsf(keptPositions, keptData, ESFrX, tailStart, params)
+    return ESFrX, misc.savitzky_golay(ESFrYnew, params.oversampling + 1, 3), tailStart
+
+
+def _spec(params, smoothed):
+    esfPosition, esfData, tailStart = smoothed
+    return MTF_Engine.edgeSpec(esfPosition, esfData)
+
+
+def _lsf(params, smoothed):
+    esfPosition, esfData, tailStart = smoothed
+    if params.esfMethod == 'iso12233':
+        return MTF_Engine.isoLsf(esfData)
+    return MTF_Engine.lsfCurve(esfData)
+
+
+def _mtf(params, smoothed, spec, lsf):
+    esfPosition, esfData, tailStart = smoothed
+    if params.esfMethod == 'iso12233':
+        return MTF_Engine.isoMtf(lsf, params)
+    return MTF_Engine.mtfCurve(lsf, esfPosition, esfData, spec[0], params)
+
+
+# Stages in dependency order, samples -> binned ESF -> noise removal -> smoothed ESF -> edge widths / LSF -> MTF
+# With the 'iso12233' esfMethod the ESF is the ISO binned ESF, with no noise removal or smoothing
+STAGES = [Stage('samples', ('aoi',), ('aoiSize', 'normalDistanceFromEdge', 'lengthOfEdgeLine'), _samples),
+          Stage('binned', ('samples',), ('esfMethod', 'normalDistanceFromEdge', 'oversampling'), _binned),
+          Stage('noise', ('samples', 'binned'), ('esfMethod', 'removeNoise', 'sigmaScaling'), _noise),
+          Stage('smoothed', ('binned', 'noise'), ('esfMethod', 'smoothingAlpha', 'tailSmoothing', 'tailScale', 'tailSmoothingWidth', 'oversampling'), _smoothed),
+          Stage('spec', ('smoothed',), (), _spec),
+          Stage('lsf', ('smoothed',), ('esfMethod',), _lsf),
+          Stage('mtf', ('smoothed', 'spec', 'lsf'), ('esfMethod', 'pixelSize', 'oversampling'), _mtf)]
+
+
+class MTFPipeline():
+    '''
+    Lazy, incrementally recomputed MTF pipeline for one AOI (or one set of stacked samples).
+
+    Each stage caches its output together with the versions of its inputs and the values of the parameters it depends on,
+    so after a parameter change only the stages depending on that parameter, and the stages downstream of them, are
+    recomputed when their output is next requested. The input is either an AOI, a set of raw samples or a fitted ESF,
+    which take the place of the stages they replace.
+
+    Parameters
+    ----------
+    params: AnalysisParameters = None
+        Initial analysis parameters.
+    '''
+
+    def __init__(self, params=None):
+        if params is None:
+            params = MTF_Engine.AnalysisParameters()
+        self.params = params
+        self.stages = {stage.name: stage for stage in STAGES}
+        self._sources = {}
+        self._values = {}
+        self._versions = {}
+        self._signatures = {}
+        self._counter = 0
+
+    def _setSources(self, **sources):
+        self._sources = {}
+        for name, value in sources.items():
+            self._counter += 1
+            self._sources[name] = value
+            self._versions[name] = self._counter
+
+    def setParams(self, params):
+        '''
+        Function to change the analysis parameters, stages are recomputed lazily as their outputs are requested.
+        '''
+
+        self.params = params
+
+    def setAoi(self, aoi, edge):
+        '''
+        Function to set a cleaned AOI image and its (x1, y1, x2, y2) edge as the input of the pipeline.
+        '''
+
+        self._setSources(aoi = (aoi, edge))
+
+    def setSamples(self, positions, data):
+        '''
+        Function to set raw ESF samples (e.g. stacked from several images) as the input of the pipeline, in place of an AOI.
+        '''
+
+        self._setSources(samples = (np.asarray(positions, dtype=np.float64), np.asarray(data)))
+
+    def setEsf(self, esfPosition, esfData, tailStart):
+        '''
+        Function to set an already fitted ESF as the input of the pipeline, for results whose raw samples were not kept
+        (e.g. a folded EsfStack). Only the edge widths, LSF and MTF can then be recomputed.
+        '''
+
+        empty = np.array([])
+        self._setSources(samples = (empty, empty), noise = (empty, empty, empty, empty),
+                         smoothed = (np.asarray(esfPosition), np.asarray(esfData), tailStart))
+
+    def hasInput(self):
+        '''
+        Function to return True if an AOI or a set of samples has been given to the pipeline.
+        '''
+
+        return self._sources != {}
+
+    def get(self, name):
+        '''
+        Function to return the output of a stage, computing it (and any out of date stages it depends on) if required.
+        '''
+
+        if name in self._sources:
+            return self._sources[name]
+        if name not in self.stages:
+            raise ValueError('No input has been set for the MTF pipeline')
+
+        stage = self.stages[name]
+        inputs = [self.get(i) for i in stage.inputs]
+        signature = (tuple(self._versions[i] for i in stage.inputs), tuple(getattr(self.params, p) for p in stage.parameters))
+
+        if self._signatures.get(name) != signature:
+            self._values[name] = stage.function(self.params, *inputs)
+            self._counter += 1
+            self._versions[name] = self._counter
+            self._signatures[name] = signature
+        return self._values[name]
+
+    def result(self, aoiCentre=None, aoiImage=None, edge=None, angle=None):
+        '''
+        Function to return the full analysis as an MTFResult, as MTFEngine.analyseSamples would.
+        '''
+
+        positions, data = self.get('samples')
+        keptPositions, keptData, removedPositions, removedData = self.get('noise')
+        esfPosition, esfData, tailStart = self.get('smoothed')
+        width10_90, width20_80 = self.get('spec')
+        frequency, mtf, detectorMtf, opticalMtf = self.get('mtf')
+
+        if 'aoi' in self._sources and aoiImage is None:
+            aoiImage, edge = self._sources['aoi']
+
+        return MTF_Engine.MTFResult(aoiCentre = aoiCentre, aoiImage = aoiImage, edge = edge, angle = angle,
+                                    esfRawPosition = positions, esfRawData = data,
+                                    esfRawPositionNew = keptPositions, esfRawDataNew = keptData,
+                                    esfRawPositionRemoved = removedPositions, esfRawDataRemoved = removedData,
+                                    esfPosition = esfPosition, esfData = esfData, tailStart = tailStart,
+                                    width10_90 = width10_90, width20_80 = width20_80,
+                                    lsf = self.get('lsf'), frequency = frequency, mtf = mtf,
+                                    detectorMtf = detectorMtf, opticalMtf = opticalMtf)
@@ -4,100 +4,347 @@ Created on Mon Dec 09 10:33:00 2024
 
 @author: mgoddard
 """
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
 import matplotlib.gridspec as gridspec
 import numpy as np
+import io
 import os
+import re
 
+from MISC.Stage_Timer import TIMER
 
-def generateReport(ui, folderName, aoiPoint):
+
+def _saveFigure(fig, fname):
+    # Render with Agg whatever the GUI backend, and release the figure once saved instead of leaving it to the garbage collector
+    try:
+        FigureCanvasAgg(fig)
+        fig.savefig(fname)
+    finally:
+        fig.clear()
+
+
+class ReportTemplate():
+    '''
+    Single page report of a field position's MTF stacked analysis, with the page (grid, axes, labels, legends and text
+    blocks) laid out once, and only the line, image and text data replaced for each field position (see update).
+
+    The page is drawn on an Agg figure which is not managed by pyplot, so it can be rendered in any worker process. A
+    template must not be shared between threads.
+    '''
+
+    def __init__(self):
+        self.fig = Figure(figsize = (11, 15.5), dpi = 200)
+        FigureCanvasAgg(self.fig)
+        gs = gridspec.GridSpec(nrows = 3, ncols = 2, height_ratios = [0.6, 1, 1.4])
+
+        self.ax0 = self.fig.add_subplot(gs[0,1])
+        self.image = self.ax0.imshow(np.zeros((1, 1)))
+
+        self.ax1 = self.fig.add_subplot(gs[1,0])
+        self.rawLine, = self.ax1.plot([], [], 'b.', label = 'Raw Data')
+        self.removedLine, = self.ax1.plot([], [], 'r.', label = 'Removed Noise')
+        self.esfLine, = self.ax1.plot([], [], 'r-', label = 'Best Fit')
+        self.ax1.grid()
+        self.ax1.set_xlabel('Distance fom Edge [px]')
+        self.ax1.set_ylabel('Pixel Value [ADU]')
+        self.ax1.set_title('ESF')
+        self.ax1.legend()
+
+        self.ax2 = self.fig.add_subplot(gs[1,1])
+        self.lsfLine, = self.ax2.plot([], [], 'b-')
+        self.ax2.grid()
+        self.ax2.set_xlabel('Distance from Edge [px]')
+        self.ax2.set_ylabel('Gradient of ESF [ADU/px]')
+        self.ax2.set_title('LSF')
+
+        self.ax3 = self.fig.add_subplot(gs[2:, :])
+        self.band = None
+        self.mtfLine, = self.ax3.plot([], [], '-r', label = 'System Stacked MTF')
+        self.halfNyquistPoint, = self.ax3.plot([], [], 'ob')
+        self.ax3.set_xlabel('Spatial Frequency [lp/mm]')
+        self.ax3.set_ylabel('Modulus of the OTF')
+        self.ax3.set_ylim(0, 1.05)
+        self.ax3.set_xlim(0, 65)
+        self.ax3.set_title('MTF')
+        self.ax3.grid()
+
+        self.titleText = self.ax3.text(-0.075, 1.7, '',
+                                       fontsize = 'x-large', fontweight = 'bold',
+                                       horizontalalignment = 'left',
+                                       verticalalignment = 'bottom',
+                                       transform = self.ax1.transAxes)
+        self.detailsText = self.ax3.text(-0.075, 1.68, '',
+                                         horizontalalignment = 'left',
+                                         verticalalignment = 'top',
+                                         transform = self.ax1.transAxes)
+
+        self.fig.subplots_adjust(bottom = 0.05, left = 0.1, right = 0.95, top = 0.95, wspace = 0.24, hspace = 0.24)
+
+    def update(self, directory, folderName, result, aoiImage, params, frames, bands=None):
+        '''
+        Function to replace the data of the report with that of one field position.
+
+        Parameters
+        ----------
+        directory: String
+            Directory of the stacked analysis.
+        folderName: String
+            String variable which is used to describe the specific MTF dataset that was used to generate the report.
+        result: MTFResult
+            Result of the stacked analysis.
+        aoiImage: Numpy Array
+            Cleaned AOI image of one of the stacked images.
+        params: AnalysisParameters
+            Analysis parameters of the stacked analysis.
+        frames: int
+            Number of stacked images.
+        bands: MtfBands = None
+            Optional bootstrap confidence bands of the MTF.
+        '''
+
+        flipped = 1
+
+        if result.esfPosition[0] > result.esfPosition[-1]: # backwards
+            if result.esfData[0] < result.esfData[-1]:
+                flipped = -1
+        else:   #forwards
+            if result.esfData[0] > result.esfData[-1]:
+                flipped = -1
+
+        esf_min = np.min(result.esfData) - 0.05 * (np.max(result.esfData) - np.min(result.esfData))
+        esf_max = np.max(result.esfData) + 0.05 * (np.max(result.esfData) - np.min(result.esfData))
+
+        displayMat = np.clip(aoiImage, esf_min, esf_max).astype(aoiImage.dtype)
+        self.image.set_data(displayMat)
+        self.image.set_extent((-0.5, displayMat.shape[1] - 0.5, displayMat.shape[0] - 0.5, -0.5))
+        self.image.set_clim(np.min(displayMat), np.max(displayMat))
+
+        self.rawLine.set_data(result.esfRawPositionNew * flipped, result.esfRawDataNew)
+        self.removedLine.set_data(result.esfRawPositionRemoved * flipped, result.esfRawDataRemoved)
+        self.esfLine.set_data(result.esfPosition * flipped, result.esfData)
+        self.ax1.set_ylim(esf_min, esf_max)
+        self.ax1.relim()
+        self.ax1.autoscale_view()
+
+        self.lsfLine.set_data(result.esfPosition * flipped, result.lsf * flipped)
+        self.ax2.relim()
+        self.ax2.autoscale_view()
+
+        half_nyquist = np.interp(32.5, result.frequency, result.mtf)
+        if self.band is not None:
+            self.band.remove()
+            self.band = None
+        handles = []
+        if bands is not None:
+            self.band = self.ax3.fill_between(bands.frequency, bands.lower, bands.upper, color = 'r', alpha = 0.2,
+                                              label = '{:.0f}% Bootstrap Band ({} replicas)'.format(bands.confidence, bands.replicas))
+            handles.append(self.band)
+        self.mtfLine.set_data(result.frequency, result.mtf)
+        self.halfNyquistPoint.set_data([32.5], [half_nyquist])
+        self.halfNyquistPoint.set_label('Stacked Half-Nyquist = {:.3f}'.format(half_nyquist))
+        self.ax3.legend(handles = handles + [self.mtfLine, self.halfNyquistPoint])
+
+        self.titleText.set_text('Stacked MTF:  ' + folderName)
+
+        nyquist_lines = ''
+        for fraction, frequency in zip((0.25, 0.50, 0.75, 1.00), (16.25, 32.50, 48.75, 65.00)):
+            nyquist_lines += 'MTF @ {:.2f}x Nyquist:  {:.1f}%'.format(fraction, 100 * np.interp(frequency, result.frequency, result.mtf))
+            if bands is not None:
+                lower, upper = bands.at(frequency)
+                nyquist_lines += '  ({:.1f}% - {:.1f}%)'.format(100 * lower, 100 * upper)
+            nyquist_lines += '\n'
+
+        self.detailsText.set_text(os.path.dirname(directory) + '\n\n'
+                                  '10% - 90% Edge Width:  ' + str(result.width10_90) + '\n'
+                                  '20% - 80% Edge Width:  ' + str(result.width20_80) + '\n\n'
+                                  'Length of Edge:  ' + str(params.lengthOfEdgeLine) + '\n'
+                                  'Normal Distance to Edge:  ' + str(params.normalDistanceFromEdge) + '\n'
+                                  'Oversampling Per Pixel:  ' + str(params.oversampling) + '\n\n' +
+                                  nyquist_lines + '\n'
+                                  'Number of Stacked Images:  ' + str(frames) + '\n')
+
+    def save(self, fname, format=None):
+        '''
+        Function to save the current report, as a .png file, to an open PdfPages file (as a new page), or to a file object
+        in the given 'format' (e.g. 'pdf').
+        '''
+
+        if isinstance(fname, PdfPages):
+            fname.savefig(self.fig)
+        else:
+            self.fig.savefig(fname, format = format)
+
+
+# Report template of this process, created on first use and reused by every report it renders
+_TEMPLATE = None
+
+
+def reportTemplate():
+    '''
+    Function to return the report template of this process (see ReportTemplate).
+    '''
+
+    global _TEMPLATE
+    if _TEMPLATE is None:
+        _TEMPLATE = ReportTemplate()
+    return _TEMPLATE
+
+
+def writeReport(directory, folderName, result, aoiImage, params, frames, bands=None, pdfPage=False):
     '''
     Function which generates a single page report (as a .png file) for a single field position's MTF stacked analysis
 
+    The report is drawn by updating the process's ReportTemplate, so the page is only laid out once per process.
+
     Parameters
     ----------
+    directory: String
+        Directory of the stacked analysis, the report is saved in it as 'stacked_datasheet<folderName>.png'.
+    folderName, result, aoiImage, params, frames, bands:
+        Report data, see ReportTemplate.update.
+    pdfPage: Boolean = False
+        Whether to also render the report as a single page .pdf file, for writeReportPdf.
+
+    Returns
+    ----------
+    Contents of the single page .pdf file (bytes) if 'pdfPage' is set, otherwise None.
+    '''
+
+    template = reportTemplate()
+    template.update(directory, folderName, result, aoiImage, params, frames, bands)
+    template.save(directory + "/stacked_datasheet" + folderName + ".png")
+    if not pdfPage:
+        return None
+    page = io.BytesIO()
+    template.save(page, 'pdf')
+    return page.getvalue()
+
+
+def writeReportJob(directory, folderName, result, aoiImage, params, frames, bands=None, pdfPage=False):
+    '''
+    Job function to generate one stacked analysis report in a worker process (see writeReport and MTF_Batch.runJobs), so
+    the reports of all field positions of a run, and their .pdf pages, are rendered concurrently.
+    '''
+
+    with TIMER.stage('report'):
+        return writeReport(directory, folderName, result, aoiImage, params, frames, bands, pdfPage)
+
+
+def _pdfObjects(data):
+    # Split a .pdf file written by matplotlib (a single cross-reference table, no object streams) into its objects,
+    # returned as a dict of object number: object body, and the object number of the document catalog
+    xref = int(data[data.rindex(b'startxref') + len(b'startxref'):].split()[0])
+    table, trailer = data[xref:].split(b'trailer', 1)
+    lines = table.split(b'\n')
+    offsets = {}
+    first = int(lines[1].split()[0])
+    for number, line in enumerate(lines[2:], first):
+        entry = line.split()
+        if len(entry) == 3 and entry[2] == b'n':
+            offsets[number] = int(entry[0])
+
+    objects = {}
+    order = sorted(offsets, key = offsets.get)
+    for number, end in zip(order, [offsets[number] for number in order[1:]] + [xref]):
+        body = data[offsets[number]:end]
+        body = body[body.index(b'obj') + len(b'obj'):body.rindex(b'endobj')]
+        objects[number] = body.strip(b'\r\n')
+    root = int(re.search(rb'/Root (\d+) 0 R', trailer).group(1))
+    return objects, root
+
+
+def _renumber(body, numbers):
+    # Replace the object references of an object's dictionary (not of its stream data) by their new object numbers
+    head, stream = re.match(rb'(.*?)((?:stream\r?\n.*)?)$', body, re.S).groups()
+    head = re.sub(rb'(?<![\d.])(\d+) 0 R\b', lambda ref: b'%d 0 R' % numbers[int(ref.group(1))], head)
+    return head + stream
+
+
+def writeReportPdf(fname, pages):
+    '''
+    Function which saves the reports of all field positions of a run as the pages of a single .pdf file.
+
+    The pages are the single page .pdf files already rendered by writeReportJob, so they are only copied into one file
+    here, and not drawn again by the calling process.
+
+    Parameters
+    ----------
+    fname: String
+        Path of the .pdf file.
+    pages: List
+        Contents of the single page .pdf file of each report, as returned by writeReportJob.
+    '''
+
+    objects = []
+    kids = []
+    count = 2
+    with TIMER.stage('reportPdf'):
+        for page in pages:
+            pageObjects, root = _pdfObjects(page)
+            pagesNumber = int(re.search(rb'/Pages (\d+) 0 R', pageObjects[root]).group(1))
+            # Objects 1 and 2 of the merged file are its catalog and page tree, which replace those of each page
+            numbers = {root: 1, pagesNumber: 2}
+            for number in sorted(pageObjects):
+                if number not in numbers:
+                    count += 1
+                    numbers[number] = count
+            kids += [numbers[int(kid)] for kid in re.findall(rb'(\d+) 0 R', re.search(rb'/Kids \[(.*?)\]', pageObjects[pagesNumber], re.S).group(1))]
+            objects += sorted((numbers[number], _renumber(body, numbers)) for number, body in pageObjects.items() if numbers[number] > 2)
+
+        objects = [(1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+                   (2, b'<< /Type /Pages /Kids [ ' + b' '.join(b'%d 0 R' % kid for kid in kids) + b' ] /Count %d >>' % len(kids))] + objects
+        pdf = io.BytesIO()
+        pdf.write(b'%PDF-1.4\n%\xac\xdc \xab\xba\n')
+        offsets = []
+        for number, body in objects:
+            offsets.append(pdf.tell())
+            pdf.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+        xref = pdf.tell()
+        pdf.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        pdf.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+        pdf.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+
+    with open(fname, 'wb') as f:
+        f.write(pdf.getvalue())
+
+
+def writeAveragePlot(directory, folderName, frequency, meanMtf, maxMtf, bands=None):
+    '''
+    Function which plots the mean and peak-hold MTFs of a single field position's bulk analysis (as a .png file)
+
+    Parameters
+    ----------
+    directory: String
+        Directory of the bulk analysis, the plot is saved in it as 'averaged_<folderName>.png'.
     folderName: String
-        String variable which is used to describe the specific MTF dataset that was used to generate the report.
-    aoiPoint: QPoint
-        QPoint object, current unused.
+        String variable which is used to describe the specific MTF dataset that was averaged.
+    frequency, meanMtf, maxMtf: Numpy Array
+        Spatial frequency axis [lp/mm], and the mean and peak-hold MTFs (see MTF_Batch.averageMtf).
+    bands: MtfBands = None
+        Optional bootstrap confidence bands of the mean MTF.
     '''
-    
-    fig = plt.figure(figsize = (11, 15.5), dpi = 200)
-    gs = gridspec.GridSpec(nrows = 3, ncols = 2, height_ratios = [0.6, 1, 1.4])
-    
-    flipped = 1
-    
-    if ui.EsfPosition[0] > ui.EsfPosition[-1]: # backwards
-        if ui.EsfData[0] < ui.EsfData[-1]:
-            flipped = -1
-    else:   #forwards
-        if ui.EsfData[0] > ui.EsfData[-1]:
-            flipped = -1
-            
-    esf_min = np.min(ui.EsfData) - 0.05 * (np.max(ui.EsfData) - np.min(ui.EsfData))
-    esf_max = np.max(ui.EsfData) + 0.05 * (np.max(ui.EsfData) - np.min(ui.EsfData))
-    
-    displayMat = ui.aoiImageMat.copy()
-    for y in range(displayMat.shape[0]):
-        for x in range(displayMat.shape[1]):
-            if displayMat[y, x] > esf_max:
-                displayMat[y, x] = esf_max
-            if displayMat[y, x] < esf_min:
-                displayMat[y, x] = esf_min
-    
-    ax0 = fig.add_subplot(gs[0,1])
-    ax0.imshow(displayMat)
-    
-    ax1 = fig.add_subplot(gs[1,0])
-    ax1.plot(ui.EsfRawPosition_new * flipped, ui.EsfRawData_new, 'b.', label = 'Raw Data')
-    ax1.plot(ui.EsfRawPosition_removed * flipped, ui.EsfRawData_removed, 'r.', label = 'Removed Noise')
-    ax1.plot(ui.EsfPosition * flipped, ui.EsfData, 'r-', label = 'Best Fit')
-    ax1.set_ylim(esf_min, esf_max)
-    ax1.grid()
-    ax1.set_xlabel('Distance fom Edge [px]')
-    ax1.set_ylabel('Pixel Value [ADU]')
-    ax1.set_title('ESF')
-    ax1.legend()
-    
-    ax2 = fig.add_subplot(gs[1,1])
-    ax2.plot(ui.EsfPosition * flipped, ui.LSF * flipped, 'b-')
-    ax2.grid()
-    ax2.set_xlabel('Distance from Edge [px]')
-    ax2.set_ylabel('Gradient of ESF [ADU/px]')
-    ax2.set_title('LSF')
-    
-    ax3 = fig.add_subplot(gs[2:, :])
-    half_nyquist = np.interp(32.5, ui.frequency, ui.FFT)
-    ax3.plot(ui.frequency, ui.FFT, '-r', label = 'System Stacked MTF')
-    ax3.plot(32.5, half_nyquist, 'ob', label = 'Stacked Half-Nyquist = {:.3f}'.format(half_nyquist))
-    ax3.set_xlabel('Spatial Frequency [lp/mm]')
-    ax3.set_ylabel('Modulus of the OTF')
-    ax3.set_ylim(0, 1.05)
-    ax3.set_xlim(0, 65)
-    ax3.set_title('MTF')
-    ax3.grid()
-    ax3.legend()
-
-    plt.text(-0.075, 1.7, 'Stacked MTF:  ' + folderName,
-                fontsize = 'x-large', fontweight = 'bold',
-                horizontalalignment = 'left',
-                verticalalignment = 'bottom',
-                transform = ax1.transAxes)
-    
-    plt.text(-0.075, 1.68, os.path.dirname(ui.bulk_dir_name) + '\n\n'
-                '10% - 90% Edge Width:  ' + str(ui.width10_90) + '\n'
-                '20% - 80% Edge Width:  ' + str(ui.width20_80) + '\n\n'
-                'Length of Edge:  ' + str(ui.lengthOfEdgeLine.value()) + '\n'
-                'Normal Distance to Edge:  ' + str(ui.normalDistanceFromEdge.value()) + '\n'
-                'Oversampling Per Pixel:  ' + str(ui.oversamplingMultiplier.value()) + '\n\n'
-                'MTF @ 0.25x Nyquist:  {:.1f}%'.format(100 * np.interp(16.25, ui.frequency, ui.FFT)) + '\n'
-                'MTF @ 0.50x Nyquist:  {:.1f}%'.format(100 * np.interp(32.50, ui.frequency, ui.FFT)) + '\n'
-                'MTF @ 0.75x Nyquist:  {:.1f}%'.format(100 * np.interp(48.75, ui.frequency, ui.FFT)) + '\n'
-                'MTF @ 1.00x Nyquist:  {:.1f}%'.format(100 * np.interp(65.00, ui.frequency, ui.FFT)) + '\n\n'
-                'Number of Stacked Images:  ' + str(ui.number_of_images_processed) + '\n',
-                horizontalalignment = 'left',
-                verticalalignment = 'top', 
-                transform = ax1.transAxes)
-            
-    plt.subplots_adjust(bottom = 0.05, left = 0.1, right = 0.95, top = 0.95, wspace = 0.24, hspace = 0.24)
-    plt.savefig(ui.bulk_dir_name + "/stacked_datasheet" + folderName + ".png")
\ No newline at end of file
+
+    mean_half_nyquist = np.interp(32.5, frequency, meanMtf)
+    max_half_nyquist = np.interp(32.5, frequency, maxMtf)
+
+    fig = Figure(figsize=(16, 9))
+    ax = fig.add_subplot()
+    mean_label = 'Mean Half-Nyquist = {:.3f}'.format(mean_half_nyquist)
+    if bands is not None:
+        lower, upper = bands.at(32.5)
+        ax.fill_between(bands.frequency, bands.lower, bands.upper, color = 'b', alpha = 0.2, label = '{:.0f}% Bootstrap Band of Mean'.format(bands.confidence))
+        mean_label += ' ({:.3f} - {:.3f})'.format(lower, upper)
+    ax.plot(frequency, meanMtf, '--b', label = 'Mean')
+    ax.plot(frequency, maxMtf, '--r', label = 'Peak Hold')
+    ax.plot(32.5, mean_half_nyquist, 'ob', label = mean_label)
+    ax.plot(32.5, max_half_nyquist, 'or', label = 'Max Half-Nyquist = {:.3f}'.format(max_half_nyquist))
+    ax.set_xlabel('Spatial Frequency [lp/mm]')
+    ax.set_ylabel('MTF')
+    ax.set_ylim(0, 1.05)
+    ax.set_xlim(0, 65)
+    ax.set_title(folderName + '_average')
+    ax.grid()
+    ax.legend()
+    _saveFigure(fig, directory + "/averaged_" + folderName + ".png")
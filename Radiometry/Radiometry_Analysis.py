@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 29 09:10:00 2026
+
+@author: mgoddard
+"""
+
+from dataclasses import dataclass
+from scipy.signal import savgol_filter
+from matplotlib.figure import Figure
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import numpy as np
+import csv
+import cv2
+import os
+
+IMAGE_HEIGHT = 1024
+IMAGE_WIDTH = 1280
+
+
+@dataclass(frozen=True)
+class RadiometryParameters:
+    '''
+    Frozen set of the 'radiometry' parameters, following the radiometry tab widgets and the shipped 'settings.ini'.
+    '''
+
+    badPixelMask: str = ''
+    saveCsvFile: bool = True
+    savePlots: bool = True
+    displayPlots: bool = False
+    averagingMean: bool = True
+    averagingMedian: bool = True
+    averagingMode: bool = True
+    ignoreBadPixels: bool = True
+    signalBins: int = 4096
+    signalMin: int = 0
+    signalMax: int = 16382
+    noiseBins: int = 2048
+    noiseMin: float = 0.05
+    noiseMax: int = 64
+    imagesToProcess: int = 512
+
+    @classmethod
+    def fromUi(cls, ui):
+        '''
+        Function to take a snapshot of the current radiometry parameters from the main window widgets.
+        '''
+
+        return cls(badPixelMask = ui.pixelMaskFilePath_2.text(),
+                   saveCsvFile = ui.radiometrySaveCSVFileCheckBox.isChecked(),
+                   savePlots = ui.radiometrySavePlotsCheckBox.isChecked(),
+                   displayPlots = ui.radiometryDisplayPlotsCheckBox.isChecked(),
+                   averagingMean = ui.averagingMeanCheckBox.isChecked(),
+                   averagingMedian = ui.averagingMedianCheckBox.isChecked(),
+                   averagingMode = ui.averagingModeCheckBox.isChecked(),
+                   ignoreBadPixels = ui.ignoreBadPixelsCheckBox.isChecked(),
+                   signalBins = ui.signalBinsSpinBox.value(),
+                   signalMin = ui.signalMinSpinBox.value(),
+                   signalMax = ui.signalMaxSpinBox.value(),
+                   noiseBins = ui.noiseBinsSpinBox.value(),
+                   noiseMin = ui.noiseMinSpinBox.value(),
+                   noiseMax = ui.noiseMaxSpinBox.value(),
+                   imagesToProcess = ui.imagesToProcessSpinBox.value())
+
+    @classmethod
+    def fromSettings(cls, settings=None):
+        '''
+        Function to build the radiometry parameters from the 'radiometry' section of the settings file, and the bad pixel
+        map from the 'image_processing' section.
+
+        Parameters
+        ----------
+        settings: Settings = None
+            Optional Settings object, if not given the 'settings.ini' file in the application root directory is read.
+        '''
+
+        if settings is None:
+            from Tools.Settings import Settings
+            settings = Settings()
+
+        return cls(badPixelMask = settings.get('image_processing', 'bad_pixel_mask_path', fallback = ''),
+                   saveCsvFile = settings.getboolean('radiometry', 'save_csv_file'),
+                   savePlots = settings.getboolean('radiometry', 'save_plots'),
+                   displayPlots = settings.getboolean('radiometry', 'display_plots'),
+                   averagingMean = settings.getboolean('radiometry', 'averaging_mean'),
+                   averagingMedian = settings.getboolean('radiometry', 'averaging_median'),
+                   averagingMode = settings.getboolean('radiometry', 'averaging_mode'),
+                   ignoreBadPixels = settings.getboolean('radiometry', 'ignore_px_bad'),
+                   signalBins = settings.getint('radiometry', 'signal_bins'),
+                   signalMin = settings.getint('radiometry', 'signal_bins_min'),
+                   signalMax = settings.getint('radiometry', 'signal_bins_max'),
+                   noiseBins = settings.getint('radiometry', 'noise_bins'),
+                   noiseMin = settings.getfloat('radiometry', 'noise_bins_min'),
+                   noiseMax = settings.getint('radiometry', 'noise_bins_max'),
+                   imagesToProcess = settings.getint('radiometry', 'images_to_process'))
+
+
+def radiometryFolders(inputDir, imagesToProcess):
+    '''
+    Function to list the '<temperature>K/<integration time>ms' folders of a radiometry dataset, and the images to process
+    in each of them.
+
+    Returns
+    ----------
+    List of tuples (folderNameK, folderNameMs, files), where files holds the paths of at most 'imagesToProcess' '.tif' images.
+    '''
+
+    folders = []
+    for folderNameK in os.listdir(inputDir):
+        if os.path.isdir(os.path.join(inputDir, folderNameK)) and folderNameK.endswith('K'):
+            for folderNameMs in os.listdir(os.path.join(inputDir, folderNameK)):
+                image_dir = os.path.join(inputDir, folderNameK, folderNameMs)
+                if os.path.isdir(image_dir) and folderNameMs.endswith('ms'):
+                    files = [os.path.join(image_dir, image) for image in os.listdir(image_dir)
+                             if os.path.isfile(os.path.join(image_dir, image)) and image.endswith('.tif')]
+                    folders.append((folderNameK, folderNameMs, files[:imagesToProcess]))
+    return folders
+
+
+def readBadPixels(fname):
+    '''
+    Function to read a bad pixel map, a CSV file of one-based (column, row) pixel positions.
+
+    Returns
+    ----------
+    Tuple of Numpy Arrays (rows, columns) of the zero-based bad pixel positions.
+    '''
+
+    rows, columns = [], []
+    with open(fname, 'r', encoding='utf-8-sig') as csv_file:
+        for row in csv.reader(csv_file, delimiter=','):
+            rows.append(int(row[1]) - 1)
+            columns.append(int(row[0]) - 1)
+    return np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)
+
+
+def loadImageStack(files, badPixels=None, progress=None, cancelled=None):
+    '''
+    Function to load a stack of images, cropped to the active area, with the bad pixels (if given) set to NaN.
+
+    Parameters
+    ----------
+    files: List
+        Paths of the images.
+    badPixels: Tuple = None
+        Optional (rows, columns) of the bad pixels, from readBadPixels.
+    progress: Callable = None
+        Optional function called with the number of images loaded so far, after each image.
+    cancelled: Callable = None
+        Optional function returning True if loading should stop.
+
+    Returns
+    ----------
+    Numpy Array (images x rows x columns) of the image data, or None if cancelled.
+    '''
+
+    imageArr = np.zeros((len(files), IMAGE_HEIGHT, IMAGE_WIDTH))
+    for i, fname in enumerate(files):
+        if cancelled is not None and cancelled():
+            return None
+        imageArr[i] = cv2.imread(fname, cv2.IMREAD_ANYDEPTH)[0:IMAGE_HEIGHT, 0:IMAGE_WIDTH]
+        if badPixels is not None:
+            imageArr[i][badPixels] = float('nan')
+        if progress is not None:
+            progress(i + 1)
+    return imageArr
+
+
+def _statistics(data, bins, histRange, window, params, histogram):
+    stats = {'min': np.nanmin(data), 'max': np.nanmax(data)}
+
+    # If Mode is required, or generating and/or saving plots, then prepare histogram of data for processing
+    if histogram:
+        stats['counts'], stats['bins'] = np.histogram(data, bins, histRange)
+        stats['newBins'] = (stats['bins'][:-1] + stats['bins'][1:]) / 2
+    if params.averagingMean:
+        stats['mean'] = np.nanmean(data)
+    if params.averagingMedian:
+        stats['median'] = np.nanmedian(data)
+    # Apply filter to the histogram, and take highest point as Mode
+    if params.averagingMode:
+        stats['newCount'] = savgol_filter(stats['counts'], window, 2)
+        stats['mode'] = stats['newBins'][np.argmax(stats['newCount'])]
+    return stats
+
+
+def signalStatistics(imageArr, params):
+    '''
+    Function to calculate the signal statistics across all images and pixels of a stack.
+
+    Returns
+    ----------
+    Dictionary of 'min' and 'max', and 'mean', 'median' and 'mode' as selected in the parameters, with the histogram
+    ('counts', 'bins', 'newBins' and the filtered 'newCount') if the mode or plots are required.
+    '''
+
+    histogram = params.averagingMode or params.displayPlots or params.savePlots
+    return _statistics(imageArr, params.signalBins, (params.signalMin, params.signalMax), 75, params, histogram)
+
+
+def noiseStatistics(imageArr, params):
+    '''
+    Function to calculate the statistics of the temporal noise (the standard deviation of each pixel through all images)
+    of a stack, as for signalStatistics.
+    '''
+
+    histogram = params.averagingMode or params.displayPlots or params.savePlots
+    std_dev_of_each_pixelArr = np.nanstd(imageArr, axis = 0)
+    return _statistics(std_dev_of_each_pixelArr, params.noiseBins, (params.noiseMin, params.noiseMax), 17, params, histogram)
+
+
+def _histogramFigure(stats, params, xMax, title, yscale, decimals, minMax):
+    # Figures are only made with pyplot if they are to be displayed, otherwise they are independent of any GUI backend
+    fig = plt.figure(figsize=(16, 9)) if params.displayPlots else Figure(figsize=(16, 9))
+    ax = fig.add_subplot()
+    ax.stairs(stats['counts'], stats['bins'], fill = True)
+    if params.averagingMode:
+        ax.plot(stats['newBins'], stats['newCount'], 'r-')
+    ax.set_xlim(0, xMax)
+    ax.set_yscale(yscale)
+    ax.set_xlabel('ADC Signal [ADU]')
+    ax.set_ylabel('PDF')
+    if yscale == 'log':
+        ax.set_ylim(bottom=1)
+    ax.set_title(title)
+    ax.set_xticks(np.linspace(0, xMax, num=9, endpoint=True))
+    if params.averagingMedian:
+        ax.plot([] ,[] ,' ', label=('Median: {:.' + str(decimals) + 'f}').format(stats['median']))
+    if params.averagingMean:
+        ax.plot([] ,[] ,' ', label='Mean: {:.2f}'.format(stats['mean']))
+    if params.averagingMode:
+        ax.plot([], [], ' ', label=('Mode: {:.' + str(decimals) + 'f}').format(stats['mode']))
+    if minMax:
+        ax.plot([] ,[] ,' ', label='Min: {:.0f}'.format(stats['min']))
+        ax.plot([] ,[] ,' ', label='Max: {:.0f}'.format(stats['max']))
+    ax.legend()
+    ax.grid()
+    return fig
+
+
+def saveStatisticsPlots(inputDir, folderNameK, folderNameMs, signal, noise, imageCount, params):
+    '''
+    Function to plot (and, if 'savePlots' is set, save) the log and linear histograms of the signal and the temporal noise
+    of one folder, as 'PixelValues_<scale>_raw<K>_<ms>.png' and 'TemporalNoise_<scale>_raw<K>_<ms>.png' in 'inputDir'.
+    '''
+
+    name = os.path.basename(inputDir) + '/' + folderNameK + '/' + folderNameMs
+    plots = [(signal, np.power(2,14), str(imageCount) + ' Images Pixel Values - ' + name, 'PixelValues', 0, True),
+             (noise, params.noiseMax, 'Temporal Standard Deviation - ' + name, 'TemporalNoise', 2, False)]
+
+    for stats, xMax, title, prefix, decimals, minMax in plots:
+        for scale, yscale in (('Log10', 'log'), ('Linear', 'linear')):
+            fig = _histogramFigure(stats, params, xMax, title + ' - ' + scale, yscale, decimals, minMax)
+            if params.savePlots:
+                fig.savefig(inputDir + '/' + prefix + '_' + scale + '_raw' + folderNameK + '_' + folderNameMs + '.png')
+
+
+def analyseFolder(params, inputDir, folderNameK, folderNameMs, files, progress=None, cancelled=None, message=None):
+    '''
+    Function to calculate the signal and temporal noise statistics of one temperature / integration time folder, and
+    plot them if required.
+
+    Parameters
+    ----------
+    params: RadiometryParameters
+        Radiometry parameters.
+    inputDir, folderNameK, folderNameMs: String
+        Dataset directory, and the temperature and integration time folder names.
+    files: List
+        Paths of the images to process.
+    progress, cancelled: Callable = None
+        Optional progress and cancellation functions, as for loadImageStack.
+    message: Callable = None
+        Optional function called with a description of each step.
+
+    Returns
+    ----------
+    Dictionary of the CSV row of the folder, or None if cancelled.
+    '''
+
+    # Check if Bad Pixels (according to the Bad Pixel Map) should be ignored
+    badPixels = readBadPixels(params.badPixelMask) if params.ignoreBadPixels else None
+    imageArr = loadImageStack(files, badPixels, progress, cancelled)
+    if imageArr is None:
+        return None
+
+    if message is not None:
+        message('Calculating Signal Statistics...')
+    signal = signalStatistics(imageArr, params)
+
+    if message is not None:
+        message('Calculating Noise Statistics...')
+    noise = noiseStatistics(imageArr, params)
+    if cancelled is not None and cancelled():
+        return None
+
+    if params.savePlots or params.displayPlots:
+        if message is not None:
+            message('Generating Plots...')
+        saveStatisticsPlots(inputDir, folderNameK, folderNameMs, signal, noise, len(files), params)
+
+    row = {"integration_time[ms]": int(folderNameMs[:-2]),
+           "bb_temperature[K]": int(folderNameK[:3])}
+    if params.averagingMean:
+        row["signal_mean[ADU]"] = signal['mean']
+    if params.averagingMedian:
+        row["signal_median[ADU]"] = int(signal['median'])
+    if params.averagingMode:
+        row["signal_mode[ADU]"] = int(signal['mode'])
+    if params.averagingMean:
+        row["noise_mean[ADU]"] = noise['mean']
+    if params.averagingMedian:
+        row["noise_median[ADU]"] = noise['median']
+    if params.averagingMode:
+        row["noise_mode[ADU]"] = noise['mode']
+    return row
+
+
+def analyseFolderJob(params, inputDir, folderNameK, folderNameMs, files):
+    '''
+    Job function to run analyseFolder in a worker process (see MTF_Batch.runJobs).
+    '''
+
+    return analyseFolder(params, inputDir, folderNameK, folderNameMs, files)
+
+
+def writeResults(inputDir, rows, timestamp):
+    '''
+    Function to write the CSV rows of all folders to 'data_<timestamp>.csv' in 'inputDir'.
+
+    Returns
+    ----------
+    Path of the CSV file.
+    '''
+
+    fname = inputDir + '/data_' + timestamp + '.csv'
+    pd.DataFrame(rows).to_csv(fname, sep=',', index=False, encoding='utf-8')
+    return fname
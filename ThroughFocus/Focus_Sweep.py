@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 09:40:00 2026
+
+@author: mgoddard
+"""
+
+from matplotlib.figure import Figure
+from datetime import datetime
+
+import numpy as np
+import csv
+import os
+
+import MTF.MTF_Engine as MTF_Engine
+import MTF.MTF_Batch as MTF_Batch
+
+FIELD_NAMES = ['top', 'top0.5', 'bottom', 'bottom0.5', 'centre', 'left', 'left0.5', 'right', 'right0.5']
+ORIENTATIONS = ['sagittal', 'tangential']
+FOCUS_POSITIONS = ['+300', '+270', '+240', '+210', '+180', '+150', '+120', '+090', '+060', '+030', '-000', '-030', '-060', '-090', '-120']
+CSV_HEADER = ['FIELD', 'ORIENTATION', 'FOCUS', '10-90 WIDTH', '20-80 WIDTH', 'XPOS', 'YPOS']
+FIELD_LABELS = {'top': 'Top', 'top0.5': 'Top 0.5', 'bottom': 'Bottom', 'bottom0.5': 'Bottom 0.5', 'centre': 'Centre',
+                'left': 'Left', 'left0.5': 'Left 0.5', 'right': 'Right', 'right0.5': 'Right 0.5'}
+ORIENTATION_LABELS = {'sagittal': 'Saggital', 'tangential': 'Tangential', 'horizontal': 'Horizontal', 'vertical': 'Vertical'}
+
+# Best focus summaries: (title, position column, sagittal points, tangential points), where the centre edge that is sagittal
+# along the up-down line of fields is the vertical one, and along the left-right line the horizontal one
+FOCUS_SUMMARIES = [('Up Down Focus Performance', 'YPOS',
+                    [('top', 'sagittal'), ('top0.5', 'sagittal'), ('centre', 'vertical'), ('bottom0.5', 'sagittal'), ('bottom', 'sagittal')],
+                    [('top', 'tangential'), ('top0.5', 'tangential'), ('centre', 'horizontal'), ('bottom0.5', 'tangential'), ('bottom', 'tangential')]),
+                   ('Left Right Focus Performance', 'XPOS',
+                    [('left', 'sagittal'), ('left0.5', 'sagittal'), ('centre', 'horizontal'), ('right0.5', 'sagittal'), ('right', 'sagittal')],
+                    [('left', 'tangential'), ('left0.5', 'tangential'), ('centre', 'vertical'), ('right0.5', 'tangential'), ('right', 'tangential')])]
+
+# Line styles of the series returned by throughFocusSeries and focusSummarySeries
+THROUGH_FOCUS_STYLES = ['b*', '--r', 'ko']
+FOCUS_SUMMARY_STYLES = [{'linestyle': '', 'marker': '.', 'color': 'blue'}, {'linestyle': '', 'marker': '.', 'color': 'orange'},
+                        {'linestyle': 'dotted', 'marker': '', 'color': 'blue'}, {'linestyle': 'dotted', 'marker': '', 'color': 'orange'},
+                        {'linestyle': 'solid', 'marker': '', 'color': 'blue'}, {'linestyle': 'solid', 'marker': '', 'color': 'orange'}]
+
+
+def orientationName(field, orientation):
+    '''
+    Function to return the orientation name used in the folder names and the CSV, where the centre field uses 'horizontal' and 'vertical'.
+    '''
+
+    if field == 'centre' and orientation == 'sagittal':
+        return 'horizontal'
+    if field == 'centre' and orientation == 'tangential':
+        return 'vertical'
+    return orientation
+
+
+def focusImage(directory, focus, imageNumber=2):
+    '''
+    Function to return the path of the image to analyse at a focus position, which is the 'imageNumber'-th file (in directory
+    listing order) starting with the focus name. Returns None if there is no such image.
+    '''
+
+    if not os.path.isdir(directory):
+        return None
+    image = 0
+    for i in os.listdir(directory):
+        if os.path.isfile(os.path.join(directory, i)) and i.startswith(focus):
+            image += 1
+            if image >= imageNumber:
+                return os.path.join(directory, i)
+    return None
+
+
+def sweepJobs(inputDir, fields=FIELD_NAMES, orientations=ORIENTATIONS, focusPositions=FOCUS_POSITIONS):
+    '''
+    Function to list every (field, orientation, focus) point of a through-focus sweep, in the order the CSV rows are written.
+
+    Parameters
+    ----------
+    inputDir: String
+        Directory containing the '<field>_field_focussing_<orientation>edge' folders.
+
+    Returns
+    ----------
+    List of tuples (field, orientation, focus, fname, aoiCentre), where fname is None if no image was found.
+    '''
+
+    jobs = []
+    for field in fields:
+        for orientation in orientations:
+            orientation = orientationName(field, orientation)
+            directory = inputDir + '/' + field + '_field_focussing_' + orientation + 'edge'
+            for focus in focusPositions:
+                jobs.append((field, orientation, focus, focusImage(directory, focus), MTF_Engine.FIELD_POSITIONS[field]))
+    return jobs
+
+
+def edgeWidthJob(params, fname, aoiCentre):
+    '''
+    Job function to analyse one through-focus image in a worker process, returning only what the CSV needs.
+
+    Returns
+    ----------
+    Tuple of (width10_90, width20_80, x, y), where (x, y) is the final AOI centre.
+    '''
+
+    if fname is None:
+        raise IOError('No image found for this sweep point')
+    result = MTF_Engine.MTFEngine(params).analyseFile(fname, aoiCentre)
+    return result.width10_90, result.width20_80, result.aoiCentre[0], result.aoiCentre[1]
+
+
+def runSweep(jobs, params, workers=0, progress=None, cancelled=None, onRow=None, cache=None):
+    '''
+    Function to analyse every point of a through-focus sweep on a pool of worker processes (see MTF_Batch.runJobs).
+
+    Parameters
+    ----------
+    jobs: List
+        Sweep points from sweepJobs.
+    params: AnalysisParameters
+        Analysis parameters.
+    workers: int = 0
+        Number of worker processes, 0 means one per CPU core.
+    progress, cancelled: Callable = None
+        Optional progress and cancellation functions, as for MTF_Batch.runJobs.
+    onRow: Callable = None
+        Optional function called with each CSV row, in sweep order, as soon as it and all rows before it are complete.
+        If the sweep is cancelled the rows already passed to it are a complete prefix of the sweep.
+    cache: ResultCache = None
+        Optional result cache, consulted before analysing each image.
+
+    Returns
+    ----------
+    List of CSV rows [field, orientation, focus, width10_90, width20_80, x, y] in sweep order, with empty values where the
+    image was missing or failed to analyse, or None if the sweep was cancelled.
+    '''
+
+    rows = []
+
+    def addRow(index, result):
+        field, orientation, focus, fname, aoiCentre = jobs[index]
+        if isinstance(result, Exception):
+            row = [field, orientation, focus, '', '', '', '']
+        else:
+            row = [field, orientation, focus] + list(result)
+        rows.append(row)
+        if onRow is not None:
+            onRow(row)
+
+    batch = [(MTF_Engine.fieldParams(params, orientation), fname, aoiCentre) for field, orientation, focus, fname, aoiCentre in jobs]
+    results = MTF_Batch.runJobs(edgeWidthJob, batch, workers, progress, cancelled, onResult = addRow, cache = cache)
+    if results is None:
+        return None
+    return rows
+
+
+def generateSweepCsv(inputDir, params, workers=0, progress=None, cancelled=None, cache=None, jobs=None):
+    '''
+    Function to analyse a through-focus sweep (see runSweep) into a new 'datalog_<timestamp>.csv' file in 'inputDir', with
+    each row written as soon as it is complete.
+
+    Parameters
+    ----------
+    inputDir: String
+        Directory containing the '<field>_field_focussing_<orientation>edge' folders.
+    params, workers, progress, cancelled, cache:
+        As for runSweep.
+    jobs: List = None
+        Optional sweep points from sweepJobs, listed from 'inputDir' if None.
+
+    Returns
+    ----------
+    Tuple of (fname, rows), where rows is None if the sweep was cancelled.
+    '''
+
+    fname = inputDir + '/datalog_' + datetime.now().strftime("%Y%m%d%H%M%S") + '.csv'
+    with open(fname, 'a', encoding='UTF8', newline='') as log:
+        logWriter = csv.writer(log)
+        logWriter.writerow(CSV_HEADER)
+        if jobs is None:
+            jobs = sweepJobs(inputDir)
+        rows = runSweep(jobs, params, workers, progress, cancelled, onRow = logWriter.writerow, cache = cache)
+    return fname, rows
+
+
+def throughFocusTitle(field, orientation):
+    '''
+    Function to return the plot title of one field and orientation of a sweep, e.g. 'Top 0.5 Saggital Through Focus'.
+    '''
+
+    return FIELD_LABELS[field] + ' ' + ORIENTATION_LABELS[orientation] + ' Through Focus'
+
+
+def bestFocus(coeffs):
+    '''
+    Function to return the focus position at the turning point of a parabolic through-focus fit.
+    '''
+
+    return float(np.roots(np.polyder(coeffs))[0])
+
+
+def fitSweep(dataFrame):
+    '''
+    Function to fit a parabola to the 20-80% edge width against focus position of every field and orientation of a sweep.
+
+    Parameters
+    ----------
+    dataFrame: pandas DataFrame
+        Sweep CSV (see CSV_HEADER), e.g. as read with pandas.read_csv.
+
+    Returns
+    ----------
+    Dictionary of {(field, orientation): (points, coeffs)} in sweep order, where points is the DataFrame of the CSV rows of
+    that field and orientation, and coeffs the parabola's coefficients (see numpy.polyfit).
+    '''
+
+    fits = {}
+    for field in FIELD_NAMES:
+        for orientation in ORIENTATIONS:
+            orientation = orientationName(field, orientation)
+            points = dataFrame.loc[(dataFrame["FIELD"] == field) & (dataFrame["ORIENTATION"] == orientation), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
+            fits[(field, orientation)] = (points, np.polyfit(points.loc[:,"FOCUS"].values, points.loc[:,"20-80 WIDTH"], deg=2))
+    return fits
+
+
+def focusSummaries(fits):
+    '''
+    Function to collect the best focus of each field across the detector (see FOCUS_SUMMARIES), from the fits of fitSweep.
+
+    Returns
+    ----------
+    List of (title, sagPositions, sagFocus, tanPositions, tanFocus), where the positions are the mean AOI centres [px].
+    '''
+
+    summaries = []
+    for title, column, sagittal, tangential in FOCUS_SUMMARIES:
+        summary = [title]
+        for points in (sagittal, tangential):
+            summary.append([float(np.mean(fits[point][0].loc[:,column].values)) for point in points])
+            summary.append([bestFocus(fits[point][1]) for point in points])
+        summaries.append(tuple(summary))
+    return summaries
+
+
+def throughFocusSeries(positions, data, coeffs):
+    '''
+    Function to return the data series drawn by drawThroughFocus, as (x, y, label) in drawing order, so that a plot
+    already on screen can be updated in place.
+    '''
+
+    root = np.roots(np.polyder(coeffs))[0]
+    root_y = np.polyval(coeffs, root)
+
+    return [(positions, data, 'Raw Data'),
+            (positions, np.polyval(coeffs, positions), 'Parabolic Fit'),
+            ([root], [root_y], 'Best Focus: {:.1f}'.format(root))]
+
+
+def drawThroughFocus(ax, title, positions, data, coeffs):
+    '''
+    Function to draw the edge widths and parabolic fit of one field and orientation of a sweep on a matplotlib Axes.
+    '''
+
+    ax.set_title(title, fontsize = 10)
+    ax.set_xlabel('Focus Shift [um]', fontsize = 10, labelpad = 5)
+    ax.set_ylabel('20%%-80%% Edge Width [px]', fontsize = 10, labelpad = 5)
+    ax.tick_params(axis='x', labelsize=8)
+    ax.tick_params(axis='y', labelsize=8)
+    ax.grid()
+    for (x, y, label), style in zip(throughFocusSeries(positions, data, coeffs), THROUGH_FOCUS_STYLES):
+        ax.plot(x, y, style, label = label)
+    ax.legend()
+
+
+def focusSummarySeries(sag_positions, sag_values, tan_positions, tan_values):
+    '''
+    Function to return the data series drawn by drawFocusSummary, as (x, y, label) in drawing order: the best focus
+    positions, then their linear and their parabolic fits, each sagittal then tangential.
+    '''
+
+    sag_coeffs_1 = np.polyfit(sag_positions, sag_values, deg=1)
+    sag_coeffs_2 = np.polyfit(sag_positions, sag_values, deg=2)
+    tan_coeffs_1 = np.polyfit(tan_positions, tan_values, deg=1)
+    tan_coeffs_2 = np.polyfit(tan_positions, tan_values, deg=2)
+
+    return [(sag_positions, sag_values, 'Sag'),
+            (tan_positions, tan_values, 'Tan'),
+            (sag_positions, np.polyval(sag_coeffs_1, sag_positions), 'Sag'),
+            (tan_positions, np.polyval(tan_coeffs_1, tan_positions), 'Tan'),
+            (sag_positions, np.polyval(sag_coeffs_2, sag_positions), 'Sag'),
+            (tan_positions, np.polyval(tan_coeffs_2, tan_positions), 'Tan')]
+
+
+def drawFocusSummary(ax, title, sag_positions, sag_values, tan_positions, tan_values):
+    '''
+    Function to draw the best focus positions across the detector, with linear and parabolic fits, on a matplotlib Axes.
+    '''
+
+    ax.set_title(title, fontsize = 10)
+    ax.set_xlabel('Detector Element Position [px]', fontsize = 10, labelpad = 5)
+    ax.set_ylabel('Focus Position [um]', fontsize = 10, labelpad = 5)
+    ax.tick_params(axis='x', labelsize=8)
+    ax.tick_params(axis='y', labelsize=8)
+    ax.grid()
+    series = focusSummarySeries(sag_positions, sag_values, tan_positions, tan_values)
+    for (x, y, label), style in zip(series, FOCUS_SUMMARY_STYLES):
+        ax.plot(x, y, label = label, **style)
+
+    ax.legend()
+
+
+def writeFitResults(fname, fits, summaries):
+    '''
+    Function to save the fits of a sweep CSV 'fname' next to it, as the plots shown on the Through Focus tab:
+    '<name>_fits.png' (every field and orientation), '<name>_summary.png' (best focus across the detector), and the best
+    focus of every field and orientation as '<name>_best_focus.csv'.
+
+    Parameters
+    ----------
+    fname: String
+        Path of the sweep CSV.
+    fits, summaries:
+        Results of fitSweep and focusSummaries.
+    '''
+
+    base = os.path.splitext(fname)[0]
+
+    rows = len(FIELD_NAMES)
+    fig = Figure(figsize = (12, 4.5 * rows))
+    for i, ((field, orientation), (points, coeffs)) in enumerate(fits.items()):
+        drawThroughFocus(fig.add_subplot(rows, len(ORIENTATIONS), i + 1), throughFocusTitle(field, orientation),
+                         points.loc[:,"FOCUS"].values, points.loc[:,"20-80 WIDTH"], coeffs)
+    fig.tight_layout()
+    fig.savefig(base + '_fits.png')
+
+    fig = Figure(figsize = (12, 4.5 * len(summaries)))
+    for i, summary in enumerate(summaries):
+        drawFocusSummary(fig.add_subplot(len(summaries), 1, i + 1), *summary)
+    fig.tight_layout()
+    fig.savefig(base + '_summary.png')
+
+    with open(base + '_best_focus.csv', 'w', encoding='UTF8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['FIELD', 'ORIENTATION', 'BEST FOCUS', 'XPOS', 'YPOS'])
+        for (field, orientation), (points, coeffs) in fits.items():
+            writer.writerow([field, orientation, bestFocus(coeffs), float(np.mean(points.loc[:,"XPOS"].values)), float(np.mean(points.loc[:,"YPOS"].values))])
@@ -7,9 +7,7 @@ Created on Mon Dec 09 10:33:00 2024
 
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QProgressDialog
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import Qt, QPoint
-from datetime import datetime
-from csv import writer
+from PyQt5.QtCore import Qt
 import numpy as np
 import os
 # import matplotlib.pyplot as plt
@@ -18,7 +16,15 @@ import pandas as pd
 # import MISC.Misc_Functions as misc
 import MISC.dialog_boxes as dialog
 
+import MTF.MTF_Engine as MTF_Engine
 import MTF.MTF_Functions as MTF_Functions
+from MISC.Stage_Timer import TIMER
+import ThroughFocus.Focus_Sweep as Focus_Sweep
+
+# Prefix of the Through Focus tab's plot widgets of each field, where the centre's horizontal edge is on the sagittal
+# plot and its vertical edge on the tangential plot
+PLOT_WIDGETS = {'top': 'top', 'top0.5': 'top05', 'bottom': 'bot', 'bottom0.5': 'bot05', 'centre': 'centre',
+                'left': 'left', 'left0.5': 'left05', 'right': 'right', 'right0.5': 'right05'}
 
 def SelectInputDirectory(ui):
     dialog = QMessageBox()
@@ -55,98 +61,30 @@ def SelectInputDirectory(ui):
 def GenerateEdgeCSV(ui):    
     if ui.TFinputdir_name != '':
     
-        field_positions = ['top', 'top0.5', 'bottom', 'bottom0.5', 'centre', 'left', 'left0.5', 'right', 'right0.5']
-        orientations = ['sagittal', 'tangential']
-        focus_positions = ['+300', '+270', '+240', '+210', '+180', '+150', '+120', '+090', '+060', '+030', '-000', '-030', '-060', '-090', '-120']
-
-        numfiles = 0
-        for i in field_positions:
-            for j in orientations:
-                for k in focus_positions:
-                    numfiles += 1
+        jobs = Focus_Sweep.sweepJobs(ui.TFinputdir_name)
                     
-        progress = QProgressDialog("Processing files...", "Cancel", 0, numfiles)
+        progress = QProgressDialog("Processing files...", "Cancel", 0, len(jobs))
         progress.setWindowTitle('Please Wait')
         progress.setWindowIcon(QIcon('_icons/MainWindow.png'))
         progress.setWindowModality(Qt.WindowModal)
 
-        now = datetime.now()
-        timestamp = now.strftime("%Y%m%d%H%M%S")
-
-        with open(ui.TFinputdir_name + '/datalog_' + timestamp + '.csv', 'a', encoding='UTF8', newline='') as log:
-
-            ui.logWriter = writer(log)
-
-            header = ['FIELD', 'ORIENTATION', 'FOCUS',
-                        '10-90 WIDTH', '20-80 WIDTH', 'XPOS', 'YPOS']
-
-            ui.logWriter.writerow(header)
-            
-            filecounter = 0
-
-            for ui.field in field_positions:
-                if ui.field == 'top':
-                    aoiPoint = QPoint(640, 50)
-                elif ui.field == 'top0.5':
-                    aoiPoint = QPoint(640, 281)
-                elif ui.field == 'bottom0.5':
-                    aoiPoint = QPoint(640, 743)
-                elif ui.field == 'bottom':
-                    aoiPoint = QPoint(640, 974)
-                elif ui.field == 'centre':
-                    aoiPoint = QPoint(640, 512)
-                elif ui.field == 'left':
-                    aoiPoint = QPoint(50, 512)
-                elif ui.field == 'left0.5':
-                    aoiPoint = QPoint(345, 512)
-                elif ui.field == 'right0.5':
-                    aoiPoint = QPoint(935, 512)
-                elif ui.field == 'right':
-                    aoiPoint = QPoint(1230, 512)
-
-                for ui.orientation in orientations:
-                    if ui.field == 'centre' and ui.orientation == 'sagittal':
-                        ui.orientation = 'horizontal'
-                    elif ui.field == 'centre' and ui.orientation == 'tangential':
-                        ui.orientation = 'vertical'
-
-                    ui.current_dir = ui.TFinputdir_name + '/' + ui.field + '_field_focussing_' + ui.orientation + 'edge'
+        params = MTF_Engine.AnalysisParameters.fromUi(ui)
+        TIMER.reset()
+        with TIMER.stage('batch'):
+            fname, rows = Focus_Sweep.generateSweepCsv(ui.TFinputdir_name, params, ui.batchWorkers,
+                                                       progress = lambda done, total: progress.setValue(done),
+                                                       cancelled = progress.wasCanceled, cache = ui.resultCache, jobs = jobs)
 
-                    for ui.focus in focus_positions:
-                        filecounter += 1
+        MTF_Functions.writeTiming(ui, ui.TFinputdir_name, os.path.splitext(os.path.basename(fname))[0] + '_timing')
 
-                        ui.logRow = [ui.field,
-                                        ui.orientation, ui.focus]
-                        
-                        image = 0
-                        number_of_image_to_process = 2
-                        for i in os.listdir(ui.current_dir):
-                            if os.path.isfile(os.path.join(ui.current_dir, i)) and i.startswith(ui.focus):
-                                image += 1
-                                if image < number_of_image_to_process:
-                                    pass
-                                else:
-                                    # print(os.path.join(ui.current_dir, i))
-                                    MTF_Functions.loadImage(ui, os.path.join(ui.current_dir, i))
-                                    MTF_Functions.setAoi(ui, aoiPoint, execute=True)
-                                    MTF_Functions.findEdge(ui)
-                                    MTF_Functions.analyse(ui, execute=True)
-                                    break
-                        ui.logRow.append(ui.aoiX.value())
-                        ui.logRow.append(ui.aoiY.value())
-                        ui.logWriter.writerow(ui.logRow)
-                        
-                        progress.setValue(filecounter)
-                        
-                        if progress.wasCanceled():
-                            break
-                    if progress.wasCanceled():
-                        break
-                if progress.wasCanceled():
-                    dialog.messageWarning(ui, 'Warning!', 'Generating CSV file was cancelled - please load or generate a complete CSV before proceding.')
-            if not progress.wasCanceled():
-                dialog.messageInformation(ui, 'Complete', 'Generating CSV file is complete.')
-                ui.TFinputDirPath_2.setText(ui.TFinputdir_name + '/datalog_' + timestamp + '.csv')
+        if rows is None:
+            dialog.messageWarning(ui, 'Warning!', 'Generating CSV file was cancelled - please load or generate a complete CSV before proceding.')
+        else:
+            missing = [' '.join(row[:3]) for row in rows if row[3] == '']
+            if missing != []:
+                dialog.messageWarning(ui, 'Warning!', 'No result for:\n\n' + '\n'.join(missing))
+            dialog.messageInformation(ui, 'Complete', 'Generating CSV file is complete.')
+            ui.TFinputDirPath_2.setText(fname)
 
 def ProcessEdgeCSV(ui):
     dialog = QMessageBox()
@@ -163,120 +101,15 @@ def ProcessEdgeCSV(ui):
 
     if fname[0] != '':
         data_frame = pd.read_csv(fname[0])
-        
-        top_sag = data_frame.loc[(data_frame["FIELD"] == 'top') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        top_tan = data_frame.loc[(data_frame["FIELD"] == 'top') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        top05_sag = data_frame.loc[(data_frame["FIELD"] == 'top0.5') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        top05_tan = data_frame.loc[(data_frame["FIELD"] == 'top0.5') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        bot_sag = data_frame.loc[(data_frame["FIELD"] == 'bottom') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        bot_tan = data_frame.loc[(data_frame["FIELD"] == 'bottom') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        bot05_sag = data_frame.loc[(data_frame["FIELD"] == 'bottom0.5') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        bot05_tan = data_frame.loc[(data_frame["FIELD"] == 'bottom0.5') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        centre_hor = data_frame.loc[(data_frame["FIELD"] == 'centre') & (data_frame["ORIENTATION"] == 'horizontal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        centre_ver = data_frame.loc[(data_frame["FIELD"] == 'centre') & (data_frame["ORIENTATION"] == 'vertical'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        left_sag = data_frame.loc[(data_frame["FIELD"] == 'left') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        left_tan = data_frame.loc[(data_frame["FIELD"] == 'left') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        left05_sag = data_frame.loc[(data_frame["FIELD"] == 'left0.5') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        left05_tan = data_frame.loc[(data_frame["FIELD"] == 'left0.5') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        right_sag = data_frame.loc[(data_frame["FIELD"] == 'right') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        right_tan = data_frame.loc[(data_frame["FIELD"] == 'right') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        right05_sag = data_frame.loc[(data_frame["FIELD"] == 'right0.5') & (data_frame["ORIENTATION"] == 'sagittal'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        right05_tan = data_frame.loc[(data_frame["FIELD"] == 'right0.5') & (data_frame["ORIENTATION"] == 'tangential'), ["FOCUS", "10-90 WIDTH", "20-80 WIDTH", "XPOS", "YPOS"]]
-        
-        top_sag_coeffs = np.polyfit(top_sag.loc[:,"FOCUS"].values, top_sag.loc[:,"20-80 WIDTH"], deg=2)
-        top_tan_coeffs = np.polyfit(top_tan.loc[:,"FOCUS"].values, top_tan.loc[:,"20-80 WIDTH"], deg=2)
-        top05_sag_coeffs = np.polyfit(top05_sag.loc[:,"FOCUS"].values, top05_sag.loc[:,"20-80 WIDTH"], deg=2)
-        top05_tan_coeffs = np.polyfit(top05_tan.loc[:,"FOCUS"].values, top05_tan.loc[:,"20-80 WIDTH"], deg=2)
-        bot_sag_coeffs = np.polyfit(bot_sag.loc[:,"FOCUS"].values, bot_sag.loc[:,"20-80 WIDTH"], deg=2)
-        bot_tan_coeffs = np.polyfit(bot_tan.loc[:,"FOCUS"].values, bot_tan.loc[:,"20-80 WIDTH"], deg=2)
-        bot05_sag_coeffs = np.polyfit(bot05_sag.loc[:,"FOCUS"].values, bot05_sag.loc[:,"20-80 WIDTH"], deg=2)
-        bot05_tan_coeffs = np.polyfit(bot05_tan.loc[:,"FOCUS"].values, bot05_tan.loc[:,"20-80 WIDTH"], deg=2)
-        centre_hor_coeffs = np.polyfit(centre_hor.loc[:,"FOCUS"].values, centre_hor.loc[:,"20-80 WIDTH"], deg=2)
-        centre_ver_coeffs = np.polyfit(centre_ver.loc[:,"FOCUS"].values, centre_ver.loc[:,"20-80 WIDTH"], deg=2)
-        left_sag_coeffs = np.polyfit(left_sag.loc[:,"FOCUS"].values, left_sag.loc[:,"20-80 WIDTH"], deg=2)
-        left_tan_coeffs = np.polyfit(left_tan.loc[:,"FOCUS"].values, left_tan.loc[:,"20-80 WIDTH"], deg=2)
-        left05_sag_coeffs = np.polyfit(left05_sag.loc[:,"FOCUS"].values, left05_sag.loc[:,"20-80 WIDTH"], deg=2)
-        left05_tan_coeffs = np.polyfit(left05_tan.loc[:,"FOCUS"].values, left05_tan.loc[:,"20-80 WIDTH"], deg=2)
-        right_sag_coeffs = np.polyfit(right_sag.loc[:,"FOCUS"].values, right_sag.loc[:,"20-80 WIDTH"], deg=2)
-        right_tan_coeffs = np.polyfit(right_tan.loc[:,"FOCUS"].values, right_tan.loc[:,"20-80 WIDTH"], deg=2)
-        right05_sag_coeffs = np.polyfit(right05_sag.loc[:,"FOCUS"].values, right05_sag.loc[:,"20-80 WIDTH"], deg=2)
-        right05_tan_coeffs = np.polyfit(right05_tan.loc[:,"FOCUS"].values, right05_tan.loc[:,"20-80 WIDTH"], deg=2)
-
-        ui.topDataPlot_sag.plot_through_focus('Top Saggital Through Focus', top_sag.loc[:,"FOCUS"].values, top_sag.loc[:,"20-80 WIDTH"], top_sag_coeffs)
-        ui.top05DataPlot_sag.plot_through_focus('Top 0.5 Saggital Through Focus', top05_sag.loc[:,"FOCUS"].values, top05_sag.loc[:,"20-80 WIDTH"], top05_sag_coeffs)
-        ui.botDataPlot_sag.plot_through_focus('Bottom Saggital Through Focus', bot_sag.loc[:,"FOCUS"].values, bot_sag.loc[:,"20-80 WIDTH"], bot_sag_coeffs)
-        ui.bot05DataPlot_sag.plot_through_focus('Bottom 0.5 Saggital Through Focus', bot05_sag.loc[:,"FOCUS"].values, bot05_sag.loc[:,"20-80 WIDTH"], bot05_sag_coeffs)
-        ui.leftDataPlot_sag.plot_through_focus('Left Saggital Through Focus', left_sag.loc[:,"FOCUS"].values, left_sag.loc[:,"20-80 WIDTH"], left_sag_coeffs)
-        ui.left05DataPlot_sag.plot_through_focus('Left 0.5 Saggital Through Focus', left05_sag.loc[:,"FOCUS"].values, left05_sag.loc[:,"20-80 WIDTH"], left05_sag_coeffs)
-        ui.rightDataPlot_sag.plot_through_focus('Right Saggital Through Focus', right_sag.loc[:,"FOCUS"].values, right_sag.loc[:,"20-80 WIDTH"], right_sag_coeffs)
-        ui.right05DataPlot_sag.plot_through_focus('Right 0.5 Saggital Through Focus', right05_sag.loc[:,"FOCUS"].values, right05_sag.loc[:,"20-80 WIDTH"], right05_sag_coeffs)
-        ui.centreDataPlot_sag.plot_through_focus('Centre Horizontal Through Focus', centre_hor.loc[:,"FOCUS"].values, centre_hor.loc[:,"20-80 WIDTH"], centre_hor_coeffs)
-
-        ui.topDataPlot_tan.plot_through_focus('Top Tangential Through Focus', top_tan.loc[:,"FOCUS"].values, top_tan.loc[:,"20-80 WIDTH"], top_tan_coeffs)
-        ui.top05DataPlot_tan.plot_through_focus('Top 0.5 Tangential Through Focus', top05_tan.loc[:,"FOCUS"].values, top05_tan.loc[:,"20-80 WIDTH"], top05_tan_coeffs)
-        ui.botDataPlot_tan.plot_through_focus('Bottom Tangential Through Focus', bot_tan.loc[:,"FOCUS"].values, bot_tan.loc[:,"20-80 WIDTH"], bot_tan_coeffs)
-        ui.bot05DataPlot_tan.plot_through_focus('Bottom 0.5 Tangential Through Focus', bot05_tan.loc[:,"FOCUS"].values, bot05_tan.loc[:,"20-80 WIDTH"], bot05_tan_coeffs)
-        ui.leftDataPlot_tan.plot_through_focus('Left Tangential Through Focus', left_tan.loc[:,"FOCUS"].values, left_tan.loc[:,"20-80 WIDTH"], left_tan_coeffs)
-        ui.left05DataPlot_tan.plot_through_focus('Left 0.5 Tangential Through Focus', left05_tan.loc[:,"FOCUS"].values, left05_tan.loc[:,"20-80 WIDTH"], left05_tan_coeffs)
-        ui.rightDataPlot_tan.plot_through_focus('Right Tangential Through Focus', right_tan.loc[:,"FOCUS"].values, right_tan.loc[:,"20-80 WIDTH"], right_tan_coeffs)
-        ui.right05DataPlot_tan.plot_through_focus('Right 0.5 Tangential Through Focus', right05_tan.loc[:,"FOCUS"].values, right05_tan.loc[:,"20-80 WIDTH"], right05_tan_coeffs)
-        ui.centreDataPlot_tan.plot_through_focus('Centre Vertical Through Focus', centre_ver.loc[:,"FOCUS"].values, centre_ver.loc[:,"20-80 WIDTH"], centre_ver_coeffs)
-
-        UpDownXsag = []
-        UpDownFocussag = []
-        LeftRightXsag = []
-        LeftRightFocussag = []
-        UpDownXtan = []
-        UpDownFocustan = []
-        LeftRightXtan = []
-        LeftRightFocustan = []
-
-        UpDownFocussag.append(float(np.roots(np.polyder(top_sag_coeffs))[0]))
-        UpDownXsag.append(float(np.mean(top_sag.loc[:,"YPOS"].values)))
-        UpDownFocussag.append(float(np.roots(np.polyder(top05_sag_coeffs))[0]))
-        UpDownXsag.append(float(np.mean(top05_sag.loc[:,"YPOS"].values)))
-        UpDownFocussag.append(float(np.roots(np.polyder(centre_ver_coeffs))[0]))
-        UpDownXsag.append(float(np.mean(centre_ver.loc[:,"YPOS"].values)))
-        UpDownFocussag.append(float(np.roots(np.polyder(bot05_sag_coeffs))[0]))
-        UpDownXsag.append(float(np.mean(bot05_sag.loc[:,"YPOS"].values)))
-        UpDownFocussag.append(float(np.roots(np.polyder(bot_sag_coeffs))[0]))
-        UpDownXsag.append(float(np.mean(bot_sag.loc[:,"YPOS"].values)))
-
-        UpDownFocustan.append(float(np.roots(np.polyder(top_tan_coeffs))[0]))
-        UpDownXtan.append(float(np.mean(top_tan.loc[:,"YPOS"].values)))
-        UpDownFocustan.append(float(np.roots(np.polyder(top05_tan_coeffs))[0]))
-        UpDownXtan.append(float(np.mean(top05_tan.loc[:,"YPOS"].values)))
-        UpDownFocustan.append(float(np.roots(np.polyder(centre_hor_coeffs))[0]))
-        UpDownXtan.append(float(np.mean(centre_hor.loc[:,"YPOS"].values)))
-        UpDownFocustan.append(float(np.roots(np.polyder(bot05_tan_coeffs))[0]))
-        UpDownXtan.append(float(np.mean(bot05_tan.loc[:,"YPOS"].values)))
-        UpDownFocustan.append(float(np.roots(np.polyder(bot_tan_coeffs))[0]))
-        UpDownXtan.append(float(np.mean(bot_tan.loc[:,"YPOS"].values)))
-
-        LeftRightFocussag.append(float(np.roots(np.polyder(left_sag_coeffs))[0]))
-        LeftRightXsag.append(float(np.mean(left_sag.loc[:,"XPOS"].values)))
-        LeftRightFocussag.append(float(np.roots(np.polyder(left05_sag_coeffs))[0]))
-        LeftRightXsag.append(float(np.mean(left05_sag.loc[:,"XPOS"].values)))
-        LeftRightFocussag.append(float(np.roots(np.polyder(centre_hor_coeffs))[0]))
-        LeftRightXsag.append(float(np.mean(centre_hor.loc[:,"XPOS"].values)))
-        LeftRightFocussag.append(float(np.roots(np.polyder(right05_sag_coeffs))[0]))
-        LeftRightXsag.append(float(np.mean(right05_sag.loc[:,"XPOS"].values)))
-        LeftRightFocussag.append(float(np.roots(np.polyder(right_sag_coeffs))[0]))
-        LeftRightXsag.append(float(np.mean(right_sag.loc[:,"XPOS"].values)))
 
-        LeftRightFocustan.append(float(np.roots(np.polyder(left_tan_coeffs))[0]))
-        LeftRightXtan.append(float(np.mean(left_tan.loc[:,"XPOS"].values)))
-        LeftRightFocustan.append(float(np.roots(np.polyder(left05_tan_coeffs))[0]))
-        LeftRightXtan.append(float(np.mean(left05_tan.loc[:,"XPOS"].values)))
-        LeftRightFocustan.append(float(np.roots(np.polyder(centre_ver_coeffs))[0]))
-        LeftRightXtan.append(float(np.mean(centre_ver.loc[:,"XPOS"].values)))
-        LeftRightFocustan.append(float(np.roots(np.polyder(right05_tan_coeffs))[0]))
-        LeftRightXtan.append(float(np.mean(right05_tan.loc[:,"XPOS"].values)))
-        LeftRightFocustan.append(float(np.roots(np.polyder(right_tan_coeffs))[0]))
-        LeftRightXtan.append(float(np.mean(right_tan.loc[:,"XPOS"].values)))
+        fits = Focus_Sweep.fitSweep(data_frame)
+        for (field, orientation), (points, coeffs) in fits.items():
+            plot = getattr(ui, PLOT_WIDGETS[field] + ('DataPlot_sag' if orientation in ('sagittal', 'horizontal') else 'DataPlot_tan'))
+            plot.plot_through_focus(Focus_Sweep.throughFocusTitle(field, orientation), points.loc[:,"FOCUS"].values, points.loc[:,"20-80 WIDTH"], coeffs)
 
-        ui.upDownDataPlot.plot_tf_summary('Up Down Focus Performance', UpDownXsag, UpDownFocussag, UpDownXtan, UpDownFocustan)
-        ui.leftRightDataPlot.plot_tf_summary('Left Right Focus Performance', LeftRightXsag, LeftRightFocussag, LeftRightXtan, LeftRightFocustan)
+        upDown, leftRight = Focus_Sweep.focusSummaries(fits)
+        ui.upDownDataPlot.plot_tf_summary(*upDown)
+        ui.leftRightDataPlot.plot_tf_summary(*leftRight)
 
         # print(UpDownFocussag)
         # print(UpDownXsag)
@@ -10,9 +10,10 @@ class Settings():
     Subclass of ConfigParser, with an added feature of adding a section only if does not exist
 
     '''
-    def __init__(self):
+    def __init__(self, fname='settings.ini'):
+        self.fname = fname
         self.settings = ConfigParser()
-        self.settings.read('settings.ini')
+        self.settings.read(fname)
 
     def add_section(self, section):
         self.settings.add_section(section)
@@ -30,21 +31,21 @@ class Settings():
     def set(self, section, option, value):
         self.settings.set(section, option, value)
 
-    def get(self, section, option):
-        return self.settings.get(section, option)
+    def get(self, section, option, **kwargs):
+        return self.settings.get(section, option, **kwargs)
 
-    def getint(self, section, option):
-        return self.settings.getint(section, option)
+    def getint(self, section, option, **kwargs):
+        return self.settings.getint(section, option, **kwargs)
     
-    def getfloat(self, section, option):
-        return self.settings.getfloat(section, option)
+    def getfloat(self, section, option, **kwargs):
+        return self.settings.getfloat(section, option, **kwargs)
 
-    def getboolean(self, section, option):
-        return self.settings.getboolean(section, option)
+    def getboolean(self, section, option, **kwargs):
+        return self.settings.getboolean(section, option, **kwargs)
 
     def save(self):
         try:
-            with open('settings.ini', 'w') as settingsfile:
+            with open(self.fname, 'w') as settingsfile:
                 self.settings.write(settingsfile)
         except:
             pass
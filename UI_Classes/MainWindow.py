@@ -22,7 +22,11 @@ import Tools.prettify_process as prettify_process
 
 import Help.Help_Process as Help
 import MISC.dialog_boxes as dialog
+import MISC.Stage_Timer as Stage_Timer
 import MTF.MTF_Functions as MTF_Functions
+import MTF.MTF_Engine as MTF_Engine
+import MTF.MTF_Cache as MTF_Cache
+import MTF.MTF_Pipeline as MTF_Pipeline
 
 class Ui(QMainWindow):
 
@@ -42,6 +46,28 @@ class Ui(QMainWindow):
         self.setWindowTitle(str(title + ' - ' + version))
         self.setWindowIcon(QIcon('_icons/MainWindow.png'))
 
+        self.badPixelRasterOrder = False
+        self.badPixelSignedDifference = False
+        self.edgeMethod = 'logistic'
+        self.edgeOrientation = 'rows'
+        self.batchWorkers = 0
+        self.stackFoldBins = False
+        self.discoverEdges = False
+        self.discoveryRadius = 150
+        self.esfMethod = 'smoothed'
+        self.bootstrapReplicas = 500
+        self.bootstrapConfidence = 95.0
+        self.mtfBands = None
+        self.stageTiming = 'off'
+        self.stackReportPdf = False
+        self.batchRendering = 'throttled'
+        self.batchRenderInterval = 2.0
+        self.cacheEnabled = True
+        self.cacheDirectory = '_cache'
+        self.cacheMaxSizeMb = 512
+        self.cacheHashContent = False
+        self.resultCache = None
+        self.pipeline = MTF_Pipeline.MTFPipeline()
         self.settingsLoad()
         self.makeConnections()
 
@@ -104,6 +130,14 @@ class Ui(QMainWindow):
         self.MtfFrequency.currentIndexChanged.connect(lambda: MTF_Functions.MTFCurve(self))
         self.lengthOfEdgeLine.valueChanged.connect(lambda: MTF_Functions.updateAoiImage(self))
         self.normalDistanceFromEdge.valueChanged.connect(lambda: MTF_Functions.updateAoiImage(self))
+        self.pixelSize.valueChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.removeNoise.stateChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.sigmaScalingSpinBox.valueChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.smoothingAlpha.valueChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.oversamplingMultiplier.valueChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.tailSmoothing.stateChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.tailStartdT.valueChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
+        self.tailSmoothSpinBox.valueChanged.connect(lambda: MTF_Functions.updateAnalysis(self))
 
         # Actions
         self.actionSave_Settings.triggered.connect(self.settingsSave)                       # Save Settings
@@ -111,6 +145,8 @@ class Ui(QMainWindow):
 
         self.actionCalibrate_Images_Apply.triggered.connect(Calibration_Process.Calibrate_Apply)
         self.actionCalibrate_Images_Create.triggered.connect(Calibration_Process.Calibrate_Create)
+        self.actionCompare_ESF_Methods.triggered.connect(lambda: MTF_Functions.compareEsfMethods(self))
+        self.actionClear_Result_Cache.triggered.connect(lambda: MTF_Functions.clearResultCache(self))
         self.actionGetting_Started_Window.triggered.connect(Help.GettingStarted)
 
 
@@ -127,7 +163,17 @@ class Ui(QMainWindow):
             self.aoiSize.setValue(settings.getint('image_setup', 'aoi_size'))
             self.removeDeadPixels.setChecked(settings.getboolean('image_setup', 'bad_pixel_remove'))
             self.badPixelFactorSpinBox.setValue(settings.getfloat('image_setup', 'bad_pixel_factor'))
+            self.badPixelRasterOrder = settings.getboolean('image_setup', 'bad_pixel_raster_order', fallback = False)
+            self.badPixelSignedDifference = settings.getboolean('image_setup', 'bad_pixel_signed_difference', fallback = False)
             self.dynamicAoi.setChecked(settings.getboolean('image_setup', 'dynamic_aoi'))
+            self.edgeMethod = settings.get('image_setup', 'edge_method', fallback = 'logistic')
+            if self.edgeMethod not in MTF_Engine.EDGE_METHODS:
+                dialog.messageWarning(self, 'Warning!', 'Unknown edge method \'' + self.edgeMethod + '\' in the settings, the \'logistic\' method is used.')
+                self.edgeMethod = 'logistic'
+            self.edgeOrientation = settings.get('image_setup', 'edge_orientation', fallback = 'rows')
+            if self.edgeOrientation not in MTF_Engine.EDGE_ORIENTATIONS:
+                dialog.messageWarning(self, 'Warning!', 'Unknown edge orientation \'' + self.edgeOrientation + '\' in the settings, the edges are scanned along the \'rows\'.')
+                self.edgeOrientation = 'rows'
             self.pixelSize.setValue(settings.getfloat('image_setup', 'pixel_size'))
         except:
             dialog.messageCritical(self, 'Error', 'Failed to load \'image_setup\' settings!')
@@ -142,9 +188,34 @@ class Ui(QMainWindow):
             self.tailSmoothing.setChecked(settings.getboolean('analysis', 'tail_smoothing'))
             self.tailStartdT.setValue(settings.getfloat('analysis', 'tail_scale'))
             self.tailSmoothSpinBox.setValue(settings.getfloat('analysis', 'tail_smoothing_width'))
+            self.batchWorkers = settings.getint('analysis', 'batch_workers', fallback = 0)
+            self.stackFoldBins = settings.getboolean('analysis', 'stack_fold_bins', fallback = False)
+            self.discoverEdges = settings.getboolean('analysis', 'discover_edges', fallback = False)
+            self.discoveryRadius = settings.getint('analysis', 'discovery_radius', fallback = 150)
+            self.esfMethod = settings.get('analysis', 'esf_method', fallback = 'smoothed')
+            if self.esfMethod not in MTF_Engine.ESF_METHODS:
+                dialog.messageWarning(self, 'Warning!', 'Unknown ESF method \'' + self.esfMethod + '\' in the settings, the \'smoothed\' method is used.')
+                self.esfMethod = 'smoothed'
+            self.bootstrapReplicas = settings.getint('analysis', 'bootstrap_replicas', fallback = 500)
+            self.bootstrapConfidence = settings.getfloat('analysis', 'bootstrap_confidence', fallback = 95.0)
+            self.stageTiming = settings.get('analysis', 'stage_timing', fallback = 'off')
+            Stage_Timer.TIMER.setMode(self.stageTiming)
+            self.stackReportPdf = settings.getboolean('analysis', 'stack_report_pdf', fallback = False)
+            self.batchRendering = settings.get('analysis', 'batch_rendering', fallback = 'throttled')
+            self.batchRenderInterval = settings.getfloat('analysis', 'batch_render_interval', fallback = 2.0)
         except:
             dialog.messageCritical(self, 'Error', 'Failed to load \'analysis\' settings!')
 
+        try:
+            self.cacheEnabled = settings.getboolean('cache', 'enabled', fallback = True)
+            self.cacheDirectory = settings.get('cache', 'directory', fallback = '_cache')
+            self.cacheMaxSizeMb = settings.getint('cache', 'max_size_mb', fallback = 512)
+            self.cacheHashContent = settings.getboolean('cache', 'hash_content', fallback = False)
+            if self.cacheEnabled:
+                self.resultCache = MTF_Cache.ResultCache(self.cacheDirectory, self.cacheMaxSizeMb * 1024 * 1024, self.cacheHashContent)
+        except:
+            dialog.messageCritical(self, 'Error', 'Failed to load \'cache\' settings!')
+
         try:
             self.radiometryInputDirPath.setText(settings.get('radiometry', 'radiometry_input_dir'))
             self.radiometrySaveCSVFileCheckBox.setChecked(settings.getboolean('radiometry', 'save_csv_file'))
@@ -243,7 +314,11 @@ class Ui(QMainWindow):
         settings.set('image_setup', 'aoi_size', str(self.aoiSize.value()))
         settings.set('image_setup', 'bad_pixel_remove', str(self.removeDeadPixels.isChecked()))
         settings.set('image_setup', 'bad_pixel_factor', str(self.badPixelFactorSpinBox.value()))
+        settings.set('image_setup', 'bad_pixel_raster_order', str(self.badPixelRasterOrder))
+        settings.set('image_setup', 'bad_pixel_signed_difference', str(self.badPixelSignedDifference))
         settings.set('image_setup', 'dynamic_aoi', str(self.dynamicAoi.isChecked()))
+        settings.set('image_setup', 'edge_method', self.edgeMethod)
+        settings.set('image_setup', 'edge_orientation', self.edgeOrientation)
         settings.set('image_setup', 'pixel_size', str(self.pixelSize.value()))
 
         settings.add_section_safely('analysis')
@@ -257,6 +332,23 @@ class Ui(QMainWindow):
         settings.set('analysis', 'tail_scale', str(self.tailStartdT.value()))
         settings.set('analysis', 'tail_smoothing_width', str(self.tailSmoothSpinBox.value()))
         settings.set('analysis', 'nyquist', str(self.MtfFrequency.currentText()))
+        settings.set('analysis', 'batch_workers', str(self.batchWorkers))
+        settings.set('analysis', 'stack_fold_bins', str(self.stackFoldBins))
+        settings.set('analysis', 'discover_edges', str(self.discoverEdges))
+        settings.set('analysis', 'discovery_radius', str(self.discoveryRadius))
+        settings.set('analysis', 'esf_method', str(self.esfMethod))
+        settings.set('analysis', 'bootstrap_replicas', str(self.bootstrapReplicas))
+        settings.set('analysis', 'bootstrap_confidence', str(self.bootstrapConfidence))
+        settings.set('analysis', 'stage_timing', str(self.stageTiming))
+        settings.set('analysis', 'stack_report_pdf', str(self.stackReportPdf))
+        settings.set('analysis', 'batch_rendering', str(self.batchRendering))
+        settings.set('analysis', 'batch_render_interval', str(self.batchRenderInterval))
+
+        settings.add_section_safely('cache')
+        settings.set('cache', 'enabled', str(self.cacheEnabled))
+        settings.set('cache', 'directory', str(self.cacheDirectory))
+        settings.set('cache', 'max_size_mb', str(self.cacheMaxSizeMb))
+        settings.set('cache', 'hash_content', str(self.cacheHashContent))
 
         settings.add_section_safely('radiometry')
         settings.set('radiometry', 'radiometry_input_dir', str(self.radiometryInputDirPath.text()))
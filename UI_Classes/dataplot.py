@@ -16,9 +16,30 @@ import matplotlib.patches as mpatches
 
 import numpy as np
 
+import ThroughFocus.Focus_Sweep as Focus_Sweep
+
 # import random
 
+def dataLimits(series):
+    '''
+    Function to return the limits (xmin, xmax, ymin, ymax) of the data series [(x, y, label)] of a plot, or None if
+    they are empty.
+    '''
+
+    x = np.concatenate([np.ravel(np.asarray(x, dtype = float)) for x, y, label in series])
+    y = np.concatenate([np.ravel(np.asarray(y, dtype = float)) for x, y, label in series])
+    if not np.isfinite(x).any() or not np.isfinite(y).any():
+        return None
+    return (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
+
+
 class DataPlot(QWidget):
+    '''
+    Plot widget of the main window. The axes, lines and legend of a plot are kept between calls showing the same kind
+    of plot, and only the lines are updated: when the axes limits do not change, the new data is blitted over a cached
+    background of the rest of the figure instead of redrawing it all.
+    '''
+
     def __init__(self, *args, **kwargs):
         super(DataPlot, self).__init__(*args, **kwargs)
         self.figure = plt.figure()
@@ -32,11 +53,123 @@ class DataPlot(QWidget):
         layout.setContentsMargins(0,0,1,1)
         self.setLayout(layout)
 
-    def plot_test(self):
+        self.plotKey = None
+        self.lines = []
+        self.spines = []
+        self.legend = None
+        self.limits = None
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.cacheBackground)
+
+    def newAxes(self, key):
+        '''
+        Function to clear the figure and return the axes of a new plot, 'key' identifying the kind of plot (title, series
+        shown, fixed limits) which can later be updated in place by updateSeries.
+        '''
+
         self.figure.clear()
         self.figure.tight_layout()
-        
-        ax = self.figure.add_subplot()
+
+        self.plotKey = key
+        self.lines = []
+        self.spines = []
+        self.legend = None
+        self.limits = None
+        self.background = None
+
+        return self.figure.add_subplot()
+
+    def trackSeries(self, ax, series):
+        '''
+        Function to keep the lines, spines and legend of a plot just drawn on 'ax' from the data series [(x, y, label)],
+        so that they are left out of the full draws of the figure and drawn over its cached background instead.
+        '''
+
+        self.lines = ax.lines[:len(series)]
+        # The spines are drawn over the lines in a full draw of the axes, so they are drawn with them
+        self.spines = list(ax.spines.values())
+        self.legend = ax.get_legend()
+        self.limits = dataLimits(series)
+        for artist in self.artists():
+            artist.set_animated(True)
+
+    def artists(self):
+        '''
+        Function to return the artists of the plot drawn over the cached background, in the order they are drawn.
+        '''
+
+        return self.lines + self.spines + ([self.legend] if self.legend is not None else [])
+
+    def cacheBackground(self, event):
+        '''
+        Slot function connected to the canvas draw event, to cache the figure without the lines, spines and legend of the
+        plot and then draw them over it.
+        '''
+
+        self.background = (self.figure.bbox.bounds, self.canvas.copy_from_bbox(self.figure.bbox))
+        self.drawArtists()
+
+    def drawArtists(self):
+        '''
+        Function to draw the lines, spines and legend of the plot over the figure on the canvas.
+        '''
+
+        for artist in self.artists():
+            artist.axes.draw_artist(artist)
+
+    def updateSeries(self, key, series, draw):
+        '''
+        Function to update the plot on the canvas in place with new data series [(x, y, label)], if it is the same kind
+        of plot as 'key'.
+
+        Parameters
+        ----------
+        key:
+            Kind of plot, as passed to newAxes.
+        series: List
+            Data series of the plot, in the order of its lines.
+        draw: Function
+            Function to redraw the whole canvas, when the axes have to be rescaled.
+
+        Returns
+        ----------
+        updated: Bool
+            False if the plot has to be drawn anew.
+        '''
+
+        if key != self.plotKey or len(series) != len(self.lines):
+            return False
+
+        labels = []
+        for line, (x, y, label) in zip(self.lines, series):
+            line.set_data(x, y)
+            if label is not None:
+                line.set_label(label)
+                labels.append(label)
+        if self.legend is not None:
+            for text, label in zip(self.legend.get_texts(), labels):
+                text.set_text(label)
+
+        # Rescale only if the data limits have changed, and the axes are not fixed
+        ax = self.lines[0].axes
+        limits = dataLimits(series)
+        if (ax.get_autoscalex_on() or ax.get_autoscaley_on()) and limits != self.limits:
+            self.limits = limits
+            ax.relim()
+            ax.autoscale_view()
+            draw()
+        elif self.background is None or self.background[0] != self.figure.bbox.bounds:
+            # Nothing drawn yet at the current size of the canvas
+            draw()
+        else:
+            self.canvas.restore_region(self.background[1])
+            self.drawArtists()
+            self.canvas.blit(self.figure.bbox)
+
+        return True
+
+    def plot_test(self):
+        ax = self.newAxes(None)
 
         ax.set_title('test', fontsize = 10)
         ax.set_xlabel('Pixels', fontsize = 10, labelpad = 5)
@@ -51,117 +184,98 @@ class DataPlot(QWidget):
         self.setMinimumHeight(550)
 
     def plot_through_focus(self, title, positions, data, coeffs):
+        key = ('Through Focus', title)
+        series = Focus_Sweep.throughFocusSeries(positions, data, coeffs)
 
-        root = np.roots(np.polyder(coeffs))[0]
-        root_y = np.polyval(coeffs, root)
-                 
-        self.figure.clear()
-        self.figure.tight_layout()
-        
-        ax = self.figure.add_subplot()
-
-        ax.set_title(title, fontsize = 10)
-        ax.set_xlabel('Focus Shift [um]', fontsize = 10, labelpad = 5)
-        ax.set_ylabel('20%%-80%% Edge Width [px]', fontsize = 10, labelpad = 5)
-        ax.tick_params(axis='x', labelsize=8)
-        ax.tick_params(axis='y', labelsize=8)
-        ax.grid()
-        ax.plot(positions, data, 'b*', label = 'Raw Data')
-        ax.plot(positions, np.polyval(coeffs, positions), '--r', label = 'Parabolic Fit')
-        ax.plot(root, root_y, 'ko', label = 'Best Focus: {:.1f}'.format(root))
-        ax.legend()
+        if not self.updateSeries(key, series, self.canvas.draw_idle):
+            ax = self.newAxes(key)
+            Focus_Sweep.drawThroughFocus(ax, title, positions, data, coeffs)
+            self.trackSeries(ax, series)
+            self.canvas.draw_idle()
             
         self.setMinimumHeight(450)
 
     def plot_tf_summary(self, title, sag_positions, sag_values, tan_positions, tan_values):
-        self.figure.clear()
-        self.figure.tight_layout()
-
-        sag_coeffs_1 = np.polyfit(sag_positions, sag_values, deg=1)
-        sag_coeffs_2 = np.polyfit(sag_positions, sag_values, deg=2)
-        tan_coeffs_1 = np.polyfit(tan_positions, tan_values, deg=1)
-        tan_coeffs_2 = np.polyfit(tan_positions, tan_values, deg=2)
-        
-        ax = self.figure.add_subplot()
+        key = ('Focus Summary', title)
+        series = Focus_Sweep.focusSummarySeries(sag_positions, sag_values, tan_positions, tan_values)
 
-        ax.set_title(title, fontsize = 10)
-        ax.set_xlabel('Detector Element Position [px]', fontsize = 10, labelpad = 5)
-        ax.set_ylabel('Focus Position [um]', fontsize = 10, labelpad = 5)
-        ax.tick_params(axis='x', labelsize=8)
-        ax.tick_params(axis='y', labelsize=8)
-        ax.grid()
-        ax.plot(sag_positions, sag_values, linestyle = '', marker = '.', color = 'blue', label = 'Sag')
-        ax.plot(tan_positions, tan_values, linestyle = '', marker = '.', color = 'orange', label = 'Tan')
-
-        ax.plot(sag_positions, np.polyval(sag_coeffs_1, sag_positions), linestyle = 'dotted', marker = '', color = 'blue', label = 'Sag')
-        ax.plot(tan_positions, np.polyval(tan_coeffs_1, tan_positions), linestyle = 'dotted', marker = '', color = 'orange', label = 'Tan')
-
-        ax.plot(sag_positions, np.polyval(sag_coeffs_2, sag_positions), linestyle = 'solid', marker = '', color = 'blue', label = 'Sag')
-        ax.plot(tan_positions, np.polyval(tan_coeffs_2, tan_positions), linestyle = 'solid', marker = '', color = 'orange', label = 'Tan')
-
-        ax.legend()
+        if not self.updateSeries(key, series, self.canvas.draw_idle):
+            ax = self.newAxes(key)
+            Focus_Sweep.drawFocusSummary(ax, title, sag_positions, sag_values, tan_positions, tan_values)
+            self.trackSeries(ax, series)
+            self.canvas.draw_idle()
             
         self.setMinimumHeight(450)
     
     def plotf(self, title, data, position, filtered_data = None, filtered_position = None, nyquist_range = None, detector_mtf = None, optical_mtf = None, tail_start = None, removed_data = None, removed_position = None):
-        self.figure.clear()
-        self.figure.tight_layout()
-        
-        ax = self.figure.add_subplot()
-        
         if title == 'ESF':
-            ax.set_title(title, fontsize = 14)
-            ax.set_xlabel('Pixels', fontsize = 10, labelpad = 5)
-            ax.set_ylabel('Pixel Values', fontsize = 10, labelpad = 5)
-            ax.tick_params(axis='x', labelsize=8)
-            ax.tick_params(axis='y', labelsize=8)
-            # self.figure.tight_layout()
-            ax.grid(True)
-            ax.plot(position, data, 'b*', label = 'Raw Data')
+            key = (title, removed_data is not None, filtered_position is not None)
+            series = [(position, data, 'Raw Data')]
             if removed_data is not None:
-                ax.plot(removed_position, removed_data, 'r*', label = 'Removed Noise')
-            
+                series.append((removed_position, removed_data, 'Removed Noise'))
             if filtered_position is not None:
-                ax.plot(filtered_position, filtered_data, 'r-', label = 'Best Fit')            
-                
-            ax.legend()
-            
+                series.append((filtered_position, filtered_data, 'Best Fit'))
+
         if title == 'LSF':
-            ax.set_title(title, fontsize = 14)
-            ax.set_xlabel('Pixels', fontsize = 10, labelpad = 5)
-            ax.set_ylabel('Derivative of Pixel Value', fontsize = 10, labelpad = 5)
-            ax.tick_params(axis='x', labelsize=8)
-            ax.tick_params(axis='y', labelsize=8)
-            # self.figure.tight_layout()
-            ax.grid(True)
+            key = (title,)
             if abs(min(data)) > abs(max(data)):
-                ax.plot(position, -data, 'b*')
-                ax.plot(position, -data, 'r-')
-            else:
-                ax.plot(position, data, 'b*')
-                ax.plot(position, data, 'r-')
-        
-        
+                data = -data
+            series = [(position, data, None), (position, data, None)]
+
         if title == 'MTF':
+            key = (title, nyquist_range)
             halfNyquist = np.interp(32.5, position, data)
-            ax.set_title(title, fontsize = 20)
-            ax.set_xlabel('Spatial Frequency [lp/mm]', fontsize = 16, labelpad = 10)
-            ax.set_xlim(0, nyquist_range)
-            ax.set_ylabel('MTF', fontsize = 16, labelpad = 10)
-            ax.set_ylim(0, 1.05)
-            ax.tick_params(axis='x', labelsize=14)
-            ax.tick_params(axis='y', labelsize=14)
-            ax.grid(True)
-            ax.plot(position, data, '-r', label = 'System MTF')       
-            ax.plot(32.5, halfNyquist, 'ob', label = 'MTF @ Half-Nyquist = {:.3f}'.format(halfNyquist))
-            # ax.plot(position, detector_mtf, '--m')
-            halfNyquist = np.interp(32.5, position, optical_mtf)
-            ax.plot(position, optical_mtf, '-b', label = 'Optical MTF')
-            ax.plot(32.5, halfNyquist, 'og', label = 'Optical MTF @ Half-Nyquist = {:.3f}'.format(halfNyquist))
-            ax.legend()
-        
-        self.canvas.draw()
+            opticalHalfNyquist = np.interp(32.5, position, optical_mtf)
+            series = [(position, data, 'System MTF'),
+                      ([32.5], [halfNyquist], 'MTF @ Half-Nyquist = {:.3f}'.format(halfNyquist)),
+                      (position, optical_mtf, 'Optical MTF'),
+                      ([32.5], [opticalHalfNyquist], 'Optical MTF @ Half-Nyquist = {:.3f}'.format(opticalHalfNyquist))]
+
+        if not self.updateSeries(key, series, self.canvas.draw):
+            ax = self.newAxes(key)
+
+            if title == 'ESF':
+                ax.set_title(title, fontsize = 14)
+                ax.set_xlabel('Pixels', fontsize = 10, labelpad = 5)
+                ax.set_ylabel('Pixel Values', fontsize = 10, labelpad = 5)
+                ax.tick_params(axis='x', labelsize=8)
+                ax.tick_params(axis='y', labelsize=8)
+                # self.figure.tight_layout()
+                ax.grid(True)
+                styles = ['b*'] + (['r*'] if removed_data is not None else []) + (['r-'] if filtered_position is not None else [])
+
+            if title == 'LSF':
+                ax.set_title(title, fontsize = 14)
+                ax.set_xlabel('Pixels', fontsize = 10, labelpad = 5)
+                ax.set_ylabel('Derivative of Pixel Value', fontsize = 10, labelpad = 5)
+                ax.tick_params(axis='x', labelsize=8)
+                ax.tick_params(axis='y', labelsize=8)
+                # self.figure.tight_layout()
+                ax.grid(True)
+                styles = ['b*', 'r-']
+
+            if title == 'MTF':
+                ax.set_title(title, fontsize = 20)
+                ax.set_xlabel('Spatial Frequency [lp/mm]', fontsize = 16, labelpad = 10)
+                ax.set_xlim(0, nyquist_range)
+                ax.set_ylabel('MTF', fontsize = 16, labelpad = 10)
+                ax.set_ylim(0, 1.05)
+                ax.tick_params(axis='x', labelsize=14)
+                ax.tick_params(axis='y', labelsize=14)
+                ax.grid(True)
+                styles = ['-r', 'ob', '-b', 'og']
+
+            for (x, y, label), style in zip(series, styles):
+                line, = ax.plot(x, y, style)
+                if label is not None:
+                    line.set_label(label)
+            if title != 'LSF':
+                ax.legend()
+
+            self.trackSeries(ax, series)
+            self.canvas.draw()
+
         if title == 'MTF':
             self.setMinimumHeight(800)
         else:
-            self.setMinimumHeight(550)
\ No newline at end of file
+            self.setMinimumHeight(550)